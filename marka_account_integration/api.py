@@ -1,96 +1,134 @@
 import frappe
 from frappe import _
-from frappe.utils import now, flt, cstr, nowdate, getdate
-from frappe.frappeclient import FrappeClient
-from erpnext.accounts.party import get_party_account
-from erpnext.accounts.utils import get_account_currency
-from erpnext.setup.utils import get_exchange_rate
-import erpnext
+from frappe.utils import cint, cstr, flt
+from werkzeug.wrappers import Response
+
+from marka_account_integration.balances import get_balance_sheet as get_balance_sheet_snapshot
+from marka_account_integration.balances import get_trial_balance as get_trial_balance_snapshot
+from marka_account_integration.documents import (
+    build_payment_entry,
+    build_purchase_invoice,
+    build_sales_invoice,
+    create_batch_journal_entry,
+    create_batch_sales_invoice,
+)
+from marka_account_integration.exports import export_report
+from marka_account_integration.idempotency import idempotent
+from marka_account_integration.imports import get_import_status, resume_import, start_import
+from marka_account_integration.jobs import get_status, supports_async
+from marka_account_integration.journals import (
+    build_journal_entry,
+    build_journal_rows,
+    create_journal_batch,
+    get_journal_batch_summary,
+    get_journal_masters,
+    resume_journal_batch,
+)
+from marka_account_integration.marka_account_integration.doctype.merka_account_settings.merka_account_settings import (
+    get_settings,
+)
+from marka_account_integration.masters import resolve_customers, resolve_items, resolve_suppliers
+from marka_account_integration.matching import DEFAULT_TOLERANCE, PaymentMatcher
+from marka_account_integration.metrics import export_metrics, instrumented
+from marka_account_integration.payments import (
+    INVOICE_DOCTYPES,
+    allocate_payment,
+    get_exchange_rate_stats,
+    get_outstanding_invoices,
+    get_party_account_details,
+)
+from marka_account_integration.profiling import get_profile_content
+from marka_account_integration.queries import get_document_data, get_documents_data, list_documents
+from marka_account_integration.reports import REPORT_MAPPING, run_report
+from marka_account_integration.session_broker import get_session_id
+from marka_account_integration.submissions import defer_submit as defer_submit_document
+from marka_account_integration.submissions import get_backlog, requeue_failed
+from marka_account_integration.updates import update_document
+
 
 @frappe.whitelist()
+@instrumented
+@idempotent
 def create_customer_if_not_exists(customer_name):
     """Create customer if it doesn't exist"""
-    if not frappe.db.exists("Customer", customer_name):
-        customer_doc = frappe.new_doc("Customer")
-        customer_doc.customer_name = customer_name
-        customer_doc.customer_type = "Individual"
-        customer_doc.insert()
-        return customer_doc.name
-    return customer_name
+    return resolve_customers([customer_name])[customer_name]
 
 
 def create_supplier_if_not_exists(supplier_name):
     """Create supplier if it doesn't exist"""
-    if not frappe.db.exists("Supplier", supplier_name):
-        supplier_doc = frappe.new_doc("Supplier")
-        supplier_doc.supplier_name = supplier_name
-        supplier_doc.supplier_type = "Individual"
-        supplier_doc.insert()
-        return supplier_doc.name
-    return supplier_name
+    return resolve_suppliers([supplier_name])[supplier_name]
 
 
 def create_item_if_not_exists(item_code, item_name=None, item_group="All Item Groups"):
     """Create item if it doesn't exist"""
-    if not frappe.db.exists("Item", item_code):
-        item_doc = frappe.new_doc("Item")
-        item_doc.item_code = item_code
-        item_doc.item_name = item_name or item_code
-        item_doc.item_group = item_group
-        item_doc.is_stock_item = 1
-        item_doc.is_sales_item = 1
-        item_doc.is_purchase_item = 1
-        item_doc.insert()
-        return item_doc.name
-    return item_code
+    return resolve_items([{"item_code": item_code, "item_name": item_name, "item_group": item_group}])[item_code]
+
+
+@frappe.whitelist()
+@instrumented
+def get_documents(doctype, names, fields=None, include_children=True):
+    """
+    Get many Sales Invoices, Purchase Invoices, Payment Entries or Journal Entries at once
+
+    Args:
+        doctype (str): "Sales Invoice", "Purchase Invoice", "Payment Entry" or "Journal Entry"
+        names (list): Document names
+        fields (list, optional): Fields to return, see get_sales_invoice
+        include_children (bool, optional): Include child tables (default: True)
+
+    Returns:
+        dict: One result per name in input order. Missing documents are reported per
+            item instead of failing the call.
+    """
+    try:
+        return {
+            "status": "success",
+            "data": get_documents_data(doctype, names, fields, include_children)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+def _submit_or_defer(doc, defer_submit=False):
+    """Submit a freshly inserted document, or leave it a draft queued for the scheduled submitter"""
+    if cint(defer_submit):
+        # the scheduled submitter runs as Administrator, so the caller's right to submit is checked now
+        doc.check_permission("submit")
+        defer_submit_document(doc)
+    else:
+        doc.submit()
 
 
 # Sales Invoice CRUD
 @frappe.whitelist()
-def create_sales_invoice(customer, items, posting_date=None, due_date=None, vat_rate=None, vat_account_head=None, vat_description=None, calculate_vat=True, **kwargs):
-    """Create a new Sales Invoice"""
+@instrumented
+@idempotent
+@supports_async
+def create_sales_invoice(customer, items, posting_date=None, due_date=None, vat_rate=None, vat_account_head=None, vat_description=None, calculate_vat=True, defer_submit=False, **kwargs):
+    """
+    Create a new Sales Invoice
+
+    With defer_submit=1 the invoice is only inserted as a draft and submitted later,
+    in batches, by the scheduled submitter. See get_submit_backlog.
+    """
     try:
         customer = create_customer_if_not_exists(customer)
-        
-        doc = frappe.new_doc("Sales Invoice")
-        doc.customer = customer
-        doc.posting_date = posting_date or now()
-        doc.due_date = due_date or now()
-        
-        for item in items:
-            item_code = create_item_if_not_exists(
-                item.get("item_code"),
-                item.get("item_name"),
-                item.get("item_group", "All Item Groups")
-            )
-            
-            doc.append("items", {
-                "item_code": item_code,
-                "qty": item.get("qty", 1),
-                "rate": item.get("rate", 0),
-                "amount": flt(item.get("qty", 1)) * flt(item.get("rate", 0))
-            })
-        
-        if calculate_vat and vat_rate is not None:
-            doc.append("taxes", {
-                "charge_type": "On Net Total",
-                "account_head": vat_account_head or "VAT 5% - M",
-                "description": vat_description or "VAT",
-                "rate": flt(vat_rate),
-                "tax_amount": 0
-            })
-        
-        for key, value in kwargs.items():
-            if hasattr(doc, key):
-                setattr(doc, key, value)
-        
+
+        doc = build_sales_invoice(
+            customer, frappe.parse_json(items), posting_date, due_date,
+            vat_rate, vat_account_head, vat_description, calculate_vat, **kwargs
+        )
         doc.insert()
-        doc.submit()
+        _submit_or_defer(doc, defer_submit)
         
         return {
             "status": "success",
-            "message": _("Sales Invoice created successfully"),
-            "name": doc.name
+            "message": _("Sales Invoice created successfully") if doc.docstatus else _("Sales Invoice created as draft and queued for submission"),
+            "name": doc.name,
+            "docstatus": doc.docstatus
         }
     except Exception as e:
         return {
@@ -100,13 +138,105 @@ def create_sales_invoice(customer, items, posting_date=None, due_date=None, vat_
 
 
 @frappe.whitelist()
-def get_sales_invoice(name):
-    """Get Sales Invoice by name"""
+@instrumented
+@idempotent
+@supports_async
+def create_sales_invoices_bulk(invoices, chunk_size=100):
+    """
+    Create and submit many Sales Invoices in a single call
+
+    Customers and items referenced anywhere in the batch are resolved once up front.
+    Each invoice is inserted and submitted inside its own savepoint so one bad invoice
+    does not roll back the others, and the transaction is committed once per chunk.
+
+    Args:
+        invoices (list): Invoice payloads, each taking the same keys as create_sales_invoice
+        chunk_size (int, optional): Number of invoices per commit (default: 100)
+
+    Returns:
+        dict: Totals and a per-invoice result list in input order
+    """
+    try:
+        invoices = frappe.parse_json(invoices) or []
+        chunk_size = cint(chunk_size) or 100
+
+        for invoice in invoices:
+            invoice["items"] = frappe.parse_json(invoice.get("items")) or []
+
+        # Resolve every distinct customer and item once for the whole batch
+        master_errors = {}
+        customers = resolve_customers([invoice.get("customer") for invoice in invoices], errors=master_errors)
+        item_codes = resolve_items(
+            [item for invoice in invoices for item in invoice["items"]], errors=master_errors
+        )
+
+        results = []
+        for start in range(0, len(invoices), chunk_size):
+            for index, invoice in enumerate(invoices[start:start + chunk_size], start=start):
+                results.append(create_batch_sales_invoice(index, invoice, customers, item_codes, master_errors))
+
+            frappe.db.commit()
+
+        created = sum(1 for result in results if result["status"] == "success")
+
+        return {
+            "status": "success",
+            "message": _("{0} of {1} Sales Invoices created successfully").format(created, len(invoices)),
+            "created": created,
+            "failed": len(invoices) - created,
+            "results": results
+        }
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), _("Bulk Sales Invoice Creation Error"))
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def list_sales_invoices(filters=None, fields=None, page_length=100, cursor=None):
+    """
+    List Sales Invoices, most recently modified first
+
+    Args:
+        filters (dict, optional): Frappe style filters, e.g. {"docstatus": 1}
+        fields (list, optional): Columns to return
+        page_length (int, optional): Rows per page (default: 100, max: 1000)
+        cursor (str, optional): next_cursor from the previous page
+
+    Returns:
+        dict: Rows and the cursor of the next page, None on the last page
+    """
+    try:
+        return {
+            "status": "success",
+            **list_documents("Sales Invoice", filters, fields, page_length, cursor)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_sales_invoice(name, fields=None, include_children=True):
+    """
+    Get Sales Invoice by name
+
+    Args:
+        name (str): Sales Invoice name
+        fields (list, optional): Fields to return, parent columns and/or child table
+            fieldnames. Parent columns are then read without loading the document.
+        include_children (bool, optional): Include child tables (default: True)
+    """
     try:
-        doc = frappe.get_doc("Sales Invoice", name)
         return {
             "status": "success",
-            "data": doc.as_dict()
+            "data": get_document_data("Sales Invoice", name, fields, include_children)
         }
     except Exception as e:
         return {
@@ -116,22 +246,26 @@ def get_sales_invoice(name):
 
 
 @frappe.whitelist()
+@instrumented
+@idempotent
+@supports_async
 def update_sales_invoice(name, **kwargs):
-    """Update Sales Invoice"""
+    """
+    Update Sales Invoice
+
+    Only fields that differ from the current values are applied. On a submitted
+    Sales Invoice, changes to fields allowed on submit are saved in place without
+    reposting the ledger, other changes are submitted as an amendment.
+    The response tells which path was taken in update_path.
+    """
     try:
-        doc = frappe.get_doc("Sales Invoice", name)
-        
-        for key, value in kwargs.items():
-            if hasattr(doc, key):
-                setattr(doc, key, value)
-        
-        doc.save()
-        doc.submit()
-        
+        doc, update_path = update_document("Sales Invoice", name, kwargs)
+
         return {
             "status": "success",
             "message": _("Sales Invoice updated successfully"),
-            "name": doc.name
+            "name": doc.name,
+            "update_path": update_path
         }
     except Exception as e:
         return {
@@ -141,6 +275,8 @@ def update_sales_invoice(name, **kwargs):
 
 
 @frappe.whitelist()
+@instrumented
+@idempotent
 def delete_sales_invoice(name):
     """Delete Sales Invoice"""
     try:
@@ -164,51 +300,26 @@ def delete_sales_invoice(name):
 
 # Purchase Invoice CRUD
 @frappe.whitelist()
-def create_purchase_invoice(supplier, items, posting_date=None, due_date=None, vat_rate=None, vat_account_head=None, vat_description=None, calculate_vat=True, **kwargs):
-    """Create a new Purchase Invoice"""
+@instrumented
+@idempotent
+@supports_async
+def create_purchase_invoice(supplier, items, posting_date=None, due_date=None, vat_rate=None, vat_account_head=None, vat_description=None, calculate_vat=True, defer_submit=False, **kwargs):
+    """Create a new Purchase Invoice, defer_submit works as in create_sales_invoice"""
     try:
         supplier = create_supplier_if_not_exists(supplier)
-        
-        doc = frappe.new_doc("Purchase Invoice")
-        doc.supplier = supplier
-        doc.posting_date = posting_date or now()
-        doc.due_date = due_date or now()
-        
-        for item in items:
-            item_code = create_item_if_not_exists(
-                item.get("item_code"),
-                item.get("item_name"),
-                item.get("item_group", "All Item Groups")
-            )
-            
-            doc.append("items", {
-                "item_code": item_code,
-                "qty": item.get("qty", 1),
-                "rate": item.get("rate", 0),
-                "amount": flt(item.get("qty", 1)) * flt(item.get("rate", 0))
-            })
-        
-        # Add VAT if calculate_vat is True and vat_rate is provided
-        if calculate_vat and vat_rate is not None:
-            doc.append("taxes", {
-                "charge_type": "On Net Total",
-                "account_head": vat_account_head or "VAT - UAE",
-                "description": vat_description or "VAT",
-                "rate": flt(vat_rate),
-                "tax_amount": 0
-            })
-        
-        for key, value in kwargs.items():
-            if hasattr(doc, key):
-                setattr(doc, key, value)
-        
+
+        doc = build_purchase_invoice(
+            supplier, frappe.parse_json(items), posting_date, due_date,
+            vat_rate, vat_account_head, vat_description, calculate_vat, **kwargs
+        )
         doc.insert()
-        doc.submit()
+        _submit_or_defer(doc, defer_submit)
         
         return {
             "status": "success",
-            "message": _("Purchase Invoice created successfully"),
-            "name": doc.name
+            "message": _("Purchase Invoice created successfully") if doc.docstatus else _("Purchase Invoice created as draft and queued for submission"),
+            "name": doc.name,
+            "docstatus": doc.docstatus
         }
     except Exception as e:
         return {
@@ -218,13 +329,48 @@ def create_purchase_invoice(supplier, items, posting_date=None, due_date=None, v
 
 
 @frappe.whitelist()
-def get_purchase_invoice(name):
-    """Get Purchase Invoice by name"""
+@instrumented
+def list_purchase_invoices(filters=None, fields=None, page_length=100, cursor=None):
+    """
+    List Purchase Invoices, most recently modified first
+
+    Args:
+        filters (dict, optional): Frappe style filters, e.g. {"docstatus": 1}
+        fields (list, optional): Columns to return
+        page_length (int, optional): Rows per page (default: 100, max: 1000)
+        cursor (str, optional): next_cursor from the previous page
+
+    Returns:
+        dict: Rows and the cursor of the next page, None on the last page
+    """
+    try:
+        return {
+            "status": "success",
+            **list_documents("Purchase Invoice", filters, fields, page_length, cursor)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_purchase_invoice(name, fields=None, include_children=True):
+    """
+    Get Purchase Invoice by name
+
+    Args:
+        name (str): Purchase Invoice name
+        fields (list, optional): Fields to return, parent columns and/or child table
+            fieldnames. Parent columns are then read without loading the document.
+        include_children (bool, optional): Include child tables (default: True)
+    """
     try:
-        doc = frappe.get_doc("Purchase Invoice", name)
         return {
             "status": "success",
-            "data": doc.as_dict()
+            "data": get_document_data("Purchase Invoice", name, fields, include_children)
         }
     except Exception as e:
         return {
@@ -234,26 +380,26 @@ def get_purchase_invoice(name):
 
 
 @frappe.whitelist()
+@instrumented
+@idempotent
+@supports_async
 def update_purchase_invoice(name, **kwargs):
-    """Update Purchase Invoice"""
+    """
+    Update Purchase Invoice
+
+    Only fields that differ from the current values are applied. On a submitted
+    Purchase Invoice, changes to fields allowed on submit are saved in place without
+    reposting the ledger, other changes are submitted as an amendment.
+    The response tells which path was taken in update_path.
+    """
     try:
-        doc = frappe.get_doc("Purchase Invoice", name)
-        
-        if doc.docstatus == 1:
-            doc.cancel()
-            doc = frappe.get_doc("Purchase Invoice", name)
-        
-        for key, value in kwargs.items():
-            if hasattr(doc, key):
-                setattr(doc, key, value)
-        
-        doc.save()
-        doc.submit()
-        
+        doc, update_path = update_document("Purchase Invoice", name, kwargs)
+
         return {
             "status": "success",
             "message": _("Purchase Invoice updated successfully"),
-            "name": doc.name
+            "name": doc.name,
+            "update_path": update_path
         }
     except Exception as e:
         return {
@@ -263,6 +409,8 @@ def update_purchase_invoice(name, **kwargs):
 
 
 @frappe.whitelist()
+@instrumented
+@idempotent
 def delete_purchase_invoice(name):
     """Delete Purchase Invoice"""
     try:
@@ -286,6 +434,9 @@ def delete_purchase_invoice(name):
 
 # Payment Entry CRUD
 @frappe.whitelist()
+@instrumented
+@idempotent
+@supports_async
 def create_payment_entry(party_type, party, paid_amount, mode_of_payment=None, company=None, 
                         posting_date=None, reference_no=None, reference_date=None, 
                         references=None, cost_center=None, remarks=None, submit=False, **kwargs):
@@ -313,121 +464,10 @@ def create_payment_entry(party_type, party, paid_amount, mode_of_payment=None, c
         elif party_type == "Supplier":
             party = create_supplier_if_not_exists(party)
         
-        if not company:
-            company = frappe.defaults.get_user_default("Company") or frappe.db.get_single_value("Global Defaults", "default_company")
-        
-        if not company:
-            frappe.throw(_("Company is required"))
-        
-        posting_date = posting_date or nowdate()
-        reference_date = getdate(reference_date) if reference_date else getdate(posting_date)
-        
-        payment_type = "Receive" if party_type == "Customer" else "Pay"
-        
-        party_account = get_party_account(party_type, party, company)
-        party_account_currency = get_account_currency(party_account)
-        
-        bank_account = None
-        bank_account_currency = None
-        
-        if mode_of_payment:
-            bank_account = frappe.db.get_value(
-                "Mode of Payment Account",
-                {"parent": mode_of_payment, "company": company},
-                "default_account"
-            )
-        
-        if not bank_account:
-            bank_account = frappe.db.get_value(
-                "Account",
-                {"company": company, "account_type": "Cash", "is_group": 0},
-                "name"
-            )
-            
-        if not bank_account:
-            bank_account = frappe.db.get_value(
-                "Account",
-                {"company": company, "account_type": "Bank", "is_group": 0},
-                "name"
-            )
-        
-        if not bank_account:
-            frappe.throw(_("Please specify mode_of_payment or ensure a default Cash/Bank account exists for company {0}").format(company))
-        
-        bank_account_currency = get_account_currency(bank_account)
-        
-        company_currency = frappe.get_cached_value("Company", company, "default_currency")
-        
-        source_exchange_rate = 1.0
-        target_exchange_rate = 1.0
-        
-        if payment_type == "Receive":
-            paid_from_currency = party_account_currency
-            paid_to_currency = bank_account_currency
-            
-            if party_account_currency != company_currency:
-                source_exchange_rate = get_exchange_rate(party_account_currency, company_currency, posting_date)
-            if bank_account_currency != company_currency:
-                target_exchange_rate = get_exchange_rate(bank_account_currency, company_currency, posting_date)
-                
-        else: 
-            paid_from_currency = bank_account_currency
-            paid_to_currency = party_account_currency
-            
-            if bank_account_currency != company_currency:
-                source_exchange_rate = get_exchange_rate(bank_account_currency, company_currency, posting_date)
-            if party_account_currency != company_currency:
-                target_exchange_rate = get_exchange_rate(party_account_currency, company_currency, posting_date)
-
-        pe = frappe.new_doc("Payment Entry")
-        pe.payment_type = payment_type
-        pe.company = company
-        pe.posting_date = posting_date
-        pe.reference_date = reference_date
-        pe.mode_of_payment = mode_of_payment
-        pe.party_type = party_type
-        pe.party = party
-        pe.cost_center = cost_center or erpnext.get_default_cost_center(company)
-        
-        if payment_type == "Receive":
-            pe.paid_from = party_account
-            pe.paid_to = bank_account
-            pe.paid_from_account_currency = party_account_currency
-            pe.paid_to_account_currency = bank_account_currency
-        else:  # Pay
-            pe.paid_from = bank_account
-            pe.paid_to = party_account
-            pe.paid_from_account_currency = bank_account_currency
-            pe.paid_to_account_currency = party_account_currency
-        
-        pe.source_exchange_rate = source_exchange_rate
-        pe.target_exchange_rate = target_exchange_rate
-        
-        pe.paid_amount = flt(paid_amount)
-        pe.received_amount = flt(paid_amount)
-        
-        if reference_no:
-            pe.reference_no = reference_no
-        if remarks:
-            pe.remarks = remarks
-        
-        if references:
-            for ref in references:
-                pe.append("references", {
-                    "reference_doctype": ref.get("reference_doctype"),
-                    "reference_name": ref.get("reference_name"),
-                    "allocated_amount": flt(ref.get("allocated_amount", 0)),
-                    "outstanding_amount": flt(ref.get("outstanding_amount", 0)),
-                    "total_amount": flt(ref.get("total_amount", 0))
-                })
-        
-        for key, value in kwargs.items():
-            if hasattr(pe, key):
-                setattr(pe, key, value)
-        
-        pe.setup_party_account_field()
-        pe.set_missing_values()
-        pe.set_amounts()
+        pe = build_payment_entry(
+            party_type, party, paid_amount, mode_of_payment, company, posting_date,
+            reference_no, reference_date, references, cost_center, remarks, **kwargs
+        )
         
         pe.insert()
         
@@ -449,6 +489,9 @@ def create_payment_entry(party_type, party, paid_amount, mode_of_payment=None, c
 
 
 @frappe.whitelist()
+@instrumented
+@idempotent
+@supports_async
 def create_payment_entry_from_invoice(invoice_doctype, invoice_name, paid_amount=None, 
                                      mode_of_payment=None, submit=False, **kwargs):
     """
@@ -490,10 +533,9 @@ def create_payment_entry_from_invoice(invoice_doctype, invoice_name, paid_amount
             pe.mode_of_payment = mode_of_payment
             
             # Update bank account based on mode of payment
-            invoice_doc = frappe.get_doc(invoice_doctype, invoice_name)
             bank_account = frappe.db.get_value(
                 "Mode of Payment Account",
-                {"parent": mode_of_payment, "company": invoice_doc.company},
+                {"parent": mode_of_payment, "company": pe.company},
                 "default_account"
             )
             if bank_account:
@@ -543,15 +585,109 @@ def create_payment_entry_from_invoice(invoice_doctype, invoice_name, paid_amount
 
 
 @frappe.whitelist()
-def get_payment_entry(name):
-    """Get Payment Entry by name"""
+@instrumented
+@idempotent
+@supports_async
+def create_payment_entry_for_party(party_type, party, paid_amount=None, company=None, invoices=None,
+                                   mode_of_payment=None, posting_date=None, reference_no=None,
+                                   reference_date=None, remarks=None, submit=False, **kwargs):
+    """
+    Create a single Payment Entry settling many outstanding invoices of a party
+
+    Outstanding amounts of all open invoices are read in one aggregate query and
+    paid_amount is allocated oldest first, or across the given invoices in order.
+    Whatever is left after every invoice is settled stays on the entry as unallocated.
+
+    Args:
+        party_type (str): "Customer" or "Supplier"
+        party (str): Party name
+        paid_amount (float, optional): Amount to pay/receive (defaults to the total allocated)
+        company (str, optional): Company name (defaults to default company)
+        invoices (list, optional): Invoice names, or rows with reference_name and
+            optionally allocated_amount, to allocate against instead of all open invoices
+        mode_of_payment (str, optional): Mode of payment
+        posting_date (str, optional): Posting date (defaults to today)
+        reference_no (str, optional): Reference number
+        reference_date (str, optional): Reference date
+        remarks (str, optional): Remarks/notes
+        submit (bool, optional): Whether to submit the payment entry (default: False)
+        **kwargs: Additional fields to set on the payment entry
+
+    Returns:
+        dict: Status, payment entry details and the allocation per invoice
+    """
     try:
-        doc = frappe.get_doc("Payment Entry", name)
+        if party_type not in INVOICE_DOCTYPES:
+            frappe.throw(_("party_type must be 'Customer' or 'Supplier'"))
+
+        if not frappe.db.exists(party_type, party):
+            frappe.throw(_("{0} {1} does not exist").format(party_type, party))
+
+        if not company:
+            company = frappe.defaults.get_user_default("Company") or frappe.db.get_single_value("Global Defaults", "default_company")
+
+        if not company:
+            frappe.throw(_("Company is required"))
+
+        invoice_names = requested = None
+        if invoices:
+            invoices = [
+                {"reference_name": invoice} if isinstance(invoice, str) else invoice
+                for invoice in frappe.parse_json(invoices)
+            ]
+            invoice_names = [invoice.get("reference_name") for invoice in invoices]
+            requested = {invoice.get("reference_name"): invoice.get("allocated_amount") for invoice in invoices}
+
+        party_account = get_party_account_details(party_type, party, company)[0]
+        outstanding = get_outstanding_invoices(party_type, party, company, party_account, invoice_names)
+
+        if invoice_names is not None:
+            open_invoices = {invoice.name: invoice for invoice in outstanding}
+            missing = [name for name in invoice_names if name not in open_invoices]
+            if missing:
+                frappe.throw(_("No outstanding amount on {0}").format(", ".join(missing)))
+
+            outstanding = [open_invoices[name] for name in invoice_names]
+
+        references = allocate_payment(outstanding, paid_amount, requested)
+        if not references:
+            frappe.throw(_("No outstanding invoices to allocate against"))
+
+        allocated = sum(ref["allocated_amount"] for ref in references)
+        paid_amount = allocated if paid_amount is None else flt(paid_amount)
+
+        pe = build_payment_entry(
+            party_type, party, paid_amount, mode_of_payment, company, posting_date,
+            reference_no, reference_date, references, remarks=remarks, **kwargs
+        )
+        pe.insert()
+
+        if cint(submit):
+            pe.submit()
+
         return {
             "status": "success",
-            "data": doc.as_dict()
+            "message": _("Payment Entry {0} successfully against {1} invoices").format(
+                "created and submitted" if cint(submit) else "created",
+                len(references)
+            ),
+            "name": pe.name,
+            "docstatus": pe.docstatus,
+            "paid_amount": pe.paid_amount,
+            "allocated_amount": allocated,
+            "unallocated_amount": pe.unallocated_amount,
+            "references": [
+                {
+                    "reference_name": ref["reference_name"],
+                    "outstanding_amount": ref["outstanding_amount"],
+                    "allocated_amount": ref["allocated_amount"]
+                }
+                for ref in references
+            ]
         }
+
     except Exception as e:
+        frappe.log_error(frappe.get_traceback(), _("Party Payment Entry Creation Error"))
         return {
             "status": "error",
             "message": str(e)
@@ -559,37 +695,256 @@ def get_payment_entry(name):
 
 
 @frappe.whitelist()
-def update_payment_entry(name, **kwargs):
-    """Update Payment Entry"""
+@instrumented
+@idempotent
+@supports_async
+def reconcile_payments(payments, company=None, tolerance=None, submit=True, dry_run=False, chunk_size=100):
+    """
+    Match a batch of received or paid amounts to open invoices and create the Payment Entries
+
+    Open invoices of every party in the batch are loaded and indexed once per party type,
+    see PaymentMatcher for how a payment is matched. Each Payment Entry is created inside
+    its own savepoint so one bad payment does not roll back the others, and the
+    transaction is committed once per chunk.
+
+    Args:
+        payments (list): Payments with party_type, party and paid_amount, and optionally
+            reference_no, reference_date, posting_date, mode_of_payment, remarks and company
+        company (str, optional): Company of payments that do not name one (defaults to default company)
+        tolerance (float, optional): Largest difference still accepted as a near-exact match
+        submit (bool, optional): Whether to submit the payment entries (default: True)
+        dry_run (bool, optional): Only report the matches, create nothing
+        chunk_size (int, optional): Number of payments per commit (default: 100)
+
+    Returns:
+        dict: Totals and a per-payment result list in input order
+    """
     try:
-        doc = frappe.get_doc("Payment Entry", name)
-        
-        if doc.docstatus == 1:
-            doc.cancel()
-            doc = frappe.get_doc("Payment Entry", name)
-        
-        for key, value in kwargs.items():
-            if hasattr(doc, key):
-                setattr(doc, key, value)
-        
-        doc.save()
-        doc.submit()
-        
+        payments = frappe.parse_json(payments) or []
+        chunk_size = cint(chunk_size) or 100
+        tolerance = DEFAULT_TOLERANCE if tolerance is None else flt(tolerance)
+        company = company or frappe.defaults.get_user_default("Company") or frappe.db.get_single_value("Global Defaults", "default_company")
+
+        # One matcher per company and party type, each loading its open invoices in one query
+        parties = {}
+        for payment in payments:
+            if payment.get("party_type") in INVOICE_DOCTYPES:
+                key = (payment.get("company") or company, payment["party_type"])
+                parties.setdefault(key, set()).add(payment.get("party"))
+
+        # a matcher that cannot be built only fails the payments it serves, see _reconcile_payment
+        matchers = {}
+        for key, names in parties.items():
+            try:
+                matchers[key] = PaymentMatcher(key[0], key[1], names, tolerance)
+            except Exception as e:
+                frappe.log_error(frappe.get_traceback(), _("Payment Reconciliation Error"))
+                matchers[key] = str(e)
+
+        results = []
+        for start in range(0, len(payments), chunk_size):
+            for index, payment in enumerate(payments[start:start + chunk_size], start=start):
+                results.append(_reconcile_payment(index, payment, company, matchers, cint(submit), cint(dry_run)))
+
+            if not cint(dry_run):
+                frappe.db.commit()
+
+        succeeded = [result for result in results if result["status"] == "success"]
+        matches = {}
+        for result in succeeded:
+            match = result["match"] or "unmatched"
+            matches[match] = matches.get(match, 0) + 1
+
         return {
             "status": "success",
-            "message": _("Payment Entry updated successfully"),
-            "name": doc.name
+            "message": _("{0} of {1} payments {2}").format(
+                len(succeeded), len(payments), "matched" if cint(dry_run) else "reconciled"
+            ),
+            "succeeded": len(succeeded),
+            "failed": len(payments) - len(succeeded),
+            "matches": matches,
+            "results": results
         }
     except Exception as e:
+        frappe.log_error(frappe.get_traceback(), _("Payment Reconciliation Error"))
         return {
             "status": "error",
             "message": str(e)
         }
 
 
-@frappe.whitelist()
-def delete_payment_entry(name):
-    """Delete Payment Entry"""
+def _reconcile_payment(index, payment, company, matchers, submit, dry_run):
+    """Match one payment of a reconcile_payments batch and create its Payment Entry inside a savepoint"""
+    savepoint = "reconcile_payment"
+    payment = dict(payment)
+    party_type = payment.pop("party_type", None)
+    party = payment.pop("party", None)
+    paid_amount = flt(payment.pop("paid_amount", 0))
+    company = payment.pop("company", None) or company
+    # allocations come from the matcher only
+    payment.pop("references", None)
+
+    if party_type not in INVOICE_DOCTYPES or not party or paid_amount <= 0:
+        return {
+            "index": index,
+            "status": "error",
+            "message": _("party_type, party and a positive paid_amount are required")
+        }
+
+    matcher = matchers[(company, party_type)]
+    error = matcher if isinstance(matcher, str) else matcher.get_error(party)
+    if error:
+        return {
+            "index": index,
+            "status": "error",
+            "party": party,
+            "message": error
+        }
+
+    match, references = matcher.match(party, paid_amount, payment.get("reference_no"))
+    allocated = flt(sum(ref["allocated_amount"] for ref in references), matcher.precision)
+
+    result = {
+        "index": index,
+        "status": "success",
+        "party": party,
+        "match": match,
+        "allocated_amount": allocated,
+        "unallocated_amount": flt(paid_amount - allocated, matcher.precision),
+        "references": [
+            {"reference_name": ref["reference_name"], "allocated_amount": ref["allocated_amount"]}
+            for ref in references
+        ]
+    }
+    if dry_run:
+        return result
+
+    frappe.db.savepoint(savepoint)
+    try:
+        pe = build_payment_entry(
+            party_type, party, paid_amount, company=company, references=references, **payment
+        )
+        pe.insert()
+        if submit:
+            pe.submit()
+    except Exception as e:
+        frappe.db.rollback(save_point=savepoint)
+        matcher.release(party, references)
+        return {
+            "index": index,
+            "status": "error",
+            "party": party,
+            "message": str(e)
+        }
+
+    frappe.db.release_savepoint(savepoint)
+    result.update({"name": pe.name, "docstatus": pe.docstatus})
+    return result
+
+
+@frappe.whitelist()
+@instrumented
+def list_payment_entries(filters=None, fields=None, page_length=100, cursor=None):
+    """
+    List Payment Entries, most recently modified first
+
+    Args:
+        filters (dict, optional): Frappe style filters, e.g. {"docstatus": 1}
+        fields (list, optional): Columns to return
+        page_length (int, optional): Rows per page (default: 100, max: 1000)
+        cursor (str, optional): next_cursor from the previous page
+
+    Returns:
+        dict: Rows and the cursor of the next page, None on the last page
+    """
+    try:
+        return {
+            "status": "success",
+            **list_documents("Payment Entry", filters, fields, page_length, cursor)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_exchange_rate_cache_stats():
+    """Get hit and miss counters of the exchange rate cache used by create_payment_entry"""
+    try:
+        frappe.only_for("System Manager")
+
+        return {
+            "status": "success",
+            "data": get_exchange_rate_stats()
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_payment_entry(name, fields=None, include_children=True):
+    """
+    Get Payment Entry by name
+
+    Args:
+        name (str): Payment Entry name
+        fields (list, optional): Fields to return, parent columns and/or child table
+            fieldnames. Parent columns are then read without loading the document.
+        include_children (bool, optional): Include child tables (default: True)
+    """
+    try:
+        return {
+            "status": "success",
+            "data": get_document_data("Payment Entry", name, fields, include_children)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+@idempotent
+@supports_async
+def update_payment_entry(name, **kwargs):
+    """
+    Update Payment Entry
+
+    Only fields that differ from the current values are applied. On a submitted
+    Payment Entry, changes to fields allowed on submit are saved in place without
+    reposting the ledger, other changes are submitted as an amendment.
+    The response tells which path was taken in update_path.
+    """
+    try:
+        doc, update_path = update_document("Payment Entry", name, kwargs)
+
+        return {
+            "status": "success",
+            "message": _("Payment Entry updated successfully"),
+            "name": doc.name,
+            "update_path": update_path
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+@idempotent
+def delete_payment_entry(name):
+    """Delete Payment Entry"""
     try:
         doc = frappe.get_doc("Payment Entry", name)
         
@@ -609,21 +964,8 @@ def delete_payment_entry(name):
         }
 
 
-# Report mapping for different report types
-REPORT_MAPPING = {
-    "general_ledger": "General Ledger",
-    "profit_loss": "Profit and Loss Statement", 
-    "cash_flow": "Cash Flow",
-    "payables": "Accounts Payable",
-    "receivables": "Accounts Receivable",
-    "payables_summary": "Accounts Payable Summary",
-    "receivables_summary": "Accounts Receivable Summary",
-    "trial_balance": "Trial Balance",
-    "balance_sheet": "Balance Sheet",
-    "vat_report": "UAE VAT 201"  # Changed from "VAT Report" to "VAT Audit Report" (standard ERPNext report)
-}
-
 @frappe.whitelist()
+@instrumented
 def login_and_open_general_ledger(company=None, from_date=None, to_date=None, account=None):
     """Legacy function - redirects to the new general report function"""
     return open_report(
@@ -635,6 +977,7 @@ def login_and_open_general_ledger(company=None, from_date=None, to_date=None, ac
     )
 
 @frappe.whitelist()
+@instrumented
 def open_report(report_type=None, company=None, from_date=None, to_date=None, account=None, **kwargs):
     """
     General endpoint to open any of the specified reports
@@ -667,11 +1010,8 @@ def open_report(report_type=None, company=None, from_date=None, to_date=None, ac
             available_reports = ", ".join(REPORT_MAPPING.keys())
             frappe.throw(f"Invalid report type '{report_type}'. Available options: {available_reports}")
         
-        settings = frappe.get_doc(
-            "Merka Account Settings", "Merka Account Settings",
-        )
+        settings = get_settings()
         username = settings.user_email
-        password = settings.user_password
         site_url = frappe.utils.get_url()
         
         if not frappe.db.exists("User", username):
@@ -679,16 +1019,16 @@ def open_report(report_type=None, company=None, from_date=None, to_date=None, ac
         
         if not username:
             frappe.throw("User email not found in Merka Account Settings")
-        if not password:
-            frappe.throw("User password not found in Merka Account Settings")
-        
-        client = FrappeClient(url=site_url, username=username, password=password, verify=True)
         
-        sid = client.session.cookies.get('sid')
+        sid = get_session_id(username, "user_password")
         
         if not sid:
             frappe.throw("Failed to get session ID. Please check credentials.")
         
+        # the redirect is usually a GET, which Frappe does not commit, and the
+        # browser needs the new session as soon as it follows it
+        frappe.db.commit()
+
         # Get the report name from mapping
         report_name = REPORT_MAPPING[report_type]
         
@@ -741,9 +1081,152 @@ def open_report(report_type=None, company=None, from_date=None, to_date=None, ac
     except Exception as e:
         frappe.throw(f"Failed to login and redirect to {report_type}: {str(e)}")
 
+@frappe.whitelist()
+@instrumented
+def get_report_data(report_type=None, company=None, from_date=None, to_date=None, account=None, refresh=False, **kwargs):
+    """
+    Run any of the REPORT_MAPPING reports server-side and return its data as JSON
+
+    Args:
+        report_type (str): Type of report, see open_report for the options
+        company (str, optional): Company filter
+        from_date (str, optional): From date filter
+        to_date (str, optional): To date filter
+        account (str, optional): Account filter
+        refresh (bool, optional): Skip the result cache and recompute (default: False)
+        **kwargs: Additional filters for specific reports
+
+    Returns:
+        dict: Report columns and rows, and whether they were served from the cache
+    """
+    try:
+        if not report_type:
+            frappe.throw(_("Report type is required"))
+
+        filters = {key: value for key, value in kwargs.items() if key not in ("cmd", "sid")}
+        # General Ledger takes a list of accounts
+        if isinstance(account, str) and not account.startswith("["):
+            account = [account]
+
+        filters.update({
+            "company": company,
+            "from_date": from_date,
+            "to_date": to_date,
+            "account": frappe.parse_json(account)
+        })
+
+        data = run_report(report_type, filters, use_cache=not cint(refresh))
+
+        return {
+            "status": "success",
+            "report_type": report_type,
+            **data
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def export_report_data(report_type=None, file_format="ndjson", gzip=False, offset=0, **kwargs):
+    """
+    Download the rows of any of the REPORT_MAPPING reports as a stream
+
+    Args:
+        report_type (str): Type of report, see open_report for the options
+        file_format (str, optional): "ndjson" (default) or "csv"
+        gzip (bool, optional): Compress the stream with gzip (default: False)
+        offset (int, optional): Skip this many rows, to resume an interrupted download
+        **kwargs: Report filters such as company, from_date, to_date and account
+
+    Returns:
+        Response: Chunked file download, or an error dict
+    """
+    try:
+        if not report_type:
+            frappe.throw(_("Report type is required"))
+
+        filters = {key: value for key, value in kwargs.items() if key not in ("cmd", "sid")}
+
+        return export_report(report_type, filters, file_format, cint(gzip), offset)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_trial_balance(company, from_date, to_date, cost_center=None):
+    """
+    Get trial balance figures from the daily account balance snapshot
+
+    Unlike the trial_balance report this does not scan GL Entry, so its cost
+    follows the number of accounts instead of the size of the ledger.
+
+    Args:
+        company (str): Company name
+        from_date (str): Period start date
+        to_date (str): Period end date
+        cost_center (str or list, optional): Cost center filter
+
+    Returns:
+        dict: Opening, period and closing debit/credit per account, plus totals
+    """
+    try:
+        frappe.has_permission("GL Entry", "read", throw=True)
+        frappe.has_permission("Company", "read", doc=company, throw=True)
+
+        return {
+            "status": "success",
+            "data": get_trial_balance_snapshot(company, from_date, to_date, cost_center)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_balance_sheet(company, as_on_date=None):
+    """
+    Get balance sheet figures from the daily account balance snapshot
+
+    Args:
+        company (str): Company name
+        as_on_date (str, optional): Balance date (defaults to today)
+
+    Returns:
+        dict: Balance per account, totals per root type and the provisional profit or loss
+    """
+    try:
+        frappe.has_permission("GL Entry", "read", throw=True)
+        frappe.has_permission("Company", "read", doc=company, throw=True)
+
+        return {
+            "status": "success",
+            "data": get_balance_sheet_snapshot(company, as_on_date)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
 # Journal Entry CRUD
 @frappe.whitelist()
-def create_journal_entry(company, posting_date=None, voucher_type="Journal Entry", accounts=None, user_remark=None, **kwargs):
+@instrumented
+@idempotent
+@supports_async
+def create_journal_entry(company, posting_date=None, voucher_type="Journal Entry", accounts=None, user_remark=None,
+                         defer_submit=False, **kwargs):
     """
     Create a new Journal Entry with mandatory fields validation
     
@@ -753,6 +1236,7 @@ def create_journal_entry(company, posting_date=None, voucher_type="Journal Entry
         voucher_type (str, optional): Entry type (defaults to "Journal Entry")
         accounts (list): List of account entries with debit/credit amounts (mandatory)
         user_remark (str, optional): User remark
+        defer_submit (bool, optional): Only insert a draft, submitted later by the scheduled submitter
         **kwargs: Additional fields like title, reference, etc.
     
     Account entries format:
@@ -775,6 +1259,8 @@ def create_journal_entry(company, posting_date=None, voucher_type="Journal Entry
         ]
     """
     try:
+        accounts = frappe.parse_json(accounts)
+
         # Validate mandatory fields
         if not company:
             frappe.throw(_("Company is mandatory for Journal Entry"))
@@ -786,71 +1272,18 @@ def create_journal_entry(company, posting_date=None, voucher_type="Journal Entry
         if not frappe.db.exists("Company", company):
             frappe.throw(_("Company {0} does not exist").format(company))
         
-        # Create Journal Entry document
-        doc = frappe.new_doc("Journal Entry")
-        doc.company = company
-        doc.posting_date = posting_date or now()
-        doc.voucher_type = voucher_type
-        doc.user_remark = user_remark
-        
-        # Set additional fields from kwargs
-        for key, value in kwargs.items():
-            if hasattr(doc, key):
-                setattr(doc, key, value)
-        
-        # Add account entries
-        total_debit = 0
-        total_credit = 0
-        
-        for account_entry in accounts:
-            # Validate account entry
-            if not account_entry.get("account"):
-                frappe.throw(_("Account is mandatory for each entry"))
-            
-            # Validate account exists
-            if not frappe.db.exists("Account", account_entry.get("account")):
-                frappe.throw(_("Account {0} does not exist").format(account_entry.get("account")))
-            
-            debit_amount = flt(account_entry.get("debit_in_account_currency", 0))
-            credit_amount = flt(account_entry.get("credit_in_account_currency", 0))
-            
-            # Validate that either debit or credit is provided, but not both
-            if debit_amount and credit_amount:
-                frappe.throw(_("Account {0}: Cannot have both debit and credit amounts").format(account_entry.get("account")))
-            
-            if not debit_amount and not credit_amount:
-                frappe.throw(_("Account {0}: Either debit or credit amount is required").format(account_entry.get("account")))
-            
-            # Add to totals
-            total_debit += debit_amount
-            total_credit += credit_amount
-            
-            # Create account entry
-            account_row = doc.append("accounts", {
-                "account": account_entry.get("account"),
-                "debit_in_account_currency": debit_amount,
-                "credit_in_account_currency": credit_amount,
-                "cost_center": account_entry.get("cost_center"),
-                "party_type": account_entry.get("party_type"),
-                "party": account_entry.get("party"),
-                "user_remark": account_entry.get("user_remark"),
-                "reference_type": account_entry.get("reference_type"),
-                "reference_name": account_entry.get("reference_name"),
-                "project": account_entry.get("project")
-            })
-        
-        # Validate debit and credit balance
-        if abs(total_debit - total_credit) > 0.01:  # Allow for small rounding differences
-            frappe.throw(_("Total debit amount ({0}) must equal total credit amount ({1})").format(total_debit, total_credit))
+        rows, total_debit, total_credit = build_journal_rows(accounts)
+        doc = build_journal_entry(company, rows, posting_date, voucher_type, user_remark, **kwargs)
         
         # Insert and submit the document
         doc.insert()
-        doc.submit()
+        _submit_or_defer(doc, defer_submit)
         
         return {
             "status": "success",
-            "message": _("Journal Entry created successfully"),
+            "message": _("Journal Entry created successfully") if doc.docstatus else _("Journal Entry created as draft and queued for submission"),
             "name": doc.name,
+            "docstatus": doc.docstatus,
             "total_debit": total_debit,
             "total_credit": total_credit
         }
@@ -863,15 +1296,53 @@ def create_journal_entry(company, posting_date=None, voucher_type="Journal Entry
 
 
 @frappe.whitelist()
-def get_journal_entry(name):
-    """Get Journal Entry by name"""
+@instrumented
+@idempotent
+@supports_async
+def create_journal_entries_bulk(entries, chunk_size=100):
+    """
+    Create and submit many Journal Entries in a single call
+
+    Companies, accounts, cost centers and parties referenced anywhere in the batch are
+    checked once up front with one query per master, and debit/credit balance is
+    checked in memory. Each Journal Entry is inserted and submitted inside its own
+    savepoint so one bad entry does not roll back the others, and the transaction is
+    committed once per chunk.
+
+    Args:
+        entries (list): Journal Entry payloads, each taking the same keys as create_journal_entry
+        chunk_size (int, optional): Number of entries per commit (default: 100)
+
+    Returns:
+        dict: Totals and a per-entry result list in input order
+    """
     try:
-        doc = frappe.get_doc("Journal Entry", name)
+        entries = frappe.parse_json(entries) or []
+        chunk_size = cint(chunk_size) or 100
+
+        for entry in entries:
+            entry["accounts"] = frappe.parse_json(entry.get("accounts")) or []
+
+        masters = get_journal_masters(entries)
+
+        results = []
+        for start in range(0, len(entries), chunk_size):
+            for index, entry in enumerate(entries[start:start + chunk_size], start=start):
+                results.append(create_batch_journal_entry(index, entry, masters))
+
+            frappe.db.commit()
+
+        created = sum(1 for result in results if result["status"] == "success")
+
         return {
             "status": "success",
-            "data": doc.as_dict()
+            "message": _("{0} of {1} Journal Entries created successfully").format(created, len(entries)),
+            "created": created,
+            "failed": len(entries) - created,
+            "results": results
         }
     except Exception as e:
+        frappe.log_error(frappe.get_traceback(), _("Bulk Journal Entry Creation Error"))
         return {
             "status": "error",
             "message": str(e)
@@ -879,79 +1350,360 @@ def get_journal_entry(name):
 
 
 @frappe.whitelist()
+@instrumented
+@idempotent
+def create_large_journal_entry(company, accounts, posting_date=None, voucher_type="Journal Entry",
+                               voucher_rows=None, bridge_account=None, reference=None, **kwargs):
+    """
+    Post a Journal Entry too large for one document as a batch of balanced vouchers
+
+    The rows are validated and checked for balance right away, then posted in the
+    background in vouchers of voucher_rows rows, each balanced on the bridge account
+    and carrying the common reference as its Reference Number. Progress is
+    checkpointed per voucher, see get_journal_batch_status and resume_journal_batch.
+
+    Args:
+        company (str): Company name
+        accounts (list): Account rows, same format as create_journal_entry
+        posting_date (str, optional): Posting date of every voucher (defaults to today)
+        voucher_type (str, optional): Entry type, e.g. "Opening Entry" (defaults to "Journal Entry")
+        voucher_rows (int, optional): Account rows per voucher (default: 500)
+        bridge_account (str, optional): Balancing account (defaults to the company's Temporary account)
+        reference (str, optional): Common reference of the vouchers (defaults to the batch name)
+        **kwargs: Additional fields set on every voucher, like user_remark
+
+    Returns:
+        dict: Status, the batch name and the validated totals
+    """
+    try:
+        batch = create_journal_batch(
+            company, frappe.parse_json(accounts), posting_date, voucher_type,
+            voucher_rows, bridge_account, reference, **kwargs
+        )
+
+        return {
+            "status": "queued",
+            "message": _("Journal Entry queued for posting in batch {0}").format(batch.name),
+            "batch": batch.name,
+            "reference": batch.reference,
+            "total_rows": batch.total_rows,
+            "total_debit": batch.total_debit,
+            "total_credit": batch.total_credit
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_journal_batch_status(name):
+    """
+    Get the progress of a large Journal Entry batch
+
+    Totals are recomputed from the submitted vouchers. balanced confirms that every
+    row is posted, the vouchers add up to the entry and the bridge account nets to zero.
+    """
+    try:
+        frappe.has_permission("Journal Entry", "read", throw=True)
+
+        return {
+            "status": "success",
+            "data": get_journal_batch_summary(name)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def resume_journal_batch_posting(name):
+    """Resume a failed or interrupted batch after its last posted voucher"""
+    try:
+        resume_journal_batch(name)
+
+        return {
+            "status": "queued",
+            "message": _("Batch {0} queued again").format(name),
+            "batch": name
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def list_journal_entries(filters=None, fields=None, page_length=100, cursor=None):
+    """
+    List Journal Entries, most recently modified first
+
+    Args:
+        filters (dict, optional): Frappe style filters, e.g. {"docstatus": 1}
+        fields (list, optional): Columns to return
+        page_length (int, optional): Rows per page (default: 100, max: 1000)
+        cursor (str, optional): next_cursor from the previous page
+
+    Returns:
+        dict: Rows and the cursor of the next page, None on the last page
+    """
+    try:
+        return {
+            "status": "success",
+            **list_documents("Journal Entry", filters, fields, page_length, cursor)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_journal_entry(name, fields=None, include_children=True):
+    """
+    Get Journal Entry by name
+
+    Args:
+        name (str): Journal Entry name
+        fields (list, optional): Fields to return, parent columns and/or child table
+            fieldnames. Parent columns are then read without loading the document.
+        include_children (bool, optional): Include child tables (default: True)
+    """
+    try:
+        return {
+            "status": "success",
+            "data": get_document_data("Journal Entry", name, fields, include_children)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+@idempotent
+@supports_async
 def update_journal_entry(name, accounts=None, **kwargs):
-    """Update Journal Entry"""
+    """
+    Update Journal Entry
+
+    Only values that differ from the current ones are applied, see update_sales_invoice.
+    Passing accounts replaces all account rows, which always needs an amendment
+    once the Journal Entry is submitted.
+    """
     try:
-        doc = frappe.get_doc("Journal Entry", name)
-        
-        # Cancel if submitted
-        if doc.docstatus == 1:
-            doc.cancel()
-            doc = frappe.get_doc("Journal Entry", name)
-        
+        child_tables = {}
+        accounts = frappe.parse_json(accounts)
+
         # Update accounts if provided
         if accounts:
-            # Clear existing accounts
-            doc.accounts = []
-            
-            # Validate and add new accounts
-            total_debit = 0
-            total_credit = 0
-            
-            for account_entry in accounts:
-                if not account_entry.get("account"):
-                    frappe.throw(_("Account is mandatory for each entry"))
-                
-                if not frappe.db.exists("Account", account_entry.get("account")):
-                    frappe.throw(_("Account {0} does not exist").format(account_entry.get("account")))
-                
-                debit_amount = flt(account_entry.get("debit_in_account_currency", 0))
-                credit_amount = flt(account_entry.get("credit_in_account_currency", 0))
-                
-                if debit_amount and credit_amount:
-                    frappe.throw(_("Account {0}: Cannot have both debit and credit amounts").format(account_entry.get("account")))
-                
-                if not debit_amount and not credit_amount:
-                    frappe.throw(_("Account {0}: Either debit or credit amount is required").format(account_entry.get("account")))
-                
-                total_debit += debit_amount
-                total_credit += credit_amount
-                
-                doc.append("accounts", {
-                    "account": account_entry.get("account"),
-                    "debit_in_account_currency": debit_amount,
-                    "credit_in_account_currency": credit_amount,
-                    "cost_center": account_entry.get("cost_center"),
-                    "party_type": account_entry.get("party_type"),
-                    "party": account_entry.get("party"),
-                    "user_remark": account_entry.get("user_remark"),
-                    "reference_type": account_entry.get("reference_type"),
-                    "reference_name": account_entry.get("reference_name"),
-                    "project": account_entry.get("project")
-                })
-            
-            if abs(total_debit - total_credit) > 0.01:
-                frappe.throw(_("Total debit amount ({0}) must equal total credit amount ({1})").format(total_debit, total_credit))
-        
-        # Update other fields
-        for key, value in kwargs.items():
-            if hasattr(doc, key):
-                setattr(doc, key, value)
-        
-        doc.save()
-        doc.submit()
-        
+            child_tables["accounts"] = build_journal_rows(accounts)[0]
+
+        doc, update_path = update_document("Journal Entry", name, kwargs, child_tables)
+
         return {
             "status": "success",
             "message": _("Journal Entry updated successfully"),
-            "name": doc.name
+            "name": doc.name,
+            "update_path": update_path
         }
     except Exception as e:
         return {
             "status": "error",
             "message": str(e)
         }
+
+
 @frappe.whitelist()
+@instrumented
+@idempotent
+def start_data_import(import_type, file_url, chunk_size=100):
+    """
+    Import Sales Invoices, Purchase Invoices, Payment Entries or Journal Entries from a file
+
+    The file is streamed in a background job, masters are resolved in bulk per chunk and
+    every document is inserted and submitted with the same rules as the bulk endpoints.
+    Each chunk is checkpointed, see get_data_import_status and resume_data_import.
+
+    Args:
+        import_type (str): "Sales Invoice", "Purchase Invoice", "Payment Entry" or "Journal Entry"
+        file_url (str): URL of an uploaded .csv or .jsonl file, optionally gzipped. A jsonl
+            line takes the same keys as the matching create endpoint. Csv lines with the
+            same id column form one document, with child rows in columns like items.item_code.
+        chunk_size (int, optional): Documents per commit (default: 100)
+    """
+    try:
+        data_import = start_import(import_type, file_url, chunk_size)
+
+        return {
+            "status": "queued",
+            "message": _("Import {0} queued").format(data_import.name),
+            "import": data_import.name
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_data_import_status(name):
+    """Get the progress, throughput in documents per second and first failures of an import"""
+    try:
+        data = get_import_status(name)
+        frappe.has_permission(data.import_type, "read", throw=True)
+
+        return {
+            "status": "success",
+            "data": data
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def resume_data_import(name):
+    """Resume a failed or interrupted import after its last committed chunk"""
+    try:
+        resume_import(name)
+
+        return {
+            "status": "queued",
+            "message": _("Import {0} queued again").format(name),
+            "import": name
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def get_submit_backlog():
+    """
+    Get the drafts created with defer_submit that are waiting for the scheduled submitter
+
+    Returns:
+        dict: Queued and failed counts, per doctype with the oldest posting date
+            still waiting, and the most recent failures
+    """
+    try:
+        frappe.has_permission("Merka Submit Queue", "read", throw=True)
+
+        return {
+            "status": "success",
+            "data": get_backlog()
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
+def requeue_failed_submissions(reference_doctype=None):
+    """Queue drafts that failed to submit again, optionally only those of one doctype"""
+    try:
+        frappe.only_for("System Manager")
+
+        count = requeue_failed(reference_doctype)
+        return {
+            "status": "success",
+            "message": _("{0} drafts queued again").format(count),
+            "count": count
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+def metrics():
+    """
+    Expose endpoint latency, database query and outcome metrics for Prometheus
+
+    Scrape /api/method/marka_account_integration.api.metrics with the API key of a
+    System Manager. Counters and histograms cover every instrumented endpoint
+    of this site since the metrics were last cleared from Redis.
+    """
+    frappe.only_for("System Manager")
+
+    return Response(export_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+@frappe.whitelist()
+def download_api_profile(name):
+    """
+    Download the cProfile stats of a Merka API Profile
+
+    The .prof file opens with python -m pstats or snakeviz. Profiles are only
+    recorded when the API profiler is enabled in Merka Account Settings.
+    """
+    frappe.only_for("System Manager")
+
+    file_name, content = get_profile_content(name)
+    response = Response(content, mimetype="application/octet-stream")
+    response.headers["Content-Disposition"] = f'attachment; filename="{file_name}"'
+    return response
+
+
+@frappe.whitelist()
+@instrumented
+def get_job_status(job_id):
+    """
+    Get the state of a request queued with async=1
+
+    Returns:
+        dict: job_status (queued, started, finished or failed) and, once finished,
+            the result dict the synchronous call would have returned
+    """
+    try:
+        status = get_status(job_id)
+
+        if not status:
+            frappe.throw(_("Job {0} not found or expired").format(job_id))
+
+        if status["user"] != frappe.session.user and "System Manager" not in frappe.get_roles():
+            frappe.throw(_("Not permitted to view job {0}").format(job_id), frappe.PermissionError)
+
+        return {
+            "status": "success",
+            "job_id": job_id,
+            "job_status": status["job_status"],
+            "result": status["result"]
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+@frappe.whitelist()
+@instrumented
 def get_available_reports():
     """
     Get list of available reports with their descriptions
@@ -1014,38 +1766,35 @@ def get_available_reports():
 
 
 @frappe.whitelist(allow_guest=True)
+@instrumented
 def open_hr_module():
     """
     Opens the HR module (app/hr) using HR user credentials from Merka Account Settings
     """
     try:
         # Get HR credentials from settings
-        settings = frappe.get_doc(
-            "Merka Account Settings", "Merka Account Settings",
-        )
+        settings = get_settings()
         hr_email = settings.hr_email
-        hr_password = settings.hr_password
         site_url = frappe.utils.get_url()
         
         # Validate HR credentials
         if not hr_email:
             frappe.throw("HR email not found in Merka Account Settings")
-        if not hr_password:
-            frappe.throw("HR password not found in Merka Account Settings")
         
         # Validate user exists
         if not frappe.db.exists("User", hr_email):
             frappe.throw(f"User {hr_email} does not exist in the system")
         
-        # Login using FrappeClient
-        client = FrappeClient(url=site_url, username=hr_email, password=hr_password, verify=True)
-        
-        # Get session ID
-        sid = client.session.cookies.get('sid')
+        # Get a brokered session for the HR user
+        sid = get_session_id(hr_email, "hr_password")
         
         if not sid:
             frappe.throw("Failed to get session ID. Please check HR credentials.")
         
+        # the redirect is usually a GET, which Frappe does not commit, and the
+        # browser needs the new session as soon as it follows it
+        frappe.db.commit()
+
         # Build HR module URL
         hr_url = f"{site_url}/app/hr?sid={sid}"
         
@@ -0,0 +1,337 @@
+import hashlib
+
+import frappe
+from erpnext.accounts.utils import get_fiscal_year
+from frappe.utils import flt, getdate, now
+
+from marka_account_integration.utils import get_permission_conditions
+
+BALANCE_DOCTYPE = "Merka Account Balance"
+BALANCE_FIELDS = [
+	"name",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+	"company",
+	"account",
+	"cost_center",
+	"posting_date",
+	"is_opening",
+	"debit",
+	"credit",
+]
+# differences below this are rounding noise, not a drifted snapshot
+RECONCILE_TOLERANCE = 0.005
+# User Permissions on GL Entry that also restrict the snapshot rows
+PERMISSION_FIELDS = ("company", "cost_center")
+
+
+def update_account_balance(doc, method=None):
+	"""
+	doc_events handler adding a GL Entry to its daily balance row
+
+	Submitting a voucher inserts its GL Entries, cancelling it inserts reversed
+	copies flagged is_cancelled, so handling inserts keeps the snapshot in step with
+	both. The ledger leaves out a cancelled entry and its reversal alike, so a
+	reversal takes the original amounts off the row instead of adding its own.
+	"""
+	is_opening = 1 if doc.is_opening == "Yes" else 0
+	debit, credit = flt(doc.debit), flt(doc.credit)
+	if doc.is_cancelled:
+		# the reversal has debit and credit of the original swapped
+		debit, credit = -credit, -debit
+
+	values = {
+		"name": get_balance_name(doc.company, doc.account, doc.cost_center, doc.posting_date, is_opening),
+		"now": now(),
+		"user": frappe.session.user,
+		"company": doc.company,
+		"account": doc.account,
+		"cost_center": doc.cost_center,
+		"posting_date": getdate(doc.posting_date),
+		"is_opening": is_opening,
+		"debit": debit,
+		"credit": credit,
+	}
+
+	if frappe.db.db_type == "postgres":
+		on_conflict = """on conflict (name) do update set
+			debit = `tabMerka Account Balance`.debit + excluded.debit,
+			credit = `tabMerka Account Balance`.credit + excluded.credit,
+			modified = excluded.modified"""
+	else:
+		on_conflict = """on duplicate key update
+			debit = debit + values(debit),
+			credit = credit + values(credit),
+			modified = values(modified)"""
+
+	frappe.db.sql(
+		f"""
+		insert into `tabMerka Account Balance`
+			(name, creation, modified, modified_by, owner, company, account, cost_center, posting_date,
+			is_opening, debit, credit)
+		values
+			(%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, %(company)s, %(account)s, %(cost_center)s,
+			%(posting_date)s, %(is_opening)s, %(debit)s, %(credit)s)
+		{on_conflict}
+		""",
+		values,
+	)
+
+
+def rebuild_account_balances(company=None, from_date=None, to_date=None):
+	"""
+	Recompute the daily balance rows from GL Entry, for one company or all of them,
+	optionally only those of a posting date range
+	"""
+	filters = {}
+	conditions = ["is_cancelled = 0"]
+	if company:
+		filters["company"] = company
+		conditions.append("company = %(company)s")
+	if from_date:
+		filters["posting_date"] = [">=", getdate(from_date)]
+		conditions.append("posting_date >= %(from_date)s")
+	if to_date:
+		filters["posting_date"] = (
+			["between", [getdate(from_date), getdate(to_date)]] if from_date else ["<=", getdate(to_date)]
+		)
+		conditions.append("posting_date <= %(to_date)s")
+
+	frappe.db.delete(BALANCE_DOCTYPE, filters or None)
+
+	rows = frappe.db.sql(
+		f"""
+		select
+			company, account, cost_center, posting_date,
+			case when is_opening = 'Yes' then 1 else 0 end as opening_entry,
+			sum(debit), sum(credit)
+		from `tabGL Entry`
+		where {" and ".join(conditions)}
+		group by company, account, cost_center, posting_date, opening_entry
+		""",
+		{"company": company, "from_date": from_date, "to_date": to_date},
+	)
+
+	timestamp, user = now(), frappe.session.user
+	values = [
+		(
+			get_balance_name(row_company, account, cost_center, posting_date, is_opening),
+			timestamp,
+			timestamp,
+			user,
+			user,
+			row_company,
+			account,
+			cost_center,
+			posting_date,
+			is_opening,
+			debit,
+			credit,
+		)
+		for row_company, account, cost_center, posting_date, is_opening, debit, credit in rows
+	]
+	frappe.db.bulk_insert(BALANCE_DOCTYPE, BALANCE_FIELDS, values)
+
+	return len(values)
+
+
+def reconcile_account_balances():
+	"""
+	Daily job rebuilding the posting dates whose snapshot no longer matches GL Entry
+
+	ERPNext's repost and ledger rebuild paths delete and re-create GL Entries with
+	frappe.db.delete, which fires no doc events, so the snapshot can drift from
+	the ledger. Both sides are aggregated at the grain of the snapshot and every
+	date with a difference is rebuilt from GL Entry.
+	"""
+	for company in frappe.get_all("Company", pluck="name"):
+		for posting_date in get_drifted_dates(company):
+			rebuild_account_balances(company, posting_date, posting_date)
+			frappe.db.commit()
+
+
+def get_drifted_dates(company):
+	"""Posting dates of a company where the snapshot and GL Entry disagree"""
+	ledger = """
+		select
+			account, ifnull(cost_center, '') as cost_center, posting_date,
+			case when is_opening = 'Yes' then 1 else 0 end as is_opening,
+			sum(debit) as debit, sum(credit) as credit
+		from `tabGL Entry`
+		where company = %(company)s and is_cancelled = 0
+		group by account, ifnull(cost_center, ''), posting_date, case when is_opening = 'Yes' then 1 else 0 end
+	"""
+	snapshot = """
+		select
+			account, ifnull(cost_center, '') as cost_center, posting_date, is_opening,
+			debit, credit
+		from `tabMerka Account Balance`
+		where company = %(company)s
+	"""
+	mismatch = f"""
+		from ({{0}}) a
+		left join ({{1}}) b
+			on b.account = a.account and b.cost_center = a.cost_center
+			and b.posting_date = a.posting_date and b.is_opening = a.is_opening
+		where b.account is null
+			or abs(a.debit - b.debit) > {RECONCILE_TOLERANCE}
+			or abs(a.credit - b.credit) > {RECONCILE_TOLERANCE}
+	"""
+
+	return frappe.db.sql_list(
+		f"""
+		select a.posting_date {mismatch.format(ledger, snapshot)}
+		union
+		select a.posting_date {mismatch.format(snapshot, ledger)}
+		""",
+		{"company": company},
+	)
+
+
+def get_balance_name(company, account, cost_center, posting_date, is_opening=0):
+	key = "\x1f".join([company, account, cost_center or "", str(getdate(posting_date)), str(is_opening or 0)])
+	return hashlib.md5(key.encode()).hexdigest()
+
+
+def get_trial_balance(company, from_date, to_date, cost_center=None):
+	"""
+	Trial balance of the leaf accounts of a company from the daily balance rows
+
+	Opening balances of Profit and Loss accounts start at the beginning of the
+	fiscal year, and opening entries count towards the opening balance whatever
+	their posting date, as in ERPNext's Trial Balance. Rows of cost centers the user
+	is not permitted to see are left out, as they are from GL Entry lists.
+	"""
+	from_date, to_date = getdate(from_date), getdate(to_date)
+	values = {
+		"company": company,
+		"from_date": from_date,
+		"to_date": to_date,
+		"year_start_date": get_fiscal_year(from_date, company=company)[1],
+	}
+	cost_center_condition = ""
+	if cost_center:
+		cost_center_condition = "and balance.cost_center in %(cost_center)s"
+		if isinstance(cost_center, str):
+			cost_center = frappe.parse_json(cost_center) if cost_center.startswith("[") else [cost_center]
+		values["cost_center"] = tuple(cost_center)
+
+	permission_conditions = _get_permission_conditions(values)
+
+	rows = frappe.db.sql(
+		f"""
+		select
+			balance.account, account.account_name, account.root_type, account.report_type, account.lft,
+			sum(case
+				when (balance.posting_date < %(from_date)s or balance.is_opening = 1)
+					and (account.report_type = 'Balance Sheet' or balance.posting_date >= %(year_start_date)s)
+				then balance.debit - balance.credit else 0 end) as opening,
+			sum(case
+				when balance.posting_date >= %(from_date)s and balance.is_opening = 0
+				then balance.debit else 0 end) as debit,
+			sum(case
+				when balance.posting_date >= %(from_date)s and balance.is_opening = 0
+				then balance.credit else 0 end) as credit
+		from `tabMerka Account Balance` balance
+		inner join `tabAccount` account on account.name = balance.account
+		where balance.company = %(company)s and balance.posting_date <= %(to_date)s {cost_center_condition}
+			{permission_conditions}
+		group by balance.account, account.account_name, account.root_type, account.report_type, account.lft
+		order by account.lft
+		""",
+		values,
+		as_dict=True,
+	)
+
+	totals = frappe._dict.fromkeys(
+		("opening_debit", "opening_credit", "debit", "credit", "closing_debit", "closing_credit"), 0.0
+	)
+	accounts = []
+	for row in rows:
+		closing = flt(row.opening) + flt(row.debit) - flt(row.credit)
+		account = {
+			"account": row.account,
+			"account_name": row.account_name,
+			"root_type": row.root_type,
+			"opening_debit": max(flt(row.opening), 0),
+			"opening_credit": max(-flt(row.opening), 0),
+			"debit": flt(row.debit),
+			"credit": flt(row.credit),
+			"closing_debit": max(closing, 0),
+			"closing_credit": max(-closing, 0),
+		}
+		accounts.append(account)
+
+		for key in totals:
+			totals[key] += account[key]
+
+	return {"accounts": accounts, "totals": totals}
+
+
+def get_balance_sheet(company, as_on_date=None):
+	"""
+	Balance Sheet account balances of a company as on a date from the daily balance rows
+
+	Profit or loss of the running fiscal year that has not been closed yet is
+	returned separately as provisional_profit_loss.
+	"""
+	as_on_date = getdate(as_on_date)
+	values = {
+		"company": company,
+		"as_on_date": as_on_date,
+		"year_start_date": get_fiscal_year(as_on_date, company=company)[1],
+	}
+	permission_conditions = _get_permission_conditions(values)
+
+	rows = frappe.db.sql(
+		f"""
+		select
+			balance.account, account.account_name, account.root_type, account.report_type, account.lft,
+			sum(balance.debit - balance.credit) as balance
+		from `tabMerka Account Balance` balance
+		inner join `tabAccount` account on account.name = balance.account
+		where balance.company = %(company)s and balance.posting_date <= %(as_on_date)s
+			and (account.report_type = 'Balance Sheet' or balance.posting_date >= %(year_start_date)s)
+			{permission_conditions}
+		group by balance.account, account.account_name, account.root_type, account.report_type, account.lft
+		order by account.lft
+		""",
+		values,
+		as_dict=True,
+	)
+
+	totals = {"Asset": 0.0, "Liability": 0.0, "Equity": 0.0}
+	accounts = []
+	provisional_profit_loss = 0.0
+
+	for row in rows:
+		if row.report_type != "Balance Sheet":
+			# income is credited, so profit is the negated net debit
+			provisional_profit_loss -= flt(row.balance)
+			continue
+
+		balance = flt(row.balance) if row.root_type == "Asset" else -flt(row.balance)
+		accounts.append(
+			{
+				"account": row.account,
+				"account_name": row.account_name,
+				"root_type": row.root_type,
+				"balance": balance,
+			}
+		)
+		totals[row.root_type] = totals.get(row.root_type, 0.0) + balance
+
+	return {
+		"accounts": accounts,
+		"totals": totals,
+		"provisional_profit_loss": provisional_profit_loss,
+	}
+
+
+def _get_permission_conditions(values):
+	"""User Permission conditions on the snapshot rows, adding their values to `values`"""
+	conditions, permitted = get_permission_conditions("GL Entry", PERMISSION_FIELDS, alias="balance")
+	values.update(permitted)
+	return "".join(f" and {condition}" for condition in conditions)
@@ -0,0 +1,27 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-account-balances")
+@click.option("--company", help="Only rebuild the balances of this company")
+@click.option("--from-date", help="Only rebuild the balances posted on or after this date")
+@click.option("--to-date", help="Only rebuild the balances posted on or before this date")
+@pass_context
+def rebuild_account_balances(context, company=None, from_date=None, to_date=None):
+	"""Recompute the Merka Account Balance snapshot from GL Entry"""
+	import frappe
+
+	from marka_account_integration.balances import rebuild_account_balances as rebuild
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		count = rebuild(company, from_date, to_date)
+		frappe.db.commit()
+		click.secho(f"Rebuilt {count} daily account balances", fg="green")
+	finally:
+		frappe.destroy()
+
+
+commands = [rebuild_account_balances]
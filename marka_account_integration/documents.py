@@ -0,0 +1,375 @@
+import frappe
+from frappe import _
+from frappe.utils import flt, getdate, now, nowdate
+
+from marka_account_integration.journals import build_journal_entry, build_journal_rows
+from marka_account_integration.masters import resolve_items
+from marka_account_integration.payments import (
+	INVOICE_DOCTYPES,
+	get_cached_exchange_rate,
+	get_party_account_details,
+	get_payment_accounts,
+)
+
+
+def build_sales_invoice(
+	customer,
+	items,
+	posting_date=None,
+	due_date=None,
+	vat_rate=None,
+	vat_account_head=None,
+	vat_description=None,
+	calculate_vat=True,
+	item_codes=None,
+	**kwargs,
+):
+	"""
+	Build an unsaved Sales Invoice document
+
+	Args:
+		customer (str): Resolved Customer name
+		items (list): Item rows with item_code, qty and rate
+		item_codes (dict, optional): Map of incoming item_code to resolved Item name,
+			as returned by resolve_items. Resolved here when not given.
+	"""
+	if item_codes is None:
+		item_codes = resolve_items(items)
+
+	doc = frappe.new_doc("Sales Invoice")
+	doc.customer = customer
+	doc.posting_date = posting_date or now()
+	doc.due_date = due_date or now()
+
+	for item in items:
+		doc.append(
+			"items",
+			{
+				"item_code": item_codes.get(item.get("item_code"), item.get("item_code")),
+				"qty": item.get("qty", 1),
+				"rate": item.get("rate", 0),
+				"amount": flt(item.get("qty", 1)) * flt(item.get("rate", 0)),
+			},
+		)
+
+	if calculate_vat and vat_rate is not None:
+		doc.append(
+			"taxes",
+			{
+				"charge_type": "On Net Total",
+				"account_head": vat_account_head or "VAT 5% - M",
+				"description": vat_description or "VAT",
+				"rate": flt(vat_rate),
+				"tax_amount": 0,
+			},
+		)
+
+	for key, value in kwargs.items():
+		if hasattr(doc, key):
+			setattr(doc, key, value)
+
+	return doc
+
+
+def build_purchase_invoice(
+	supplier,
+	items,
+	posting_date=None,
+	due_date=None,
+	vat_rate=None,
+	vat_account_head=None,
+	vat_description=None,
+	calculate_vat=True,
+	item_codes=None,
+	**kwargs,
+):
+	"""Build an unsaved Purchase Invoice document, see build_sales_invoice"""
+	if item_codes is None:
+		item_codes = resolve_items(items)
+
+	doc = frappe.new_doc("Purchase Invoice")
+	doc.supplier = supplier
+	doc.posting_date = posting_date or now()
+	doc.due_date = due_date or now()
+
+	for item in items:
+		doc.append(
+			"items",
+			{
+				"item_code": item_codes.get(item.get("item_code"), item.get("item_code")),
+				"qty": item.get("qty", 1),
+				"rate": item.get("rate", 0),
+				"amount": flt(item.get("qty", 1)) * flt(item.get("rate", 0)),
+			},
+		)
+
+	# Add VAT if calculate_vat is True and vat_rate is provided
+	if calculate_vat and vat_rate is not None:
+		doc.append(
+			"taxes",
+			{
+				"charge_type": "On Net Total",
+				"account_head": vat_account_head or "VAT - UAE",
+				"description": vat_description or "VAT",
+				"rate": flt(vat_rate),
+				"tax_amount": 0,
+			},
+		)
+
+	for key, value in kwargs.items():
+		if hasattr(doc, key):
+			setattr(doc, key, value)
+
+	return doc
+
+
+def build_payment_entry(
+	party_type,
+	party,
+	paid_amount,
+	mode_of_payment=None,
+	company=None,
+	posting_date=None,
+	reference_no=None,
+	reference_date=None,
+	references=None,
+	cost_center=None,
+	remarks=None,
+	**kwargs,
+):
+	"""
+	Build an unsaved Payment Entry with its accounts, exchange rates and amounts set
+
+	Args:
+		party_type (str): "Customer" or "Supplier"
+		party (str): Resolved party name
+		references (list, optional): Reference rows to allocate against
+	"""
+	if not company:
+		company = frappe.defaults.get_user_default("Company") or frappe.db.get_single_value(
+			"Global Defaults", "default_company"
+		)
+
+	if not company:
+		frappe.throw(_("Company is required"))
+
+	posting_date = posting_date or nowdate()
+	reference_date = getdate(reference_date) if reference_date else getdate(posting_date)
+
+	payment_type = "Receive" if party_type == "Customer" else "Pay"
+
+	party_account, party_account_currency = get_party_account_details(party_type, party, company)
+
+	accounts = get_payment_accounts(company, mode_of_payment)
+	bank_account = accounts["bank_account"]
+	bank_account_currency = accounts["bank_account_currency"]
+	company_currency = accounts["company_currency"]
+
+	source_exchange_rate = 1.0
+	target_exchange_rate = 1.0
+
+	if payment_type == "Receive":
+		if party_account_currency != company_currency:
+			source_exchange_rate = get_cached_exchange_rate(
+				party_account_currency, company_currency, posting_date
+			)
+		if bank_account_currency != company_currency:
+			target_exchange_rate = get_cached_exchange_rate(
+				bank_account_currency, company_currency, posting_date
+			)
+
+	else:
+		if bank_account_currency != company_currency:
+			source_exchange_rate = get_cached_exchange_rate(
+				bank_account_currency, company_currency, posting_date
+			)
+		if party_account_currency != company_currency:
+			target_exchange_rate = get_cached_exchange_rate(
+				party_account_currency, company_currency, posting_date
+			)
+
+	pe = frappe.new_doc("Payment Entry")
+	pe.payment_type = payment_type
+	pe.company = company
+	pe.posting_date = posting_date
+	pe.reference_date = reference_date
+	pe.mode_of_payment = mode_of_payment
+	pe.party_type = party_type
+	pe.party = party
+	pe.cost_center = cost_center or accounts["cost_center"]
+
+	if payment_type == "Receive":
+		pe.paid_from = party_account
+		pe.paid_to = bank_account
+		pe.paid_from_account_currency = party_account_currency
+		pe.paid_to_account_currency = bank_account_currency
+	else:  # Pay
+		pe.paid_from = bank_account
+		pe.paid_to = party_account
+		pe.paid_from_account_currency = bank_account_currency
+		pe.paid_to_account_currency = party_account_currency
+
+	pe.source_exchange_rate = source_exchange_rate
+	pe.target_exchange_rate = target_exchange_rate
+
+	pe.paid_amount = flt(paid_amount)
+	pe.received_amount = flt(paid_amount)
+
+	if reference_no:
+		pe.reference_no = reference_no
+	if remarks:
+		pe.remarks = remarks
+
+	if references:
+		for ref in references:
+			pe.append(
+				"references",
+				{
+					"reference_doctype": ref.get("reference_doctype"),
+					"reference_name": ref.get("reference_name"),
+					"allocated_amount": flt(ref.get("allocated_amount", 0)),
+					"outstanding_amount": flt(ref.get("outstanding_amount", 0)),
+					"total_amount": flt(ref.get("total_amount", 0)),
+					"due_date": ref.get("due_date"),
+				},
+			)
+
+	for key, value in kwargs.items():
+		if hasattr(pe, key):
+			setattr(pe, key, value)
+
+	pe.setup_party_account_field()
+	pe.set_missing_values()
+	pe.set_amounts()
+
+	return pe
+
+
+def create_batch_sales_invoice(index, invoice, customers, item_codes, master_errors):
+	"""Insert and submit one invoice of a bulk batch inside a savepoint"""
+	savepoint = "bulk_sales_invoice"
+	frappe.db.savepoint(savepoint)
+
+	try:
+		values = dict(invoice)
+		customer = values.pop("customer", None)
+		items = values.pop("items")
+
+		if not customer:
+			frappe.throw(_("Customer is required"))
+		if not items:
+			frappe.throw(_("At least one item is required"))
+
+		for master in [("Customer", customer)] + [("Item", item.get("item_code")) for item in items]:
+			if master in master_errors:
+				frappe.throw(master_errors[master])
+
+		doc = build_sales_invoice(customers[customer], items, item_codes=item_codes, **values)
+		doc.insert()
+		doc.submit()
+		frappe.db.release_savepoint(savepoint)
+
+		return {"index": index, "status": "success", "name": doc.name}
+	except Exception as e:
+		frappe.db.rollback(save_point=savepoint)
+		return {"index": index, "status": "error", "message": str(e)}
+
+
+def create_batch_purchase_invoice(index, invoice, suppliers, item_codes, master_errors):
+	"""Insert and submit one purchase invoice of a bulk batch inside a savepoint, see create_batch_sales_invoice"""
+	savepoint = "bulk_purchase_invoice"
+	frappe.db.savepoint(savepoint)
+
+	try:
+		values = dict(invoice)
+		supplier = values.pop("supplier", None)
+		items = values.pop("items")
+
+		if not supplier:
+			frappe.throw(_("Supplier is required"))
+		if not items:
+			frappe.throw(_("At least one item is required"))
+
+		for master in [("Supplier", supplier)] + [("Item", item.get("item_code")) for item in items]:
+			if master in master_errors:
+				frappe.throw(master_errors[master])
+
+		doc = build_purchase_invoice(suppliers[supplier], items, item_codes=item_codes, **values)
+		doc.insert()
+		doc.submit()
+		frappe.db.release_savepoint(savepoint)
+
+		return {"index": index, "status": "success", "name": doc.name}
+	except Exception as e:
+		frappe.db.rollback(save_point=savepoint)
+		return {"index": index, "status": "error", "message": str(e)}
+
+
+def create_batch_payment_entry(index, payment, parties, master_errors):
+	"""
+	Insert and submit one payment entry of a bulk batch inside a savepoint
+
+	Args:
+		parties (dict): Map of party_type to the resolved names of its parties
+	"""
+	savepoint = "bulk_payment_entry"
+	frappe.db.savepoint(savepoint)
+
+	try:
+		values = dict(payment)
+		party_type = values.pop("party_type", None)
+		party = values.pop("party", None)
+		paid_amount = values.pop("paid_amount", None)
+
+		if party_type not in INVOICE_DOCTYPES:
+			frappe.throw(_("party_type must be 'Customer' or 'Supplier'"))
+		if not party:
+			frappe.throw(_("Party is required"))
+		if (party_type, party) in master_errors:
+			frappe.throw(master_errors[(party_type, party)])
+
+		values["references"] = frappe.parse_json(values.get("references")) or []
+		pe = build_payment_entry(party_type, parties[party_type][party], paid_amount, **values)
+		pe.insert()
+		pe.submit()
+		frappe.db.release_savepoint(savepoint)
+
+		return {"index": index, "status": "success", "name": pe.name}
+	except Exception as e:
+		frappe.db.rollback(save_point=savepoint)
+		return {"index": index, "status": "error", "message": str(e)}
+
+
+def create_batch_journal_entry(index, entry, masters):
+	"""Validate, insert and submit one entry of a bulk batch inside a savepoint"""
+	savepoint = "bulk_journal_entry"
+	frappe.db.savepoint(savepoint)
+
+	try:
+		values = dict(entry)
+		company = values.pop("company", None)
+		accounts = values.pop("accounts")
+
+		if not company:
+			frappe.throw(_("Company is mandatory for Journal Entry"))
+		if company not in masters.get("Company", ()):
+			frappe.throw(_("Company {0} does not exist").format(company))
+		if len(accounts) < 2:
+			frappe.throw(_("At least 2 account entries are required for Journal Entry"))
+
+		rows, total_debit, total_credit = build_journal_rows(accounts, masters)
+		doc = build_journal_entry(company, rows, **values)
+		doc.insert()
+		doc.submit()
+		frappe.db.release_savepoint(savepoint)
+
+		return {
+			"index": index,
+			"status": "success",
+			"name": doc.name,
+			"total_debit": total_debit,
+			"total_credit": total_credit,
+		}
+	except Exception as e:
+		frappe.db.rollback(save_point=savepoint)
+		return {"index": index, "status": "error", "message": str(e)}
@@ -0,0 +1,207 @@
+import csv
+import io
+import json
+import zlib
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+from werkzeug.wrappers import Response
+
+from marka_account_integration.reports import REPORT_MAPPING, normalize_filters, run_report
+from marka_account_integration.utils import get_permission_conditions
+
+EXPORT_FORMATS = {
+	"ndjson": "application/x-ndjson",
+	"csv": "text/csv",
+}
+# rows serialized per chunk written to the response
+CHUNK_ROWS = 1000
+# MariaDB needs a LIMIT to accept an OFFSET
+NO_LIMIT = 18446744073709551615
+
+GL_EXPORT_FIELDS = [
+	"name",
+	"posting_date",
+	"account",
+	"party_type",
+	"party",
+	"voucher_type",
+	"voucher_no",
+	"against",
+	"cost_center",
+	"project",
+	"debit",
+	"credit",
+	"account_currency",
+	"debit_in_account_currency",
+	"credit_in_account_currency",
+	"remarks",
+]
+
+
+def export_report(report_type, filters, file_format="ndjson", compress=False, offset=0):
+	"""
+	Return a streaming response with the rows of a REPORT_MAPPING report
+
+	General Ledger rows are read straight from GL Entry through an unbuffered
+	cursor, so memory stays constant whatever the size of the ledger. The other
+	reports are computed by ERPNext in memory and only their output is streamed.
+
+	Args:
+		report_type (str): Key of REPORT_MAPPING
+		filters (dict): Report filters
+		file_format (str): ndjson or csv
+		compress (bool): gzip the stream
+		offset (int): Number of leading rows to skip, to resume an interrupted download
+	"""
+	if report_type not in REPORT_MAPPING:
+		frappe.throw(_("Invalid report type '{0}'").format(report_type))
+	if file_format not in EXPORT_FORMATS:
+		frappe.throw(_("Export format must be one of {0}").format(", ".join(EXPORT_FORMATS)))
+
+	filters = normalize_filters(filters)
+	offset = cint(offset)
+
+	if report_type == "general_ledger":
+		if not filters.get("company"):
+			frappe.throw(_("Company is required"))
+		frappe.has_permission("GL Entry", "read", throw=True)
+
+		columns = GL_EXPORT_FIELDS
+		permitted = get_permission_conditions("GL Entry")
+		rows = _stream_in_site_context(_gl_entry_rows, filters, offset, permitted)
+	else:
+		data = run_report(report_type, filters)
+		columns = [_get_fieldname(column) for column in data["columns"]]
+		rows = iter((data["result"] or [])[offset:])
+
+	stream = _serialize(rows, columns, file_format)
+	if compress:
+		stream = _gzip(stream)
+
+	filename = f"{report_type}.{file_format}" + (".gz" if compress else "")
+	response = Response(
+		stream,
+		mimetype="application/gzip" if compress else EXPORT_FORMATS[file_format],
+		direct_passthrough=True,
+	)
+	response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+	response.headers["X-Row-Offset"] = str(offset)
+
+	return response
+
+
+def _gl_entry_rows(filters, offset, permitted):
+	conditions = ["company = %(company)s", "is_cancelled = 0"]
+	values = {"company": filters["company"], "offset": offset, "limit": NO_LIMIT}
+
+	conditions += permitted[0]
+	values.update(permitted[1])
+
+	if filters.get("from_date"):
+		conditions.append("posting_date >= %(from_date)s")
+		values["from_date"] = filters["from_date"]
+	if filters.get("to_date"):
+		conditions.append("posting_date <= %(to_date)s")
+		values["to_date"] = filters["to_date"]
+	if filters.get("voucher_no"):
+		conditions.append("voucher_no = %(voucher_no)s")
+		values["voucher_no"] = filters["voucher_no"]
+	if filters.get("party_type"):
+		conditions.append("party_type = %(party_type)s")
+		values["party_type"] = filters["party_type"]
+
+	for field in ("account", "party", "cost_center", "project"):
+		if filters.get(field):
+			value = filters[field]
+			conditions.append(f"{field} in %({field})s")
+			values[field] = tuple(value) if isinstance(value, list | tuple) else (value,)
+
+	with frappe.db.unbuffered_cursor():
+		yield from frappe.db.sql(
+			f"""
+			select {", ".join(GL_EXPORT_FIELDS)}
+			from `tabGL Entry`
+			where {" and ".join(conditions)}
+			order by posting_date, creation, name
+			limit %(limit)s offset %(offset)s
+			""",
+			values,
+			as_dict=True,
+			as_iterator=True,
+		)
+
+
+def _stream_in_site_context(rows_fn, *args):
+	"""
+	Run a row generator inside its own site context
+
+	Werkzeug consumes the response after Frappe has torn down the request and
+	closed its database connection, so the generator reconnects as the same user.
+	"""
+	site, sites_path, user = frappe.local.site, frappe.local.sites_path, frappe.session.user
+
+	def generate():
+		frappe.init(site, sites_path=sites_path)
+		frappe.connect()
+		frappe.set_user(user)
+		try:
+			yield from rows_fn(*args)
+		except Exception:
+			frappe.log_error(frappe.get_traceback(), _("Report Export Error"))
+			raise
+		finally:
+			frappe.destroy()
+
+	return generate()
+
+
+def _serialize(rows, columns, file_format):
+	buffer = io.StringIO()
+	writer = csv.writer(buffer) if file_format == "csv" else None
+
+	if writer:
+		writer.writerow(columns)
+
+	count = 0
+	for row in rows:
+		if isinstance(row, dict):
+			row = row if not writer else [row.get(column) for column in columns]
+		elif not writer:
+			# old style reports may append values beyond their columns, those are dropped
+			row = dict(zip(columns, row, strict=False))
+
+		if writer:
+			writer.writerow(row)
+		else:
+			buffer.write(json.dumps(row, default=str))
+			buffer.write("\n")
+
+		count += 1
+		if count % CHUNK_ROWS == 0:
+			yield buffer.getvalue()
+			buffer.seek(0)
+			buffer.truncate()
+
+	if buffer.tell():
+		yield buffer.getvalue()
+
+
+def _gzip(stream):
+	compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+
+	for chunk in stream:
+		data = compressor.compress(chunk.encode())
+		if data:
+			yield data
+
+	yield compressor.flush()
+
+
+def _get_fieldname(column):
+	if isinstance(column, dict):
+		return column.get("fieldname") or frappe.scrub(column.get("label") or "")
+
+	# old style "Label:Fieldtype/Options:Width" columns
+	return frappe.scrub(column.split(":")[0])
@@ -83,7 +83,7 @@ app_license = "mit"
 # ------------
 
 # before_install = "marka_account_integration.install.before_install"
-# after_install = "marka_account_integration.install.after_install"
+after_install = "marka_account_integration.install.after_install"
 
 # Uninstallation
 # ------------
@@ -145,6 +145,71 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"Customer": {
+		"on_update": "marka_account_integration.payments.invalidate_party_account_cache",
+		"after_rename": [
+			"marka_account_integration.masters.invalidate_master_cache",
+			"marka_account_integration.payments.invalidate_party_account_cache",
+		],
+		"on_trash": [
+			"marka_account_integration.masters.invalidate_master_cache",
+			"marka_account_integration.payments.invalidate_party_account_cache",
+		],
+	},
+	"Supplier": {
+		"on_update": "marka_account_integration.payments.invalidate_party_account_cache",
+		"after_rename": [
+			"marka_account_integration.masters.invalidate_master_cache",
+			"marka_account_integration.payments.invalidate_party_account_cache",
+		],
+		"on_trash": [
+			"marka_account_integration.masters.invalidate_master_cache",
+			"marka_account_integration.payments.invalidate_party_account_cache",
+		],
+	},
+	"Item": {
+		"after_rename": "marka_account_integration.masters.invalidate_master_cache",
+		"on_trash": "marka_account_integration.masters.invalidate_master_cache",
+	},
+	"Account": {
+		"on_update": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"after_rename": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"on_trash": "marka_account_integration.payments.invalidate_payment_account_cache",
+	},
+	"Mode of Payment": {
+		"on_update": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"after_rename": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"on_trash": "marka_account_integration.payments.invalidate_payment_account_cache",
+	},
+	"Company": {
+		"on_update": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"after_rename": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"on_trash": "marka_account_integration.payments.invalidate_payment_account_cache",
+	},
+	"Customer Group": {
+		"on_update": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"after_rename": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"on_trash": "marka_account_integration.payments.invalidate_payment_account_cache",
+	},
+	"Supplier Group": {
+		"on_update": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"after_rename": "marka_account_integration.payments.invalidate_payment_account_cache",
+		"on_trash": "marka_account_integration.payments.invalidate_payment_account_cache",
+	},
+	"Currency Exchange": {
+		"on_update": "marka_account_integration.payments.invalidate_exchange_rate_cache",
+		"after_rename": "marka_account_integration.payments.invalidate_exchange_rate_cache",
+		"on_trash": "marka_account_integration.payments.invalidate_exchange_rate_cache",
+	},
+	"GL Entry": {
+		"after_insert": [
+			"marka_account_integration.reports.invalidate_company_reports",
+			"marka_account_integration.balances.update_account_balance",
+		],
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -166,6 +231,21 @@ app_license = "mit"
 # 	],
 # }
 
+scheduler_events = {
+	"daily_long": [
+		"marka_account_integration.tasks.prewarm_reports",
+		"marka_account_integration.balances.reconcile_account_balances",
+	],
+	"hourly_long": [
+		"marka_account_integration.tasks.prewarm_reports_after_posting",
+	],
+	"cron": {
+		"*/10 * * * *": [
+			"marka_account_integration.submissions.schedule_submissions",
+		],
+	},
+}
+
 # Testing
 # -------
 
@@ -242,3 +322,6 @@ app_license = "mit"
 # 	"Logging DocType Name": 30  # days to retain logs
 # }
 
+default_log_clearing_doctypes = {
+	"Merka Report Prewarm Log": 30,
+}
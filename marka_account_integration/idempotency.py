@@ -0,0 +1,112 @@
+import functools
+import hashlib
+import json
+import pickle
+import time
+
+import frappe
+from frappe import _
+
+from marka_account_integration.utils import accept_arguments, bind_arguments
+
+KEY_PREFIX = "marka_idempotency"
+# how long a stored response is replayed for retries of the same key
+RESULT_TTL = 24 * 60 * 60
+# upper bound for a crashed worker to hold a key before another call may take over
+LOCK_TTL = 10 * 60
+WAIT_TIMEOUT = 120
+POLL_INTERVAL = 0.25
+
+
+def idempotent(fn):
+	"""
+	Deduplicate calls of the decorated endpoint sharing an `idempotency_key`
+
+	The first successful result is stored in Redis once its transaction commits and
+	replayed for any later call with the same key, user and endpoint. A duplicate that
+	arrives while the first call is still running waits for its result instead of
+	running again. Error results are not stored, so a failed call can be retried.
+
+	The key is bound to the payload of the call that took it. Reusing it with a
+	different payload returns an error with HTTP status 409 instead of the stored result.
+	"""
+	endpoint = fn.__name__
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		idempotency_key = kwargs.pop("idempotency_key", None)
+		if not idempotency_key:
+			return fn(*args, **kwargs)
+
+		digest = hashlib.sha256(str(idempotency_key).encode()).hexdigest()
+		result_key = frappe.cache.make_key(f"{KEY_PREFIX}|{frappe.session.user}|{endpoint}|{digest}")
+		lock_key = f"{result_key}|lock"
+		fingerprint = get_fingerprint(bind_arguments(fn, args, kwargs))
+
+		deadline = time.monotonic() + WAIT_TIMEOUT
+		while True:
+			stored = frappe.cache.get(result_key)
+			if stored is not None:
+				stored_fingerprint, result = pickle.loads(stored)
+				return result if stored_fingerprint == fingerprint else _payload_mismatch()
+
+			if frappe.cache.set(lock_key, fingerprint, nx=True, ex=LOCK_TTL):
+				break
+
+			running = frappe.cache.get(lock_key)
+			if running is not None and running.decode() != fingerprint:
+				return _payload_mismatch()
+
+			if time.monotonic() > deadline:
+				return {
+					"status": "error",
+					"message": _("A request with this idempotency key is still in progress"),
+				}
+
+			time.sleep(POLL_INTERVAL)
+
+		try:
+			result = fn(*args, **kwargs)
+		except Exception:
+			frappe.cache.delete(lock_key)
+			raise
+
+		if isinstance(result, dict) and result.get("status") == "error":
+			frappe.cache.delete(lock_key)
+			return result
+
+		def store_result():
+			frappe.cache.set(result_key, pickle.dumps((fingerprint, result)), ex=RESULT_TTL)
+			frappe.cache.delete(lock_key)
+
+		frappe.db.after_commit.add(store_result)
+		frappe.db.after_rollback.add(lambda: frappe.cache.delete(lock_key))
+
+		return result
+
+	accept_arguments(wrapper, fn, "idempotency_key")
+	return wrapper
+
+
+def get_fingerprint(kwargs):
+	"""Hash of a call's arguments that does not depend on key order or on JSON being sent as a string"""
+	payload = {key: _parse(value) for key, value in kwargs.items() if key != "cmd"}
+	return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _parse(value):
+	if isinstance(value, str) and value[:1] in ("[", "{"):
+		try:
+			return json.loads(value)
+		except ValueError:
+			pass
+
+	return value
+
+
+def _payload_mismatch():
+	frappe.local.response["http_status_code"] = 409
+	return {
+		"status": "error",
+		"message": _("This idempotency key was already used with a different payload"),
+	}
@@ -0,0 +1,372 @@
+import csv
+import gzip
+import json
+import time
+from itertools import dropwhile, islice
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt
+from frappe.utils.background_jobs import is_job_enqueued
+
+from marka_account_integration.documents import (
+	create_batch_journal_entry,
+	create_batch_payment_entry,
+	create_batch_purchase_invoice,
+	create_batch_sales_invoice,
+)
+from marka_account_integration.jobs import get_job_queue
+from marka_account_integration.journals import get_journal_masters
+from marka_account_integration.masters import resolve_customers, resolve_items, resolve_suppliers
+
+IMPORT_DOCTYPE = "Merka Data Import"
+LOG_DOCTYPE = "Merka Data Import Log"
+# child table collecting the rows of one document from consecutive csv lines
+CHILD_TABLES = {
+	"Sales Invoice": "items",
+	"Purchase Invoice": "items",
+	"Payment Entry": "references",
+	"Journal Entry": "accounts",
+}
+# csv column grouping consecutive lines into one document
+KEY_COLUMN = "id"
+DEFAULT_CHUNK_SIZE = 100
+# failures beyond this many are counted but not logged one by one
+MAX_LOGGED_ERRORS = 1000
+IMPORT_JOB_TIMEOUT = 6 * 60 * 60
+
+
+def start_import(import_type, file_url, chunk_size=None):
+	"""
+	Queue a csv or jsonl file for import as Sales Invoices, Purchase Invoices,
+	Payment Entries or Journal Entries
+
+	Returns:
+		Document: The queued Merka Data Import
+	"""
+	if import_type not in CHILD_TABLES:
+		frappe.throw(_("Import type must be one of {0}").format(", ".join(CHILD_TABLES)))
+
+	frappe.has_permission(import_type, "submit", throw=True)
+	_get_file_path(file_url)
+
+	data_import = frappe.new_doc(IMPORT_DOCTYPE)
+	data_import.import_type = import_type
+	data_import.import_file = file_url
+	data_import.chunk_size = cint(chunk_size) or DEFAULT_CHUNK_SIZE
+	data_import.insert(ignore_permissions=True)
+
+	_enqueue_import(data_import.name)
+	return data_import
+
+
+def resume_import(import_name):
+	"""Queue a failed or interrupted import again, it continues after its last committed chunk"""
+	status, import_type = frappe.db.get_value(IMPORT_DOCTYPE, import_name, ["status", "import_type"]) or (
+		None,
+		None,
+	)
+	if not status:
+		frappe.throw(_("{0} {1} does not exist").format(_(IMPORT_DOCTYPE), import_name))
+
+	frappe.has_permission(import_type, "submit", throw=True)
+
+	if status == "Completed":
+		frappe.throw(_("{0} is already completed").format(import_name))
+	if is_job_enqueued(_get_job_id(import_name)):
+		frappe.throw(_("{0} is already queued or running").format(import_name))
+
+	frappe.db.set_value(IMPORT_DOCTYPE, import_name, {"status": "Queued", "error": None})
+	_enqueue_import(import_name)
+
+
+def run_import(import_name):
+	"""
+	Background job streaming the file of a Merka Data Import into documents
+
+	The file is read line by line and flows through a generator pipeline, so only one
+	chunk of documents is held in memory at a time: parse lines, group them into
+	documents, cut those into chunks, then resolve the chunk's masters in bulk and
+	insert and submit each document inside a savepoint. Every chunk is committed
+	together with the number of lines it consumed, which is where a resumed import
+	starts reading again.
+	"""
+	data_import = frappe.get_doc(IMPORT_DOCTYPE, import_name)
+	if data_import.status == "Completed":
+		return
+
+	data_import.db_set("status", "Running", commit=True)
+	child_table = CHILD_TABLES[data_import.import_type]
+	path = _get_file_path(data_import.import_file)
+
+	try:
+		lines = dropwhile(lambda line: line[0] <= cint(data_import.lines_processed), _read_lines(path))
+		documents = _group_lines(lines, child_table, path_is_csv=_is_csv(path))
+
+		for chunk in _chunk(documents, cint(data_import.chunk_size) or DEFAULT_CHUNK_SIZE):
+			start = time.monotonic()
+			results = _import_chunk(data_import.import_type, chunk)
+			_save_progress(import_name, chunk, results, time.monotonic() - start)
+			frappe.db.commit()
+
+		frappe.db.set_value(IMPORT_DOCTYPE, import_name, "status", "Completed")
+	except Exception:
+		frappe.db.rollback()
+		frappe.db.set_value(
+			IMPORT_DOCTYPE, import_name, {"status": "Failed", "error": frappe.get_traceback()}
+		)
+		frappe.log_error(frappe.get_traceback(), _("Data Import Error"))
+
+	frappe.db.commit()
+
+
+def get_import_status(import_name):
+	"""Progress and throughput of a Merka Data Import, with its first logged failures"""
+	status = frappe.db.get_value(
+		IMPORT_DOCTYPE,
+		import_name,
+		[
+			"name",
+			"import_type",
+			"status",
+			"lines_processed",
+			"documents_imported",
+			"documents_failed",
+			"duration",
+			"documents_per_second",
+			"error",
+		],
+		as_dict=True,
+	)
+	if not status:
+		frappe.throw(_("{0} {1} does not exist").format(_(IMPORT_DOCTYPE), import_name))
+
+	status.failures = frappe.get_all(
+		LOG_DOCTYPE,
+		filters={"parent": import_name, "parenttype": IMPORT_DOCTYPE},
+		fields=["line", "message"],
+		order_by="idx",
+		limit=100,
+	)
+	return status
+
+
+def _read_lines(path):
+	"""
+	Yield (line number, record) for every non empty line of a csv or jsonl file, gzipped or not
+
+	A line that cannot be parsed is yielded as a ValueError in place of its record, so
+	it is logged as a failure like any other instead of stopping the import for good.
+	"""
+	opener = gzip.open if path.lower().endswith(".gz") else open
+
+	with opener(path, "rt", encoding="utf-8-sig", newline="") as f:
+		if _is_csv(path):
+			# line numbers count records, a quoted value may span several physical lines
+			for number, record in enumerate(csv.DictReader(f), start=1):
+				if None in record:
+					# DictReader keeps the values beyond the header under the key None
+					record = ValueError(_("Line {0} has more values than there are columns").format(number))
+				yield number, record
+			return
+
+		for number, line in enumerate(f, start=1):
+			if not line.strip():
+				continue
+
+			try:
+				record = json.loads(line)
+			except ValueError as e:
+				record = ValueError(_("Line {0} is not valid JSON: {1}").format(number, e))
+			else:
+				if not isinstance(record, dict):
+					record = ValueError(_("Line {0} is not a JSON object").format(number))
+
+			yield number, record
+
+
+def _group_lines(lines, child_table, path_is_csv):
+	"""
+	Yield (last line number, document payload) from parsed lines
+
+	A jsonl line is a whole document in the format of the create endpoints. Csv
+	lines sharing the same id column form one document: plain columns are read from
+	its first line and columns named like items.item_code make one child row per line.
+	Lines that could not be parsed are passed on as they are, ending the current document.
+	"""
+	if not path_is_csv:
+		for number, record in lines:
+			if not isinstance(record, ValueError):
+				try:
+					record[child_table] = frappe.parse_json(record.get(child_table)) or []
+				except ValueError as e:
+					record = ValueError(_("Line {0}: invalid {1}: {2}").format(number, child_table, e))
+			yield number, record
+		return
+
+	key = document = None
+	last_number = 0
+
+	for number, record in lines:
+		if isinstance(record, ValueError):
+			if document is not None:
+				yield last_number, document
+			key = document = None
+			yield number, record
+			continue
+
+		values, child = {}, {}
+		for column, value in record.items():
+			if value is None or value == "":
+				continue
+			table, _dot, fieldname = column.partition(".")
+			if fieldname and table == child_table:
+				child[fieldname] = value
+			elif not fieldname:
+				values[column] = value
+
+		record_key = values.pop(KEY_COLUMN, None)
+		if document is None or not record_key or record_key != key:
+			if document is not None:
+				yield last_number, document
+			key, document = record_key, {**values, child_table: []}
+
+		if child:
+			document[child_table].append(child)
+		last_number = number
+
+	if document is not None:
+		yield last_number, document
+
+
+def _chunk(documents, size):
+	documents = iter(documents)
+	while chunk := list(islice(documents, size)):
+		yield chunk
+
+
+def _import_chunk(import_type, chunk):
+	"""Return one result per document of a chunk, lines that could not be parsed fail as they are"""
+	parsed = [(number, document) for number, document in chunk if isinstance(document, dict)]
+	created = iter(_create_documents(import_type, parsed) if parsed else [])
+
+	return [
+		next(created)
+		if isinstance(document, dict)
+		else {"index": number, "status": "error", "message": str(document)}
+		for number, document in chunk
+	]
+
+
+def _create_documents(import_type, chunk):
+	"""Resolve the masters of a chunk in bulk, then create its documents one savepoint each"""
+	master_errors = {}
+	documents = [document for _number, document in chunk]
+
+	if import_type in ("Sales Invoice", "Purchase Invoice"):
+		party_field, resolve, create = {
+			"Sales Invoice": ("customer", resolve_customers, create_batch_sales_invoice),
+			"Purchase Invoice": ("supplier", resolve_suppliers, create_batch_purchase_invoice),
+		}[import_type]
+		parties = resolve([document.get(party_field) for document in documents], errors=master_errors)
+		item_codes = resolve_items(
+			[item for document in documents for item in document["items"]], errors=master_errors
+		)
+		return [create(number, document, parties, item_codes, master_errors) for number, document in chunk]
+
+	if import_type == "Payment Entry":
+		parties = {
+			party_type: resolve(
+				[document.get("party") for document in documents if document.get("party_type") == party_type],
+				errors=master_errors,
+			)
+			for party_type, resolve in (("Customer", resolve_customers), ("Supplier", resolve_suppliers))
+		}
+		return [
+			create_batch_payment_entry(number, document, parties, master_errors) for number, document in chunk
+		]
+
+	masters = get_journal_masters(documents)
+	return [create_batch_journal_entry(number, document, masters) for number, document in chunk]
+
+
+def _save_progress(import_name, chunk, results, duration):
+	"""Checkpoint a chunk in the same transaction as its documents"""
+	progress = frappe.db.get_value(
+		IMPORT_DOCTYPE,
+		import_name,
+		["documents_imported", "documents_failed", "duration"],
+		as_dict=True,
+		for_update=True,
+	)
+	imported = cint(progress.documents_imported)
+	failed = cint(progress.documents_failed)
+
+	for result in results:
+		if result["status"] == "success":
+			imported += 1
+			continue
+
+		failed += 1
+		if failed <= MAX_LOGGED_ERRORS:
+			log = frappe.new_doc(LOG_DOCTYPE)
+			log.update(
+				{
+					"parent": import_name,
+					"parenttype": IMPORT_DOCTYPE,
+					"parentfield": "failures",
+					"idx": failed,
+					# a document is reported under the line it ends on
+					"line": result["index"],
+					"message": result["message"],
+				}
+			)
+			log.db_insert()
+
+	duration = flt(progress.duration) + duration
+	frappe.db.set_value(
+		IMPORT_DOCTYPE,
+		import_name,
+		{
+			"lines_processed": chunk[-1][0],
+			"documents_imported": imported,
+			"documents_failed": failed,
+			"duration": flt(duration, 3),
+			"documents_per_second": flt((imported + failed) / duration, 2) if duration else 0,
+		},
+	)
+
+
+def _get_file_path(file_url):
+	if not file_url:
+		frappe.throw(_("Import file is required"))
+
+	file_name = frappe.db.get_value("File", {"file_url": file_url}, "name")
+	if not file_name:
+		frappe.throw(_("File {0} does not exist").format(file_url))
+
+	path = frappe.get_doc("File", file_name).get_full_path()
+	if not _is_csv(path) and not path.lower().removesuffix(".gz").endswith((".jsonl", ".ndjson")):
+		frappe.throw(_("Import file must be a .csv, .jsonl or .ndjson file, optionally gzipped"))
+
+	return path
+
+
+def _is_csv(path):
+	return path.lower().removesuffix(".gz").endswith(".csv")
+
+
+def _enqueue_import(import_name):
+	frappe.enqueue(
+		"marka_account_integration.imports.run_import",
+		queue=get_job_queue(),
+		timeout=IMPORT_JOB_TIMEOUT,
+		job_id=_get_job_id(import_name),
+		deduplicate=True,
+		enqueue_after_commit=True,
+		import_name=import_name,
+	)
+
+
+def _get_job_id(import_name):
+	return f"marka_data_import::{import_name}"
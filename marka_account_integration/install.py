@@ -0,0 +1,6 @@
+from marka_account_integration.balances import rebuild_account_balances
+
+
+def after_install():
+	# Frappe marks every patch as applied on a fresh install, so the backfill patch never runs there
+	rebuild_account_balances()
@@ -0,0 +1,111 @@
+import functools
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+from frappe.utils.background_jobs import get_job, get_queue_list
+
+from marka_account_integration.utils import accept_arguments, bind_arguments
+
+# Dedicated worker queue, configure it under "workers" in common_site_config.json.
+# Jobs fall back to the long queue on benches where it is not set up.
+JOB_QUEUE = "marka_accounts"
+FALLBACK_QUEUE = "long"
+JOB_TIMEOUT = 1500
+STATUS_KEY = "marka_api_job"
+STATUS_TTL = 24 * 60 * 60
+
+
+def supports_async(fn):
+	"""
+	Run the decorated endpoint in a background job when called with `async=1`
+
+	The call is queued with frappe.enqueue and the job id is returned right away.
+	The job stores the same result dict the synchronous call would have returned,
+	readable through api.get_job_status.
+	"""
+	method = f"{fn.__module__}.{fn.__name__}"
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		if not cint(kwargs.pop("async", 0)):
+			return fn(*args, **kwargs)
+
+		return enqueue_api_call(method, bind_arguments(fn, args, kwargs))
+
+	accept_arguments(wrapper, fn, "async")
+	return wrapper
+
+
+def enqueue_api_call(method, kwargs):
+	"""Queue a whitelisted api method and return the queued response"""
+	kwargs.pop("cmd", None)
+	job_id = frappe.generate_hash(length=16)
+
+	_set_status(job_id, "queued")
+	frappe.enqueue(
+		"marka_account_integration.jobs.run_api_call",
+		queue=get_job_queue(),
+		timeout=JOB_TIMEOUT,
+		job_id=job_id,
+		api_job_id=job_id,
+		api_method=method,
+		api_kwargs=kwargs,
+	)
+
+	return {
+		"status": "queued",
+		"message": _("Request queued for background processing"),
+		"job_id": job_id,
+	}
+
+
+def run_api_call(api_job_id, api_method, api_kwargs):
+	"""Background job executing a queued api call and storing its result"""
+	_set_status(api_job_id, "started")
+
+	# lets metrics tell the background run apart from the call that queued it
+	frappe.local.marka_api_job = True
+	try:
+		result = frappe.get_attr(api_method)(**api_kwargs)
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), _("Background API Call Error"))
+		result = {"status": "error", "message": str(e)}
+	finally:
+		frappe.local.marka_api_job = False
+
+	_set_status(api_job_id, "finished", result)
+
+
+def get_status(job_id):
+	"""Return the stored status of a queued api call, or None when unknown or expired"""
+	status = frappe.cache.get_value(f"{STATUS_KEY}|{job_id}")
+	if not status or status["job_status"] == "finished":
+		return status
+
+	# a worker killed by a timeout never reports back, ask RQ instead
+	job = get_job(job_id)
+	if job and job.is_failed:
+		status["job_status"] = "failed"
+		status["result"] = {"status": "error", "message": _("Background job failed or timed out")}
+
+	return status
+
+
+def _set_status(job_id, job_status, result=None):
+	frappe.cache.set_value(
+		f"{STATUS_KEY}|{job_id}",
+		{
+			"job_id": job_id,
+			"job_status": job_status,
+			"user": frappe.session.user,
+			"modified": frappe.utils.now(),
+			"result": result,
+		},
+		expires_in_sec=STATUS_TTL,
+	)
+
+
+def get_job_queue():
+	"""Queue to run this app's background jobs on"""
+	return JOB_QUEUE if JOB_QUEUE in get_queue_list() else FALLBACK_QUEUE
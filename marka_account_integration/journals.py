@@ -0,0 +1,460 @@
+import json
+from collections import defaultdict
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, getdate, now, nowdate
+from frappe.utils.background_jobs import is_job_enqueued
+
+from marka_account_integration.jobs import get_job_queue
+
+# debit and credit totals may differ by this much from rounding
+BALANCE_TOLERANCE = 0.01
+# row fields copied as given onto the Journal Entry Account row
+ROW_FIELDS = [
+	"cost_center",
+	"party_type",
+	"party",
+	"user_remark",
+	"reference_type",
+	"reference_name",
+	"project",
+]
+
+BATCH_DOCTYPE = "Merka Journal Batch"
+VOUCHER_DOCTYPE = "Merka Journal Batch Voucher"
+# account rows per voucher of a journal batch, unless the caller picks another size
+BATCH_VOUCHER_ROWS = 500
+# a batch of tens of thousands of rows takes a while, resuming picks up after a timeout
+BATCH_JOB_TIMEOUT = 4 * 60 * 60
+
+
+def get_journal_masters(entries):
+	"""
+	Load the masters referenced anywhere in a batch of journal entries
+
+	Companies, accounts, cost centers, party types and the parties of each party
+	type are each checked with a single query, however many rows reference them.
+
+	Args:
+		entries (list): Journal entry payloads with company and accounts
+
+	Returns:
+		dict: Map of doctype to the set of referenced names that exist
+	"""
+	names = defaultdict(set)
+	parties = defaultdict(set)
+
+	for entry in entries:
+		if entry.get("company"):
+			names["Company"].add(entry["company"])
+
+		for row in entry.get("accounts") or []:
+			for doctype, fieldname in (
+				("Account", "account"),
+				("Cost Center", "cost_center"),
+				("Party Type", "party_type"),
+			):
+				if row.get(fieldname):
+					names[doctype].add(row[fieldname])
+
+			if row.get("party_type") and row.get("party"):
+				parties[row["party_type"]].add(row["party"])
+
+	masters = {doctype: _get_existing(doctype, values) for doctype, values in names.items()}
+
+	for party_type, values in parties.items():
+		if party_type in masters.get("Party Type", ()):
+			masters[party_type] = _get_existing(party_type, values)
+
+	return masters
+
+
+def build_journal_rows(accounts, masters=None):
+	"""
+	Validate the account rows of a Journal Entry and check that they balance
+
+	Args:
+		accounts (list): Rows as accepted by create_journal_entry
+		masters (dict, optional): Result of get_journal_masters, looked up for
+			these rows alone when not given
+
+	Returns:
+		tuple: Journal Entry Account rows, total debit and total credit
+	"""
+	if masters is None:
+		masters = get_journal_masters([{"accounts": accounts}])
+
+	rows = []
+	total_debit = 0
+	total_credit = 0
+
+	for entry in accounts:
+		account = entry.get("account")
+		if not account:
+			frappe.throw(_("Account is mandatory for each entry"))
+
+		if account not in masters.get("Account", ()):
+			frappe.throw(_("Account {0} does not exist").format(account))
+
+		if entry.get("cost_center") and entry["cost_center"] not in masters.get("Cost Center", ()):
+			frappe.throw(_("Cost Center {0} does not exist").format(entry["cost_center"]))
+
+		party_type, party = entry.get("party_type"), entry.get("party")
+		if party_type and party_type not in masters.get("Party Type", ()):
+			frappe.throw(_("Party Type {0} does not exist").format(party_type))
+
+		if party_type and party and party not in masters.get(party_type, ()):
+			frappe.throw(_("{0} {1} does not exist").format(_(party_type), party))
+
+		debit_amount = flt(entry.get("debit_in_account_currency", 0))
+		credit_amount = flt(entry.get("credit_in_account_currency", 0))
+
+		if debit_amount and credit_amount:
+			frappe.throw(_("Account {0}: Cannot have both debit and credit amounts").format(account))
+
+		if not debit_amount and not credit_amount:
+			frappe.throw(_("Account {0}: Either debit or credit amount is required").format(account))
+
+		total_debit += debit_amount
+		total_credit += credit_amount
+
+		rows.append(
+			{
+				"account": account,
+				"debit_in_account_currency": debit_amount,
+				"credit_in_account_currency": credit_amount,
+				**{fieldname: entry.get(fieldname) for fieldname in ROW_FIELDS},
+			}
+		)
+
+	if abs(total_debit - total_credit) > BALANCE_TOLERANCE:
+		frappe.throw(
+			_("Total debit amount ({0}) must equal total credit amount ({1})").format(
+				total_debit, total_credit
+			)
+		)
+
+	return rows, total_debit, total_credit
+
+
+def build_journal_entry(
+	company, rows, posting_date=None, voucher_type="Journal Entry", user_remark=None, **kwargs
+):
+	"""
+	Build an unsaved Journal Entry
+
+	Args:
+		company (str): Company name
+		rows (list): Validated account rows, as returned by build_journal_rows
+	"""
+	doc = frappe.new_doc("Journal Entry")
+	doc.company = company
+	doc.posting_date = posting_date or now()
+	doc.voucher_type = voucher_type
+	doc.user_remark = user_remark
+
+	for key, value in kwargs.items():
+		if hasattr(doc, key):
+			setattr(doc, key, value)
+
+	for row in rows:
+		doc.append("accounts", row)
+
+	return doc
+
+
+def create_journal_batch(
+	company,
+	accounts,
+	posting_date=None,
+	voucher_type="Journal Entry",
+	voucher_rows=None,
+	bridge_account=None,
+	reference=None,
+	**kwargs,
+):
+	"""
+	Validate a very large Journal Entry and queue it for posting as a Merka Journal Batch
+
+	The rows are posted by post_journal_batch in vouchers of voucher_rows rows. Each
+	voucher is balanced with a row on the bridge account, which nets to zero over
+	the whole batch as the entry itself balances, and carries the batch reference
+	as its Reference Number.
+
+	Args:
+		bridge_account (str, optional): Defaults to the company's Temporary account
+		reference (str, optional): Common reference of the vouchers, defaults to the batch name
+		**kwargs: Header fields set on every voucher, as accepted by build_journal_entry
+
+	Returns:
+		Document: The queued Merka Journal Batch
+	"""
+	frappe.has_permission("Journal Entry", "submit", throw=True)
+
+	if not frappe.db.exists("Company", company):
+		frappe.throw(_("Company {0} does not exist").format(company))
+
+	if not accounts or len(accounts) < 2:
+		frappe.throw(_("At least 2 account entries are required for Journal Entry"))
+
+	voucher_rows = cint(voucher_rows) or BATCH_VOUCHER_ROWS
+	if voucher_rows < 2:
+		frappe.throw(_("A voucher needs at least 2 rows"))
+
+	bridge_account = bridge_account or frappe.db.get_value(
+		"Account", {"company": company, "account_type": "Temporary", "is_group": 0}, "name"
+	)
+	if not bridge_account:
+		frappe.throw(_("Please set bridge_account, company {0} has no Temporary account").format(company))
+
+	if frappe.db.get_value("Account", bridge_account, ["company", "is_group"]) != (company, 0):
+		frappe.throw(_("Bridge account {0} must be a ledger of company {1}").format(bridge_account, company))
+
+	rows, total_debit, total_credit = build_journal_rows(accounts)
+	# the vouchers post every row rounded to the currency precision, any difference
+	# left between those would stay on the bridge account
+	precision = _get_amount_precision()
+	total_debit = flt(sum(flt(row["debit_in_account_currency"], precision) for row in rows), precision)
+	total_credit = flt(sum(flt(row["credit_in_account_currency"], precision) for row in rows), precision)
+	if total_debit != total_credit:
+		frappe.throw(
+			_("Total debit amount ({0}) must equal total credit amount ({1})").format(
+				total_debit, total_credit
+			)
+		)
+
+	if any(row["account"] == bridge_account for row in rows):
+		# its rows would be indistinguishable from the balancing rows in the summary
+		frappe.throw(_("Bridge account {0} cannot be used in the entry itself").format(bridge_account))
+
+	batch = frappe.new_doc(BATCH_DOCTYPE)
+	batch.company = company
+	batch.posting_date = getdate(posting_date or nowdate())
+	batch.voucher_type = voucher_type
+	batch.reference = reference
+	batch.bridge_account = bridge_account
+	batch.voucher_rows = voucher_rows
+	batch.total_rows = len(rows)
+	batch.total_debit = total_debit
+	batch.total_credit = total_credit
+	batch.payload = json.dumps({"rows": rows, "values": kwargs}, default=str)
+	batch.insert(ignore_permissions=True)
+
+	if not batch.reference:
+		batch.db_set("reference", batch.name)
+
+	_enqueue_journal_batch(batch.name)
+	return batch
+
+
+def resume_journal_batch(batch_name):
+	"""Queue a failed or interrupted batch again, it continues after its last posted voucher"""
+	frappe.has_permission("Journal Entry", "submit", throw=True)
+
+	status = frappe.db.get_value(BATCH_DOCTYPE, batch_name, "status")
+	if not status:
+		frappe.throw(_("{0} {1} does not exist").format(_(BATCH_DOCTYPE), batch_name))
+	if status == "Completed":
+		frappe.throw(_("{0} is already completed").format(batch_name))
+	if is_job_enqueued(_get_job_id(batch_name)):
+		frappe.throw(_("{0} is already queued or running").format(batch_name))
+
+	frappe.db.set_value(BATCH_DOCTYPE, batch_name, {"status": "Queued", "error": None})
+	_enqueue_journal_batch(batch_name)
+
+
+def post_journal_batch(batch_name):
+	"""
+	Background job posting the remaining vouchers of a Merka Journal Batch
+
+	Every voucher is committed together with the batch checkpoint, so a failure or a
+	killed worker leaves the batch exactly after the last posted voucher.
+	"""
+	batch = frappe.get_doc(BATCH_DOCTYPE, batch_name)
+	if batch.status == "Completed":
+		return
+
+	payload = json.loads(batch.payload)
+	batch.db_set("status", "Running", commit=True)
+
+	try:
+		while _post_next_voucher(batch, payload["rows"], payload["values"]):
+			frappe.db.commit()
+
+		summary = get_journal_batch_summary(batch_name)
+		if summary["balanced"]:
+			frappe.db.set_value(BATCH_DOCTYPE, batch_name, "status", "Completed")
+		else:
+			frappe.db.set_value(
+				BATCH_DOCTYPE,
+				batch_name,
+				{"status": "Failed", "error": _("Posted vouchers do not add up to the batch totals")},
+			)
+	except Exception:
+		frappe.db.rollback()
+		frappe.db.set_value(BATCH_DOCTYPE, batch_name, {"status": "Failed", "error": frappe.get_traceback()})
+		frappe.log_error(frappe.get_traceback(), _("Journal Batch Posting Error"))
+
+	frappe.db.commit()
+
+
+def get_journal_batch_summary(batch_name):
+	"""
+	Progress of a batch, with its totals recomputed from the submitted vouchers
+
+	balanced is set once every row is posted, the vouchers debit and credit exactly
+	the batch totals outside the bridge account and the bridge account nets to zero.
+	"""
+	batch = frappe.db.get_value(
+		BATCH_DOCTYPE,
+		batch_name,
+		[
+			"name",
+			"status",
+			"company",
+			"reference",
+			"bridge_account",
+			"total_rows",
+			"next_row",
+			"total_debit",
+			"total_credit",
+			"error",
+		],
+		as_dict=True,
+	)
+	if not batch:
+		frappe.throw(_("{0} {1} does not exist").format(_(BATCH_DOCTYPE), batch_name))
+
+	vouchers = frappe.get_all(
+		VOUCHER_DOCTYPE,
+		filters={"parent": batch_name, "parenttype": BATCH_DOCTYPE},
+		fields=["journal_entry", "from_row", "to_row", "debit", "credit", "bridge_amount"],
+		order_by="idx",
+	)
+
+	posted_debit, posted_credit, bridge_balance = frappe.db.sql(
+		"""
+		select
+			coalesce(sum(case when jea.account != %(bridge_account)s then jea.debit_in_account_currency end), 0),
+			coalesce(sum(case when jea.account != %(bridge_account)s then jea.credit_in_account_currency end), 0),
+			coalesce(sum(case when jea.account = %(bridge_account)s
+				then jea.debit_in_account_currency - jea.credit_in_account_currency end), 0)
+		from `tabJournal Entry Account` jea
+		join `tabJournal Entry` je on je.name = jea.parent
+		join `tabMerka Journal Batch Voucher` voucher on voucher.journal_entry = je.name
+		where voucher.parent = %(batch)s and voucher.parenttype = %(batch_doctype)s and je.docstatus = 1
+		""",
+		{"bridge_account": batch.bridge_account, "batch": batch_name, "batch_doctype": BATCH_DOCTYPE},
+	)[0]
+
+	precision = _get_amount_precision()
+	batch.update(
+		{
+			"posted_debit": flt(posted_debit, precision),
+			"posted_credit": flt(posted_credit, precision),
+			"bridge_balance": flt(bridge_balance, precision),
+			"vouchers": vouchers,
+		}
+	)
+	batch.balanced = (
+		batch.next_row >= batch.total_rows
+		and batch.posted_debit == flt(batch.total_debit, precision)
+		and batch.posted_credit == flt(batch.total_credit, precision)
+		and not batch.bridge_balance
+	)
+
+	return batch
+
+
+def _post_next_voucher(batch, rows, values):
+	# the lock keeps a second worker from posting the same rows
+	start, posted_debit, posted_credit, bridge_balance = frappe.db.get_value(
+		BATCH_DOCTYPE,
+		batch.name,
+		["next_row", "posted_debit", "posted_credit", "bridge_balance"],
+		for_update=True,
+	)
+	if start >= len(rows):
+		return False
+
+	precision = _get_amount_precision()
+	chunk = rows[start : start + batch.voucher_rows]
+	debit = flt(sum(flt(row["debit_in_account_currency"]) for row in chunk), precision)
+	credit = flt(sum(flt(row["credit_in_account_currency"]) for row in chunk), precision)
+	bridge_amount = flt(credit - debit, precision)
+
+	voucher_rows = list(chunk)
+	if bridge_amount:
+		voucher_rows.append(
+			{
+				"account": batch.bridge_account,
+				"debit_in_account_currency": max(bridge_amount, 0),
+				"credit_in_account_currency": max(-bridge_amount, 0),
+				"user_remark": _("Balancing row of {0}").format(batch.reference),
+			}
+		)
+
+	number = start // batch.voucher_rows + 1
+	count = -(-len(rows) // batch.voucher_rows)
+	doc = build_journal_entry(batch.company, voucher_rows, batch.posting_date, batch.voucher_type, **values)
+	doc.cheque_no = batch.reference
+	doc.cheque_date = batch.posting_date
+	doc.user_remark = _("{0} (voucher {1} of {2} of {3})").format(
+		values.get("user_remark") or batch.reference, number, count, batch.name
+	)
+	doc.insert()
+	doc.submit()
+
+	voucher = frappe.new_doc(VOUCHER_DOCTYPE)
+	voucher.update(
+		{
+			"parent": batch.name,
+			"parenttype": BATCH_DOCTYPE,
+			"parentfield": "vouchers",
+			"idx": number,
+			"journal_entry": doc.name,
+			"from_row": start + 1,
+			"to_row": start + len(chunk),
+			"debit": debit,
+			"credit": credit,
+			"bridge_amount": bridge_amount,
+		}
+	)
+	voucher.db_insert()
+
+	frappe.db.set_value(
+		BATCH_DOCTYPE,
+		batch.name,
+		{
+			"next_row": start + len(chunk),
+			"posted_debit": flt(flt(posted_debit) + debit, precision),
+			"posted_credit": flt(flt(posted_credit) + credit, precision),
+			"bridge_balance": flt(flt(bridge_balance) + bridge_amount, precision),
+		},
+	)
+	return True
+
+
+def _enqueue_journal_batch(batch_name):
+	frappe.enqueue(
+		"marka_account_integration.journals.post_journal_batch",
+		queue=get_job_queue(),
+		timeout=BATCH_JOB_TIMEOUT,
+		job_id=_get_job_id(batch_name),
+		deduplicate=True,
+		enqueue_after_commit=True,
+		batch_name=batch_name,
+	)
+
+
+def _get_job_id(batch_name):
+	return f"marka_journal_batch::{batch_name}"
+
+
+def _get_amount_precision():
+	return frappe.get_precision("Journal Entry Account", "debit_in_account_currency") or 2
+
+
+def _get_existing(doctype, names):
+	return set(frappe.get_all(doctype, filters={"name": ["in", list(names)]}, pluck="name"))
@@ -0,0 +1,13 @@
+# Copyright (c) 2026, itsyosefali and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class MerkaAccountBalance(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Merka Account Balance", ["company", "posting_date"])
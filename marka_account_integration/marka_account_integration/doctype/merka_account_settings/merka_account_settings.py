@@ -1,9 +1,65 @@
 # Copyright (c) 2025, itsyosefali and contributors
 # For license information, please see license.txt
 
-# import frappe
+import time
+
+import frappe
 from frappe.model.document import Document
 
+from marka_account_integration.session_broker import invalidate_sessions
+
+SETTINGS_CACHE_KEY = "marka_account_settings"
+# workers other than the one saving the settings pick up changes within this many seconds
+LOCAL_CACHE_TTL = 30
+
+_local_snapshots = {}
+
 
 class MerkaAccountSettings(Document):
-	pass
+	def on_update(self):
+		clear_settings_cache()
+		# a worker reading between now and commit could cache the old values again
+		frappe.db.after_commit.add(clear_settings_cache)
+
+		changed_users = set()
+		if self.has_value_changed("user_email") or self.has_value_changed("user_password"):
+			changed_users.add((self.get_doc_before_save() or self).user_email)
+		if self.has_value_changed("hr_email") or self.has_value_changed("hr_password"):
+			changed_users.add((self.get_doc_before_save() or self).hr_email)
+
+		if changed_users:
+			invalidate_sessions(changed_users)
+
+
+def get_settings():
+	"""
+	Return a snapshot of Merka Account Settings
+
+	The snapshot is kept per process and in Redis, so reading it does not touch the
+	Singles table. It holds every field of the doctype, including child tables, and
+	must be treated as read-only. Password fields are left out so they never reach
+	Redis, use frappe.utils.password.get_decrypted_password to read one.
+	"""
+	site = frappe.local.site
+	cached = _local_snapshots.get(site)
+	if cached and cached[0] > time.monotonic():
+		return cached[1]
+
+	snapshot = frappe.cache.get_value(SETTINGS_CACHE_KEY, generator=_load_snapshot)
+	_local_snapshots[site] = (time.monotonic() + LOCAL_CACHE_TTL, snapshot)
+	return snapshot
+
+
+def clear_settings_cache():
+	_local_snapshots.pop(frappe.local.site, None)
+	frappe.cache.delete_value(SETTINGS_CACHE_KEY)
+
+
+def _load_snapshot():
+	doc = frappe.get_single("Merka Account Settings")
+	snapshot = frappe._dict(doc.as_dict(no_default_fields=True))
+
+	for df in doc.meta.get("fields", {"fieldtype": "Password"}):
+		snapshot.pop(df.fieldname, None)
+
+	return snapshot
@@ -1,9 +1,59 @@
 # Copyright (c) 2025, itsyosefali and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from marka_account_integration.marka_account_integration.doctype.merka_account_settings.merka_account_settings import (
+	clear_settings_cache,
+	get_settings,
+)
+from marka_account_integration.session_broker import BROKER_KEY, get_session_id
+
+TEST_USER = "merka-broker@example.com"
+TEST_PASSWORD = "Merka#Broker-2026"
+
 
 class TestMerkaAccountSettings(FrappeTestCase):
-	pass
+	def tearDown(self):
+		# the snapshot may hold settings of this test's transaction, which is never committed
+		clear_settings_cache()
+
+	def test_snapshot_leaves_out_passwords(self):
+		settings = frappe.get_single("Merka Account Settings")
+		settings.user_email = "Administrator"
+		settings.user_password = TEST_PASSWORD
+		settings.hr_email = "Administrator"
+		settings.hr_password = TEST_PASSWORD
+		settings.save()
+
+		snapshot = get_settings()
+
+		self.assertEqual(snapshot.user_email, "Administrator")
+		self.assertNotIn("user_password", snapshot)
+		self.assertNotIn("hr_password", snapshot)
+
+	def test_changed_credentials_end_brokered_session(self):
+		if not frappe.db.exists("User", TEST_USER):
+			frappe.get_doc(
+				{"doctype": "User", "email": TEST_USER, "first_name": "Merka Broker", "send_welcome_email": 0}
+			).insert(ignore_permissions=True)
+		frappe.get_doc("User", TEST_USER).update({"new_password": TEST_PASSWORD}).save(
+			ignore_permissions=True
+		)
+
+		settings = frappe.get_single("Merka Account Settings")
+		settings.user_email = TEST_USER
+		settings.user_password = TEST_PASSWORD
+		settings.save()
+
+		sid = get_session_id(TEST_USER, "user_password")
+		# publish the brokered session without committing the test's transaction
+		frappe.db.after_commit.run()
+		self.assertTrue(frappe.cache.hget("session", sid))
+
+		settings.user_email = "Administrator"
+		settings.save()
+
+		self.assertFalse(frappe.cache.hget("session", sid))
+		self.assertFalse(frappe.cache.hget(BROKER_KEY, TEST_USER))
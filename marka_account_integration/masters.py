@@ -0,0 +1,154 @@
+import pickle
+
+import frappe
+import redis
+from frappe import _
+
+# Redis hash per doctype mapping incoming values to existing master names
+CACHE_KEY = "marka_known_masters"
+INSERT_RETRIES = 3
+SAVEPOINT = "marka_master_insert"
+
+
+def resolve_customers(customer_names, errors=None):
+	"""
+	Resolve Customer names with one query, creating the missing ones
+
+	Args:
+		customer_names (list): Customer names, duplicates and blanks are ignored
+		errors (dict, optional): When given, creation failures are recorded here
+			keyed by (doctype, incoming value) instead of being raised, so one dict
+			can collect the failures of several doctypes
+
+	Returns:
+		dict: Map of incoming name to Customer name
+	"""
+	return _resolve("Customer", {name: {} for name in customer_names if name}, _new_customer, errors)
+
+
+def resolve_suppliers(supplier_names, errors=None):
+	"""Resolve Supplier names with one query, creating the missing ones"""
+	return _resolve("Supplier", {name: {} for name in supplier_names if name}, _new_supplier, errors)
+
+
+def resolve_items(items, errors=None):
+	"""
+	Resolve the item_code of every row with one query, creating the missing Items
+
+	Args:
+		items (list): Rows with item_code and optionally item_name and item_group
+		errors (dict, optional): Collects creation failures, see resolve_customers
+
+	Returns:
+		dict: Map of incoming item_code to Item name
+	"""
+	values = {}
+	for item in items:
+		if item.get("item_code") and item["item_code"] not in values:
+			values[item["item_code"]] = item
+
+	return _resolve("Item", values, _new_item, errors)
+
+
+def invalidate_master_cache(doc, method=None, *args, **kwargs):
+	"""doc_events handler dropping the cached names of a doctype on rename or delete"""
+	key = f"{CACHE_KEY}|{doc.doctype}"
+	frappe.cache.delete_value(key)
+	# a concurrent resolve can cache the old name again until the change commits, clear once more then
+	frappe.db.after_commit.add(lambda: frappe.cache.delete_value(key))
+
+
+def _resolve(doctype, values, make_doc, errors=None):
+	if not values:
+		return {}
+
+	resolved = _get_cached(doctype, list(values))
+	pending = [value for value in values if value not in resolved]
+
+	if pending:
+		existing = set(frappe.get_all(doctype, filters={"name": ["in", pending]}, pluck="name"))
+		found = {}
+
+		for value in pending:
+			if value in existing:
+				found[value] = value
+				continue
+
+			try:
+				found[value] = _insert_or_get(doctype, value, values[value], make_doc)
+			except Exception as e:
+				if errors is None:
+					raise
+				errors[(doctype, value)] = str(e)
+
+		resolved.update(found)
+		# only publish names once they are committed, a rollback must not leave ghosts behind
+		frappe.db.after_commit.add(lambda: _set_cached(doctype, found))
+
+	return resolved
+
+
+def _insert_or_get(doctype, value, details, make_doc):
+	"""Insert a master, or return the one a concurrent writer committed first"""
+	for _attempt in range(INSERT_RETRIES):
+		frappe.db.savepoint(SAVEPOINT)
+		try:
+			doc = make_doc(value, details)
+			doc.insert()
+		except (frappe.DuplicateEntryError, frappe.UniqueValidationError):
+			frappe.db.rollback(save_point=SAVEPOINT)
+
+			# a locking read sees the other transaction's committed row, a plain read would not
+			existing = frappe.db.get_value(doctype, value, "name", for_update=True)
+			if existing:
+				return existing
+		except Exception:
+			frappe.db.rollback(save_point=SAVEPOINT)
+			raise
+		else:
+			frappe.db.release_savepoint(SAVEPOINT)
+			return doc.name
+
+	frappe.throw(
+		_("Could not create {0} {1}, it kept conflicting with another request").format(_(doctype), value)
+	)
+
+
+def _get_cached(doctype, values):
+	"""Fetch cached names for all values in a single HMGET"""
+	try:
+		cached = frappe.cache.hmget(frappe.cache.make_key(f"{CACHE_KEY}|{doctype}"), values)
+	except redis.exceptions.ConnectionError:
+		return {}
+
+	return {value: pickle.loads(name) for value, name in zip(values, cached, strict=True) if name is not None}
+
+
+def _set_cached(doctype, names):
+	for value, name in names.items():
+		frappe.cache.hset(f"{CACHE_KEY}|{doctype}", value, name)
+
+
+def _new_customer(customer_name, details):
+	doc = frappe.new_doc("Customer")
+	doc.customer_name = customer_name
+	doc.customer_type = "Individual"
+	return doc
+
+
+def _new_supplier(supplier_name, details):
+	doc = frappe.new_doc("Supplier")
+	doc.supplier_name = supplier_name
+	doc.supplier_type = "Individual"
+	return doc
+
+
+def _new_item(item_code, details):
+	doc = frappe.new_doc("Item")
+	doc.item_code = item_code
+	doc.item_name = details.get("item_name") or item_code
+	doc.item_group = details.get("item_group") or "All Item Groups"
+	doc.is_stock_item = 1
+	doc.is_sales_item = 1
+	doc.is_purchase_item = 1
+	return doc
@@ -0,0 +1,180 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+import frappe
+from frappe.utils import cstr, flt
+
+from marka_account_integration.payments import (
+	allocate_payment,
+	get_allocation_precision,
+	get_outstanding_invoices,
+	get_party_account_details,
+	make_reference,
+)
+
+# how far a payment may be off an invoice's outstanding and still be its match
+DEFAULT_TOLERANCE = 0.05
+
+
+class PaymentMatcher:
+	"""
+	Open invoices of many parties, indexed to match incoming payments
+
+	All invoices of the given parties are loaded with one query and indexed per
+	party by invoice name and external reference, by exact amount, and in a sorted
+	amount list for near-exact lookups, so each payment is matched in logarithmic
+	time instead of being compared to every invoice. Allocations update the index,
+	so later payments of the same batch only see what is left outstanding.
+
+	Payments are matched, in order of preference:
+		reference: reference_no names an invoice or the reference quoted on it
+		exact: an untouched invoice has exactly the paid amount outstanding
+		near_exact: an untouched invoice is within the tolerance of the paid amount
+		oldest_first: no single invoice matches, the amount settles the oldest ones
+
+	A remainder after a reference or exact match also settles the oldest invoices.
+	"""
+
+	def __init__(self, company, party_type, parties, tolerance=DEFAULT_TOLERANCE):
+		self.precision = get_allocation_precision()
+		self.tolerance = flt(tolerance, self.precision)
+		self.parties = {}
+		# parties whose account could not be resolved, with the reason, see get_error
+		self.errors = {}
+
+		# unknown parties have no invoices, their payments fail when they are created
+		parties = frappe.get_all(
+			party_type, filters={"name": ["in", [party for party in parties if party]]}, pluck="name"
+		)
+		party_accounts = {}
+		for party in parties:
+			try:
+				party_accounts[party] = get_party_account_details(party_type, party, company)[0]
+			except Exception as e:
+				self.errors[party] = str(e)
+
+		for invoice in get_outstanding_invoices(party_type, list(party_accounts), company):
+			# a Payment Entry only settles invoices booked to the party's own account
+			if invoice.account != party_accounts[invoice.party]:
+				continue
+
+			invoice.outstanding_amount = flt(invoice.outstanding_amount, self.precision)
+			invoice.indexed_amount = invoice.outstanding_amount
+			self.parties.setdefault(invoice.party, _PartyIndex()).add(invoice)
+
+	def get_error(self, party):
+		"""Why the invoices of a party could not be indexed, or None"""
+		return self.errors.get(party)
+
+	def match(self, party, amount, reference_no=None):
+		"""
+		Allocate a payment against the open invoices of a party
+
+		Returns:
+			tuple: Match type, or None when nothing could be allocated, and the
+				Payment Entry reference rows
+		"""
+		amount = flt(amount, self.precision)
+		index = self.parties.get(party)
+		if not index or amount <= 0:
+			return None, []
+
+		match_type, invoice = "reference", index.by_reference.get(_normalize(reference_no))
+		if not invoice or invoice.outstanding_amount <= 0:
+			match_type, invoice = "exact", index.find(amount, 0)
+		if not invoice and self.tolerance:
+			match_type, invoice = "near_exact", index.find(amount, self.tolerance)
+
+		references = []
+		remaining = amount
+
+		if invoice:
+			allocated = min(amount, invoice.outstanding_amount)
+			references.append(make_reference(invoice, allocated))
+			remaining = flt(amount - allocated, self.precision)
+
+			# what a near-exact match leaves over is a difference, not a payment of other invoices
+			if match_type == "near_exact":
+				remaining = 0
+
+		if remaining > 0:
+			open_invoices = [
+				row for row in index.invoices if row is not invoice and row.outstanding_amount > 0
+			]
+			references.extend(allocate_payment(open_invoices, remaining))
+			match_type = match_type if invoice else "oldest_first"
+
+		if not references:
+			return None, []
+
+		self._apply(index, references, -1)
+		return match_type, references
+
+	def release(self, party, references):
+		"""Give allocations of a payment that could not be created back to its invoices"""
+		index = self.parties.get(party)
+		if index and references:
+			self._apply(index, references, 1)
+
+	def _apply(self, index, references, sign):
+		for ref in references:
+			invoice = index.by_name[ref["reference_name"]]
+			invoice.outstanding_amount = flt(
+				invoice.outstanding_amount + sign * ref["allocated_amount"], self.precision
+			)
+
+
+class _PartyIndex:
+	def __init__(self):
+		# oldest first, as returned by get_outstanding_invoices
+		self.invoices = []
+		self.by_name = {}
+		self.by_reference = {}
+		self.by_amount = defaultdict(list)
+		# (amount, position) pairs, sorted for range lookups
+		self.amounts = []
+
+	def add(self, invoice):
+		position = len(self.invoices)
+		self.invoices.append(invoice)
+		self.by_name[invoice.name] = invoice
+
+		for reference in (invoice.name, invoice.external_reference):
+			# a reference quoted on several invoices identifies none of them
+			key = _normalize(reference)
+			if key and self.by_reference.get(key, invoice) is not invoice:
+				self.by_reference[key] = None
+			elif key:
+				self.by_reference[key] = invoice
+
+		self.by_amount[invoice.indexed_amount].append(invoice)
+		insort(self.amounts, (invoice.indexed_amount, position))
+
+	def find(self, amount, tolerance):
+		"""Oldest untouched invoice whose outstanding is closest to amount, within tolerance"""
+		if not tolerance:
+			return next((invoice for invoice in self.by_amount.get(amount, ()) if _untouched(invoice)), None)
+
+		best = None
+		start = bisect_left(self.amounts, (amount - tolerance, -1))
+		for indexed_amount, position in self.amounts[start:]:
+			if indexed_amount > amount + tolerance:
+				break
+
+			invoice = self.invoices[position]
+			if not _untouched(invoice):
+				continue
+
+			distance = abs(indexed_amount - amount)
+			if best is None or distance < best[0] or (distance == best[0] and position < best[1]):
+				best = (distance, position)
+
+		return self.invoices[best[1]] if best else None
+
+
+def _untouched(invoice):
+	return invoice.outstanding_amount == invoice.indexed_amount
+
+
+def _normalize(reference):
+	return cstr(reference).strip().casefold()
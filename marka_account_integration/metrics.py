@@ -0,0 +1,171 @@
+import functools
+import time
+from bisect import bisect_left
+
+import frappe
+import redis
+from frappe.utils import cint
+
+from marka_account_integration.profiling import finish_profile, start_profile
+from marka_account_integration.utils import accept_arguments
+
+# fields are labelled by endpoint and mode, sync, enqueue (an async=1 call returning
+# its job id) or job (the background run of such a call)
+METRICS_KEY = "marka_api_request_metrics"
+# upper bounds of the histogram buckets, +Inf is implied
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+HISTOGRAMS = {
+	"duration": (
+		"marka_api_request_duration_seconds",
+		"Wall time of API endpoint calls",
+		DURATION_BUCKETS,
+	),
+	"queries": (
+		"marka_api_db_queries",
+		"Database queries run per API endpoint call",
+		QUERY_COUNT_BUCKETS,
+	),
+	"query_time": (
+		"marka_api_db_query_duration_seconds",
+		"Time spent in database queries per API endpoint call",
+		DURATION_BUCKETS,
+	),
+}
+
+
+def instrumented(fn):
+	"""
+	Record wall time, database queries and outcome of every call of the decorated endpoint
+
+	Queries are counted and timed by wrapping frappe.db.sql for the duration of the
+	outermost instrumented call, endpoints called by other endpoints are part of the
+	caller's numbers. Each observation is added to histograms kept in one Redis hash,
+	shared by all workers and exported by export_metrics.
+
+	An endpoint returning {"status": "error"} counts as an error, like one raising.
+	Calls with async=1 are recorded as mode "enqueue" and their background run as
+	mode "job", so the quick enqueue does not mix with the real work.
+	Calls sampled by the profiler configured in Merka Account Settings also run
+	under cProfile, see profiling.start_profile.
+	"""
+	endpoint = fn.__name__
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		if getattr(frappe.local, "marka_metrics_active", False):
+			return fn(*args, **kwargs)
+
+		if getattr(frappe.local, "marka_api_job", False):
+			mode = "job"
+		else:
+			mode = "enqueue" if cint(kwargs.get("async")) else "sync"
+
+		profiler = start_profile(endpoint)
+
+		queries = [0, 0.0]
+		sql = frappe.db.sql
+		frappe.db.sql = _counting(sql, queries)
+		frappe.local.marka_metrics_active = True
+
+		outcome = "error"
+		start = time.perf_counter()
+		try:
+			result = fn(*args, **kwargs)
+			if not (isinstance(result, dict) and result.get("status") == "error"):
+				outcome = "success"
+			return result
+		finally:
+			duration = time.perf_counter() - start
+			if profiler:
+				profiler.disable()
+
+			frappe.db.sql = sql
+			frappe.local.marka_metrics_active = False
+			_record(endpoint, mode, outcome, duration, *queries)
+
+			if profiler:
+				finish_profile(profiler, endpoint, duration, *queries)
+
+	accept_arguments(wrapper, fn)
+	return wrapper
+
+
+def export_metrics():
+	"""Return all recorded metrics of this site in the Prometheus text exposition format"""
+	pipeline = frappe.cache.pipeline()
+	pipeline.hgetall(frappe.cache.make_key(METRICS_KEY))
+	(stored,) = pipeline.execute()
+
+	counts, sums, buckets = {}, {}, {}
+	for field, value in stored.items():
+		parts = field.decode().split("|")
+		if parts[0] == "count":
+			counts[(parts[1], parts[2], parts[3])] = int(value)
+		elif parts[0] == "sum":
+			sums[(parts[1], parts[2], parts[3])] = float(value)
+		elif parts[0] == "bucket":
+			buckets[(parts[1], parts[2], parts[3], int(parts[4]))] = int(value)
+
+	site = frappe.local.site
+	lines = [
+		"# HELP marka_api_requests_total API endpoint calls by outcome",
+		"# TYPE marka_api_requests_total counter",
+	]
+	for (endpoint, mode, outcome), count in sorted(counts.items()):
+		lines.append(
+			f'marka_api_requests_total{{{_labels(site, endpoint, mode)},outcome="{outcome}"}} {count}'
+		)
+
+	series = sorted({(endpoint, mode) for endpoint, mode, _outcome in counts})
+	for metric, (name, description, bounds) in HISTOGRAMS.items():
+		lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+
+		for endpoint, mode in series:
+			labels = _labels(site, endpoint, mode)
+			# buckets are stored per bound, Prometheus wants them cumulative
+			cumulative = 0
+			for position, bound in enumerate((*bounds, "+Inf")):
+				cumulative += buckets.get((metric, endpoint, mode, position), 0)
+				lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+
+			lines.append(f"{name}_sum{{{labels}}} {sums.get((metric, endpoint, mode), 0)}")
+			lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+	return "\n".join(lines) + "\n"
+
+
+def _counting(sql, queries):
+	def counting_sql(*args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return sql(*args, **kwargs)
+		finally:
+			queries[0] += 1
+			queries[1] += time.perf_counter() - start
+
+	return counting_sql
+
+
+def _record(endpoint, mode, outcome, duration, query_count, query_time):
+	observations = {"duration": duration, "queries": query_count, "query_time": query_time}
+
+	try:
+		pipeline = frappe.cache.pipeline(transaction=False)
+		key = frappe.cache.make_key(METRICS_KEY)
+
+		pipeline.hincrby(key, f"count|{endpoint}|{mode}|{outcome}", 1)
+		for metric, value in observations.items():
+			bounds = HISTOGRAMS[metric][2]
+			pipeline.hincrby(key, f"bucket|{metric}|{endpoint}|{mode}|{bisect_left(bounds, value)}", 1)
+			pipeline.hincrbyfloat(key, f"sum|{metric}|{endpoint}|{mode}", value)
+
+		pipeline.execute()
+	except redis.exceptions.RedisError:
+		# metrics must never fail the call they describe
+		pass
+
+
+def _labels(site, endpoint, mode):
+	return f'site="{site}",endpoint="{endpoint}",mode="{mode}"'
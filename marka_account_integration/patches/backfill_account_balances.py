@@ -0,0 +1,7 @@
+from marka_account_integration.balances import rebuild_account_balances
+
+
+def execute():
+	# build the daily balance rows of sites that had the app before the snapshot existed,
+	# fresh installs are backfilled by after_install
+	rebuild_account_balances()
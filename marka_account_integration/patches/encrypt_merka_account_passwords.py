@@ -0,0 +1,9 @@
+import frappe
+
+
+def execute():
+	# the report and HR passwords used to be Data fields, saving moves the plaintext into __Auth
+	settings = frappe.get_single("Merka Account Settings")
+	if settings.user_password or settings.hr_password:
+		settings.flags.ignore_mandatory = True
+		settings.save(ignore_permissions=True)
@@ -0,0 +1,331 @@
+from collections import Counter, OrderedDict
+
+import erpnext
+import frappe
+from erpnext.accounts.party import get_party_account
+from erpnext.accounts.utils import get_account_currency
+from erpnext.setup.utils import get_exchange_rate
+from frappe import _
+from frappe.utils import flt, getdate
+
+# company|mode_of_payment -> default accounts and currencies
+ACCOUNT_CACHE_KEY = "marka_payment_accounts"
+# party_type|party -> {company: (party account, currency)}
+PARTY_ACCOUNT_CACHE_KEY = "marka_party_accounts"
+
+INVOICE_DOCTYPES = {"Customer": "Sales Invoice", "Supplier": "Purchase Invoice"}
+# reference the counterparty quotes back when paying
+INVOICE_REFERENCE_FIELDS = {"Sales Invoice": "po_no", "Purchase Invoice": "bill_no"}
+
+# one hash per generation and date, from|to -> rate, shared by all workers
+EXCHANGE_RATE_CACHE_KEY = "marka_exchange_rates"
+# hashes of past dates and generations expire once nothing reads them any more
+EXCHANGE_RATE_CACHE_TTL = 24 * 60 * 60
+# bumped when Currency Exchange changes, so cached rates of every worker go stale
+EXCHANGE_RATE_GENERATION_KEY = "marka_exchange_rate_generation"
+EXCHANGE_RATE_STATS_KEY = "marka_exchange_rate_stats"
+LOCAL_RATE_CACHE_SIZE = 1024
+
+_local_rates = OrderedDict()
+# site -> hit and miss counts not yet added to the shared counters
+_pending_counts = {}
+
+
+def get_payment_accounts(company, mode_of_payment=None):
+	"""
+	Return the accounts a Payment Entry of this company needs, resolved once and cached
+
+	The receivable/payable side is cached per party by get_party_account_details,
+	as parties and party groups may override the company default.
+
+	Returns:
+		dict: bank_account, bank_account_currency, company_currency and cost_center
+	"""
+	return frappe.cache.hget(
+		ACCOUNT_CACHE_KEY,
+		f"{company}|{mode_of_payment or ''}",
+		generator=lambda: _resolve_payment_accounts(company, mode_of_payment),
+	)
+
+
+def get_party_account_details(party_type, party, company):
+	"""Return the receivable/payable account of a party and its currency, cached"""
+	key = f"{party_type}|{party}"
+	accounts = frappe.cache.hget(PARTY_ACCOUNT_CACHE_KEY, key) or {}
+
+	if company not in accounts:
+		party_account = get_party_account(party_type, party, company)
+		accounts[company] = (party_account, get_account_currency(party_account))
+		frappe.cache.hset(PARTY_ACCOUNT_CACHE_KEY, key, accounts)
+
+	return accounts[company]
+
+
+def get_outstanding_invoices(party_type, party, company, party_account=None, invoice_names=None):
+	"""
+	Return the open invoices of one or more parties, oldest first, in one aggregate query
+
+	Outstanding amounts are summed from the Payment Ledger, the same source ERPNext
+	uses when it allocates payments, in the currency of the party account.
+
+	Args:
+		party (str | list): Party name, or several names of the same party_type
+		party_account (str, optional): Only consider invoices booked to this account,
+			otherwise each row carries its account
+		invoice_names (list, optional): Only consider these invoices
+	"""
+	parties = [party] if isinstance(party, str) else list(party)
+	if not parties:
+		return []
+
+	invoice_doctype = INVOICE_DOCTYPES[party_type]
+	conditions = []
+	values = {
+		"company": company,
+		"party_type": party_type,
+		"parties": tuple(parties),
+		"invoice_doctype": invoice_doctype,
+	}
+
+	if party_account:
+		conditions.append("and ple.account = %(account)s")
+		values["account"] = party_account
+
+	if invoice_names is not None:
+		if not invoice_names:
+			return []
+		conditions.append("and ple.against_voucher_no in %(invoice_names)s")
+		values["invoice_names"] = tuple(invoice_names)
+
+	reference_field = INVOICE_REFERENCE_FIELDS[invoice_doctype]
+
+	return frappe.db.sql(
+		f"""
+		select
+			ple.party,
+			ple.account,
+			ple.against_voucher_type as reference_doctype,
+			ple.against_voucher_no as name,
+			inv.posting_date,
+			inv.due_date,
+			inv.{reference_field} as external_reference,
+			coalesce(nullif(inv.rounded_total, 0), inv.grand_total) as total_amount,
+			sum(ple.amount_in_account_currency) as outstanding_amount
+		from `tabPayment Ledger Entry` ple
+		join `tab{invoice_doctype}` inv on inv.name = ple.against_voucher_no
+		where ple.company = %(company)s
+			and ple.party_type = %(party_type)s
+			and ple.party in %(parties)s
+			and ple.against_voucher_type = %(invoice_doctype)s
+			and ple.delinked = 0
+			and inv.docstatus = 1
+			{" ".join(conditions)}
+		group by ple.party, ple.account, ple.against_voucher_type, ple.against_voucher_no,
+			inv.posting_date, inv.due_date, inv.{reference_field}, inv.rounded_total, inv.grand_total
+		having sum(ple.amount_in_account_currency) > 0
+		order by inv.posting_date, inv.due_date, ple.against_voucher_no
+		""",
+		values,
+		as_dict=True,
+	)
+
+
+def allocate_payment(invoices, amount=None, requested=None):
+	"""
+	Spread an amount over outstanding invoices in the given order
+
+	Args:
+		invoices (list): Rows of get_outstanding_invoices
+		amount (float, optional): Amount to allocate, the whole outstanding when not given
+		requested (dict, optional): Invoice name to the amount to allocate to it,
+			invoices missing here get as much as is left
+
+	Returns:
+		list: Payment Entry reference rows
+	"""
+	precision = get_allocation_precision()
+	remaining = flt(amount, precision) if amount is not None else None
+	requested = requested or {}
+	references = []
+
+	for invoice in invoices:
+		if remaining is not None and remaining <= 0:
+			break
+
+		outstanding = flt(invoice.outstanding_amount, precision)
+		allocated = outstanding
+		if requested.get(invoice.name) is not None:
+			allocated = flt(requested[invoice.name], precision)
+			if allocated > outstanding:
+				frappe.throw(
+					_("Cannot allocate {0} to {1}, only {2} is outstanding").format(
+						allocated, invoice.name, outstanding
+					)
+				)
+
+		if remaining is not None:
+			allocated = min(allocated, remaining)
+			remaining = flt(remaining - allocated, precision)
+
+		if allocated <= 0:
+			continue
+
+		references.append(make_reference(invoice, allocated, outstanding))
+
+	return references
+
+
+def make_reference(invoice, allocated, outstanding=None):
+	"""Payment Entry reference row allocating an amount to a get_outstanding_invoices row"""
+	return {
+		"reference_doctype": invoice.reference_doctype,
+		"reference_name": invoice.name,
+		"due_date": invoice.due_date,
+		"total_amount": invoice.total_amount,
+		"outstanding_amount": invoice.outstanding_amount if outstanding is None else outstanding,
+		"allocated_amount": allocated,
+	}
+
+
+def get_allocation_precision():
+	return frappe.get_precision("Payment Entry Reference", "allocated_amount") or 2
+
+
+def invalidate_payment_account_cache(doc, method=None, *args, **kwargs):
+	"""doc_events handler for Account, Mode of Payment, Company and party groups"""
+	frappe.cache.delete_value([ACCOUNT_CACHE_KEY, PARTY_ACCOUNT_CACHE_KEY])
+
+
+def invalidate_party_account_cache(doc, method=None, *args, **kwargs):
+	"""doc_events handler for Customer and Supplier, after_rename also passes the old name"""
+	for name in {doc.name, *args[:1]}:
+		frappe.cache.hdel(PARTY_ACCOUNT_CACHE_KEY, f"{doc.doctype}|{name}")
+
+
+def get_cached_exchange_rate(from_currency, to_currency, transaction_date):
+	"""
+	ERPNext's get_exchange_rate memoized per process and across workers
+
+	Lookups go through a bounded per-process LRU first, then a Redis hash, and only
+	then to ERPNext. The generation is read once per request or job, so a local hit
+	does not touch Redis at all. Hits and misses are counted locally and added to the
+	shared counters at the next request or job, see get_exchange_rate_stats.
+	"""
+	generation = _get_generation()
+	date = str(getdate(transaction_date))
+	key = f"{from_currency}|{to_currency}"
+	local_key = (frappe.local.site, generation, date, key)
+	counts = _pending_counts.setdefault(frappe.local.site, Counter())
+
+	if local_key in _local_rates:
+		_local_rates.move_to_end(local_key)
+		counts["local_hits"] += 1
+		return _local_rates[local_key]
+
+	cache_key = f"{EXCHANGE_RATE_CACHE_KEY}|{generation}|{date}"
+	rate = frappe.cache.hget(cache_key, key)
+	if rate is not None:
+		counts["redis_hits"] += 1
+	else:
+		counts["misses"] += 1
+		rate = get_exchange_rate(from_currency, to_currency, transaction_date)
+		if not rate:
+			# nothing configured or fetched, do not pin the failure
+			return rate
+
+		frappe.cache.hset(cache_key, key, rate)
+		frappe.cache.expire(frappe.cache.make_key(cache_key), EXCHANGE_RATE_CACHE_TTL)
+
+	_local_rates[local_key] = rate
+	if len(_local_rates) > LOCAL_RATE_CACHE_SIZE:
+		_local_rates.popitem(last=False)
+
+	return rate
+
+
+def get_exchange_rate_stats():
+	"""Return the exchange rate cache counters of all workers"""
+	_flush_counts()
+
+	fields = ["local_hits", "redis_hits", "misses"]
+	counts = frappe.cache.hmget(frappe.cache.make_key(EXCHANGE_RATE_STATS_KEY), fields)
+
+	stats = {field: int(count or 0) for field, count in zip(fields, counts, strict=True)}
+	stats["local_entries"] = len(_local_rates)
+	return stats
+
+
+def invalidate_exchange_rate_cache(doc, method=None, *args, **kwargs):
+	"""doc_events handler for Currency Exchange"""
+	_clear_exchange_rates()
+	# a concurrent reader can cache the old rate again until the change commits, clear once more then
+	frappe.db.after_commit.add(_clear_exchange_rates)
+
+
+def _clear_exchange_rates():
+	# cached rates are keyed by generation, the old ones expire unread
+	generation = frappe.generate_hash(length=8)
+	frappe.cache.set_value(EXCHANGE_RATE_GENERATION_KEY, generation)
+	frappe.local.marka_exchange_rate_generation = generation
+
+
+def _get_generation():
+	generation = getattr(frappe.local, "marka_exchange_rate_generation", None)
+	if generation is None:
+		# first lookup of this request or job, also a good time to publish the counts
+		_flush_counts()
+		generation = frappe.cache.get_value(EXCHANGE_RATE_GENERATION_KEY) or "0"
+		frappe.local.marka_exchange_rate_generation = generation
+
+	return generation
+
+
+def _flush_counts():
+	counts = _pending_counts.pop(frappe.local.site, None)
+	if not counts:
+		return
+
+	pipeline = frappe.cache.pipeline(transaction=False)
+	key = frappe.cache.make_key(EXCHANGE_RATE_STATS_KEY)
+	for field, count in counts.items():
+		pipeline.hincrby(key, field, count)
+	pipeline.execute()
+
+
+def _resolve_payment_accounts(company, mode_of_payment=None):
+	bank_account = None
+
+	if mode_of_payment:
+		bank_account = frappe.db.get_value(
+			"Mode of Payment Account",
+			{"parent": mode_of_payment, "company": company},
+			"default_account",
+		)
+
+	if not bank_account:
+		bank_account = frappe.db.get_value(
+			"Account",
+			{"company": company, "account_type": "Cash", "is_group": 0},
+			"name",
+		)
+
+	if not bank_account:
+		bank_account = frappe.db.get_value(
+			"Account",
+			{"company": company, "account_type": "Bank", "is_group": 0},
+			"name",
+		)
+
+	if not bank_account:
+		frappe.throw(
+			_(
+				"Please specify mode_of_payment or ensure a default Cash/Bank account exists for company {0}"
+			).format(company)
+		)
+
+	return {
+		"bank_account": bank_account,
+		"bank_account_currency": get_account_currency(bank_account),
+		"company_currency": frappe.get_cached_value("Company", company, "default_currency"),
+		"cost_center": erpnext.get_default_cost_center(company),
+	}
@@ -0,0 +1,123 @@
+import cProfile
+import io
+import marshal
+import pstats
+import random
+
+import frappe
+import redis
+from frappe import _
+from frappe.utils import cint, flt
+
+from marka_account_integration.marka_account_integration.doctype.merka_account_settings.merka_account_settings import (
+	get_settings,
+)
+
+PROFILE_DOCTYPE = "Merka API Profile"
+DEFAULT_PROFILES_TO_KEEP = 20
+# functions listed in the readable summary stored next to the raw profile
+SUMMARY_FUNCTIONS = 60
+
+
+def start_profile(endpoint):
+	"""
+	Return a running profiler when this call of endpoint is picked for profiling, else None
+
+	Profiling is configured in Merka Account Settings. When it is off this only reads
+	the per-process settings snapshot, so unprofiled calls pay next to nothing.
+	"""
+	settings = get_settings()
+	if not settings.enable_api_profiler:
+		return None
+
+	endpoints = (settings.profiled_endpoints or "").split()
+	if endpoints and endpoint not in endpoints:
+		return None
+
+	if random.random() * 100 >= flt(settings.profile_sample_rate):
+		return None
+
+	profiler = cProfile.Profile()
+	try:
+		profiler.enable()
+	except ValueError:
+		# another profiler, e.g. a debugger or bench --profile, is already running
+		return None
+
+	return profiler
+
+
+def finish_profile(profiler, endpoint, duration, query_count, query_time):
+	"""Hand a stopped profiler's stats to a background job storing them, see store_profile"""
+	stream = io.StringIO()
+	stats = pstats.Stats(profiler, stream=stream)
+	stats.sort_stats("cumulative").print_stats(SUMMARY_FUNCTIONS)
+
+	try:
+		# queued right away rather than after commit, so profiles of failed calls are kept too
+		frappe.enqueue(
+			"marka_account_integration.profiling.store_profile",
+			queue="short",
+			endpoint=endpoint,
+			user=frappe.session.user,
+			duration=duration,
+			query_count=query_count,
+			query_time=query_time,
+			stats=marshal.dumps(stats.stats),
+			summary=stream.getvalue(),
+		)
+	except redis.exceptions.RedisError:
+		pass
+
+
+def store_profile(endpoint, user, duration, query_count, query_time, stats, summary):
+	"""
+	Background job keeping a profile if it is among the slowest ones
+
+	Only the profiles_to_keep slowest profiles are kept. The raw stats are attached
+	as a private .prof file that pstats or snakeviz can open.
+	"""
+	keep = cint(get_settings().profiles_to_keep) or DEFAULT_PROFILES_TO_KEEP
+
+	slowest = frappe.get_all(
+		PROFILE_DOCTYPE, fields=["duration"], order_by="duration desc", limit_start=keep - 1, limit=1
+	)
+	if slowest and duration <= slowest[0].duration:
+		return
+
+	profile = frappe.new_doc(PROFILE_DOCTYPE)
+	profile.endpoint = endpoint
+	profile.user = user
+	profile.duration = flt(duration, 6)
+	profile.query_count = query_count
+	profile.query_time = flt(query_time, 6)
+	profile.summary = summary
+	profile.insert(ignore_permissions=True)
+
+	file = frappe.new_doc("File")
+	file.file_name = f"{endpoint}-{profile.name}.prof"
+	file.attached_to_doctype = PROFILE_DOCTYPE
+	file.attached_to_name = profile.name
+	file.attached_to_field = "profile_file"
+	file.is_private = 1
+	file.content = stats
+	file.insert(ignore_permissions=True)
+	profile.db_set("profile_file", file.file_url)
+
+	for name in frappe.get_all(
+		PROFILE_DOCTYPE, order_by="duration desc", limit_start=keep, limit=100, pluck="name"
+	):
+		frappe.delete_doc(PROFILE_DOCTYPE, name, ignore_permissions=True, force=True)
+
+	frappe.db.commit()
+
+
+def get_profile_content(name):
+	"""Return the file name and raw pstats data of a stored profile"""
+	file_url = frappe.db.get_value(PROFILE_DOCTYPE, name, "profile_file")
+	if not file_url:
+		frappe.throw(_("Profile {0} does not exist").format(name), frappe.DoesNotExistError)
+
+	file = frappe.get_doc("File", {"file_url": file_url})
+	with open(file.get_full_path(), "rb") as f:
+		return file.file_name, f.read()
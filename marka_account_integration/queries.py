@@ -0,0 +1,241 @@
+import base64
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import cint, cstr
+
+DEFAULT_PAGE_LENGTH = 100
+MAX_PAGE_LENGTH = 1000
+
+# columns returned by the list endpoints when no fields are requested
+DEFAULT_LIST_FIELDS = {
+	"Sales Invoice": ["name", "customer", "posting_date", "grand_total", "outstanding_amount", "docstatus"],
+	"Purchase Invoice": [
+		"name",
+		"supplier",
+		"posting_date",
+		"grand_total",
+		"outstanding_amount",
+		"docstatus",
+	],
+	"Payment Entry": [
+		"name",
+		"payment_type",
+		"party_type",
+		"party",
+		"posting_date",
+		"paid_amount",
+		"docstatus",
+	],
+	"Journal Entry": ["name", "voucher_type", "posting_date", "total_debit", "total_credit", "docstatus"],
+}
+
+
+def list_documents(doctype, filters=None, fields=None, page_length=DEFAULT_PAGE_LENGTH, cursor=None):
+	"""
+	Return one page of documents, newest modified first, using keyset pagination
+
+	Pages are anchored on (modified, name) of the last row of the previous page
+	instead of an OFFSET, so deep pages cost the same as the first one.
+
+	Args:
+		doctype (str): DocType to list
+		filters (dict or list, optional): Frappe style filters
+		fields (list, optional): Parent columns to return
+		page_length (int, optional): Rows per page, at most MAX_PAGE_LENGTH
+		cursor (str, optional): next_cursor returned with the previous page
+
+	Returns:
+		dict: data rows and the next_cursor, None on the last page
+	"""
+	fields = parse_fields(doctype, fields, child_tables=False)[0] or DEFAULT_LIST_FIELDS[doctype]
+	page_length = min(cint(page_length) or DEFAULT_PAGE_LENGTH, MAX_PAGE_LENGTH)
+	filters = _as_filter_list(doctype, frappe.parse_json(filters))
+	or_filters = None
+
+	if cursor:
+		modified, name = _decode_cursor(cursor)
+		# (modified, name) < (cursor modified, cursor name), written so get_list can express it
+		filters.append([doctype, "modified", "<=", modified])
+		or_filters = [[doctype, "modified", "<", modified], [doctype, "name", "<", name]]
+
+	rows = frappe.get_list(
+		doctype,
+		fields=list(dict.fromkeys([*fields, "modified", "name"])),
+		filters=filters,
+		or_filters=or_filters,
+		order_by="modified desc, name desc",
+		limit_page_length=page_length + 1,
+	)
+
+	next_cursor = None
+	if len(rows) > page_length:
+		rows = rows[:page_length]
+		next_cursor = _encode_cursor(rows[-1])
+
+	for row in rows:
+		for key in ("modified", "name"):
+			if key not in fields:
+				row.pop(key)
+
+	return {"data": rows, "next_cursor": next_cursor}
+
+
+# the doctypes this app creates and serves through its endpoints
+MANAGED_DOCTYPES = ("Sales Invoice", "Purchase Invoice", "Payment Entry", "Journal Entry")
+
+
+def get_document_data(doctype, name, fields=None, include_children=True):
+	"""
+	Return a document as a dict, loading only what was asked for
+
+	Without `fields` the whole document is returned as before. With `fields`, parent
+	columns are read directly and only the child tables named in `fields` are
+	queried, the full Document is never built. `include_children=0` leaves out all
+	child tables.
+	"""
+	include_children = cint(include_children)
+	parent_fields, child_tables = _split_fields(doctype, fields, include_children)
+
+	if parent_fields == ["*"] and include_children:
+		return frappe.get_doc(doctype, name).as_dict()
+
+	data = frappe.db.get_value(doctype, name, parent_fields, as_dict=True)
+	if not data:
+		raise frappe.DoesNotExistError(_("{0} {1} not found").format(_(doctype), name))
+
+	for fieldname, child_doctype in child_tables.items():
+		data[fieldname] = frappe.get_all(
+			child_doctype,
+			filters={"parent": name, "parenttype": doctype, "parentfield": fieldname},
+			fields=["*"],
+			order_by="idx",
+		)
+
+	return data
+
+
+def get_documents_data(doctype, names, fields=None, include_children=True):
+	"""
+	Return many documents with one query for the parents and one per child table
+
+	Args:
+		doctype (str): One of MANAGED_DOCTYPES
+		names (list): Document names, results keep this order
+		fields (list, optional): See get_document_data, all child tables by default
+		include_children (bool, optional): Include child tables
+
+	Returns:
+		list: One entry per name with status and data, or an error message when
+			the document does not exist
+	"""
+	if doctype not in MANAGED_DOCTYPES:
+		frappe.throw(_("doctype must be one of {0}").format(", ".join(MANAGED_DOCTYPES)))
+
+	names = frappe.parse_json(names) or []
+	parent_fields, child_tables = _split_fields(doctype, fields, cint(include_children))
+
+	parents = {}
+	if names:
+		for row in frappe.get_all(doctype, filters={"name": ["in", names]}, fields=parent_fields):
+			row.doctype = doctype
+			parents[row.name] = row
+
+	for fieldname, child_doctype in child_tables.items():
+		for parent in parents.values():
+			parent[fieldname] = []
+
+		child_rows = (
+			frappe.get_all(
+				child_doctype,
+				filters={"parent": ["in", list(parents)], "parenttype": doctype, "parentfield": fieldname},
+				fields=["*"],
+				order_by="parent, idx",
+			)
+			if parents
+			else []
+		)
+
+		for row in child_rows:
+			row.doctype = child_doctype
+			parents[row.parent][fieldname].append(row)
+
+	return [
+		{"name": name, "status": "success", "data": parents[name]}
+		if name in parents
+		else {"name": name, "status": "error", "message": _("{0} {1} not found").format(_(doctype), name)}
+		for name in names
+	]
+
+
+def parse_fields(doctype, fields, child_tables=True):
+	"""
+	Parse and validate the `fields` argument of the list and get endpoints
+
+	Args:
+		fields (list or str): A list, a JSON list, or a comma separated string from a query string
+		child_tables (bool): Whether fieldnames of child tables may be requested
+
+	Returns:
+		tuple: Requested parent columns, and map of requested child table fieldname
+			to child doctype, both empty when nothing was requested
+	"""
+	if isinstance(fields, str):
+		fields = frappe.parse_json(fields) if fields.lstrip().startswith("[") else fields.split(",")
+	fields = [field for field in (cstr(field).strip() for field in fields or []) if field]
+
+	meta = frappe.get_meta(doctype)
+	valid_columns = set(meta.get_valid_columns())
+	table_fields = {df.fieldname: df.options for df in meta.get_table_fields()} if child_tables else {}
+
+	invalid = [field for field in fields if field not in valid_columns and field not in table_fields]
+	if invalid:
+		frappe.throw(_("Invalid fields for {0}: {1}").format(_(doctype), ", ".join(invalid)))
+
+	return (
+		[field for field in fields if field not in table_fields],
+		{field: table_fields[field] for field in fields if field in table_fields},
+	)
+
+
+def _split_fields(doctype, fields, include_children):
+	"""Parent columns and child tables to load, everything when no fields are requested"""
+	parent_fields, child_tables = parse_fields(doctype, fields)
+
+	if parent_fields or child_tables:
+		parent_fields = list(dict.fromkeys(["name", *parent_fields]))
+	else:
+		parent_fields = ["*"]
+		child_tables = {df.fieldname: df.options for df in frappe.get_meta(doctype).get_table_fields()}
+
+	return parent_fields, child_tables if include_children else {}
+
+
+def _as_filter_list(doctype, filters):
+	if not filters:
+		return []
+	if isinstance(filters, list):
+		return list(filters)
+
+	filter_list = []
+	for fieldname, value in filters.items():
+		if isinstance(value, list | tuple) and len(value) == 2:
+			filter_list.append([doctype, fieldname, value[0], value[1]])
+		else:
+			filter_list.append([doctype, fieldname, "=", value])
+
+	return filter_list
+
+
+def _encode_cursor(row):
+	return base64.urlsafe_b64encode(json.dumps([str(row.modified), row.name]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+	try:
+		modified, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+	except Exception:
+		frappe.throw(_("Invalid cursor"))
+
+	return modified, name
@@ -0,0 +1,165 @@
+import hashlib
+import json
+
+import frappe
+from erpnext.accounts.utils import get_fiscal_year
+from frappe import _
+from frappe.core.doctype.user_permission.user_permission import get_user_permissions
+from frappe.desk import query_report
+from frappe.utils import getdate
+
+# Report mapping for different report types
+REPORT_MAPPING = {
+	"general_ledger": "General Ledger",
+	"profit_loss": "Profit and Loss Statement",
+	"cash_flow": "Cash Flow",
+	"payables": "Accounts Payable",
+	"receivables": "Accounts Receivable",
+	"payables_summary": "Accounts Payable Summary",
+	"receivables_summary": "Accounts Receivable Summary",
+	"trial_balance": "Trial Balance",
+	"balance_sheet": "Balance Sheet",
+	"vat_report": "UAE VAT 201",  # Changed from "VAT Report" to "VAT Audit Report" (standard ERPNext report)
+}
+
+REPORT_CACHE_KEY = "marka_report_data"
+# bumped whenever GL entries of a company are committed, which orphans its cached results
+GENERATION_KEY = "marka_report_generation"
+REPORT_CACHE_TTL = 15 * 60
+# pre-warmed results stay until the next nightly run unless new GL entries expire them first
+PREWARM_CACHE_TTL = 26 * 60 * 60
+
+
+def run_report(report_type, filters, use_cache=True, ttl=REPORT_CACHE_TTL):
+	"""
+	Run a REPORT_MAPPING report server-side and return its columns and rows
+
+	Results are cached by report type and a hash of the normalized filters for
+	`ttl` seconds, or until new GL entries land for the filtered company.
+
+	Returns:
+		dict: report_name, columns, result and whether the data came from the cache
+	"""
+	if report_type not in REPORT_MAPPING:
+		frappe.throw(
+			_("Invalid report type '{0}'. Available options: {1}").format(
+				report_type, ", ".join(REPORT_MAPPING)
+			)
+		)
+
+	report_name = REPORT_MAPPING[report_type]
+	if not frappe.get_cached_doc("Report", report_name).is_permitted():
+		frappe.throw(_("You don't have access to Report: {0}").format(report_name), frappe.PermissionError)
+
+	filters = normalize_filters(filters)
+	cache_key = get_cache_key(report_type, filters)
+
+	if use_cache:
+		data = frappe.cache.get_value(cache_key)
+		if data is not None:
+			return {**data, "cached": True}
+
+	output = query_report.run(report_name, filters=filters, ignore_prepared_report=True)
+	data = {
+		"report_name": report_name,
+		"filters": filters,
+		"columns": output.get("columns"),
+		"result": output.get("result"),
+	}
+	frappe.cache.set_value(cache_key, data, expires_in_sec=ttl)
+
+	return {**data, "cached": False}
+
+
+def get_period_filters(report_type, company, date=None):
+	"""
+	Return the filters for the fiscal year to date of `company`
+
+	The pre-warm job computes reports with these filters, so passing the same ones
+	to get_report_data is served from the cache.
+	"""
+	date = getdate(date)
+	fiscal_year, year_start_date = get_fiscal_year(date, company=company)[:2]
+
+	period = {
+		"company": company,
+		"from_date": year_start_date,
+		"to_date": date,
+	}
+	financial_statement = {
+		"company": company,
+		"filter_based_on": "Fiscal Year",
+		"from_fiscal_year": fiscal_year,
+		"to_fiscal_year": fiscal_year,
+		"period_start_date": year_start_date,
+		"period_end_date": date,
+		"periodicity": "Yearly",
+		"accumulated_values": 1,
+	}
+
+	if report_type == "general_ledger":
+		return {**period, "group_by": "Group by Voucher (Consolidated)"}
+	if report_type == "trial_balance":
+		return {**period, "fiscal_year": fiscal_year}
+	if report_type in ("balance_sheet", "profit_loss", "cash_flow"):
+		return financial_statement
+	if report_type == "vat_report":
+		return period
+
+	frappe.throw(_("No period filters defined for report type '{0}'").format(report_type))
+
+
+def normalize_filters(filters):
+	"""Drop empty values and canonicalize dates and lists so equal filters hash equally"""
+	normalized = {}
+
+	for key, value in (filters or {}).items():
+		if value in (None, "", []):
+			continue
+		if isinstance(value, list):
+			value = sorted(value, key=str)
+		elif key.endswith("date") and isinstance(value, str):
+			value = str(getdate(value))
+		normalized[key] = value
+
+	return normalized
+
+
+def get_cache_key(report_type, filters):
+	digest = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()
+	generation = _get_generation(filters.get("company"))
+
+	# rows of users restricted by User Permissions must not leak into the shared entry
+	scope = frappe.session.user if get_user_permissions(frappe.session.user) else "shared"
+
+	return f"{REPORT_CACHE_KEY}|{report_type}|{generation}|{scope}|{digest}"
+
+
+def invalidate_company_reports(doc, method=None):
+	"""doc_events handler for GL Entry, expiring cached reports once the entry commits"""
+	pending = frappe.flags.marka_report_companies
+	if pending is None:
+		pending = frappe.flags.marka_report_companies = set()
+		frappe.db.after_commit.add(_bump_generations)
+		frappe.db.after_rollback.add(_discard_pending)
+
+	pending.add(doc.company)
+
+
+def _bump_generations():
+	for company in _discard_pending() or ():
+		frappe.cache.set_value(f"{GENERATION_KEY}|{company}", frappe.generate_hash(length=8))
+
+	# results without a company filter span every company
+	frappe.cache.set_value(GENERATION_KEY, frappe.generate_hash(length=8))
+
+
+def _discard_pending():
+	pending = frappe.flags.marka_report_companies
+	frappe.flags.marka_report_companies = None
+	return pending
+
+
+def _get_generation(company=None):
+	key = f"{GENERATION_KEY}|{company}" if company else GENERATION_KEY
+	return frappe.cache.get_value(key) or "0"
@@ -0,0 +1,102 @@
+import time
+
+import frappe
+from frappe import _
+from frappe.sessions import delete_session, get_expiry_in_seconds, get_expiry_period
+from frappe.utils import now
+from frappe.utils.password import check_password, get_decrypted_password
+
+SETTINGS_DOCTYPE = "Merka Account Settings"
+BROKER_KEY = "marka_session_broker"
+# stop handing out a brokered session this long before Frappe would expire it
+RENEW_MARGIN = 60 * 60
+
+
+def get_session_id(user, password_field):
+	"""
+	Return a valid session id for `user`
+
+	A session minted earlier is reused until it gets close to expiry. Otherwise the
+	password held in the `password_field` of Merka Account Settings is decrypted and
+	verified, and a new session is created in-process, without the HTTP login round
+	trip FrappeClient needed. A new session only becomes usable once the current
+	transaction is committed.
+	"""
+	brokered = frappe.cache.hget(BROKER_KEY, user)
+	if (
+		brokered
+		and brokered["expires_at"] - RENEW_MARGIN > time.time()
+		and frappe.cache.hget("session", brokered["sid"])
+	):
+		return brokered["sid"]
+
+	password = get_decrypted_password(
+		SETTINGS_DOCTYPE, SETTINGS_DOCTYPE, password_field, raise_exception=False
+	)
+	if not password:
+		frappe.throw(_("Password for {0} not found in Merka Account Settings").format(user))
+
+	check_password(user, password)
+	sid, data = _start_session(user)
+
+	def publish_session():
+		frappe.cache.hset("session", sid, data)
+		frappe.cache.hset(BROKER_KEY, user, {"sid": sid, "expires_at": time.time() + get_expiry_in_seconds()})
+
+	# the session must not be handed out again if the transaction is rolled back
+	frappe.db.after_commit.add(publish_session)
+	return sid
+
+
+def invalidate_sessions(users=None):
+	"""Forget brokered sessions, and log them out, e.g. after credentials changed"""
+	if users is None:
+		# hgetall only unpickles the values, the field names come back as raw bytes
+		users = [
+			user.decode() if isinstance(user, bytes) else user
+			for user in frappe.cache.hgetall(BROKER_KEY) or {}
+		]
+
+	for user in users:
+		brokered = frappe.cache.hget(BROKER_KEY, user) if user else None
+		if brokered:
+			delete_session(brokered["sid"], reason="Merka Account Settings Changed")
+			frappe.cache.hdel(BROKER_KEY, user)
+
+
+def _start_session(user):
+	"""
+	Insert a session row the same way frappe.sessions.Session.start does and return
+	its sid and cache data
+
+	The row is written in the current transaction, callers that redirect to the new
+	session have to commit it.
+	"""
+	full_name, user_type = frappe.db.get_value("User", user, ["full_name", "user_type"])
+	sid = frappe.generate_hash()
+
+	data = frappe._dict(
+		{
+			"user": user,
+			"sid": sid,
+			"data": frappe._dict(
+				{
+					"user": user,
+					"session_ip": frappe.local.request_ip,
+					"last_updated": now(),
+					"session_expiry": get_expiry_period(),
+					"full_name": full_name,
+					"user_type": user_type,
+				}
+			),
+		}
+	)
+
+	Sessions = frappe.qb.DocType("Sessions")
+	(
+		frappe.qb.into(Sessions)
+		.columns(Sessions.sessiondata, Sessions.user, Sessions.lastupdate, Sessions.sid, Sessions.status)
+		.insert((str(data["data"]), user, now(), sid, "Active"))
+	).run()
+
+	return sid, data
@@ -0,0 +1,167 @@
+import time
+
+import frappe
+from frappe.utils import cint, get_time, getdate, nowtime
+
+from marka_account_integration.jobs import get_job_queue
+from marka_account_integration.marka_account_integration.doctype.merka_account_settings.merka_account_settings import (
+	get_settings,
+)
+
+QUEUE_DOCTYPE = "Merka Submit Queue"
+DEFAULT_WORKERS = 2
+DEFAULT_BATCH_SIZE = 100
+WORKER_TIMEOUT = 60 * 60
+# a worker stops claiming batches this long before its timeout, the next run picks up the rest
+WORKER_TIME_BUDGET = WORKER_TIMEOUT - 5 * 60
+SAVEPOINT = "marka_deferred_submit"
+
+
+def defer_submit(doc):
+	"""Queue a freshly inserted draft for submission by the scheduled submitter"""
+	queued = frappe.new_doc(QUEUE_DOCTYPE)
+	queued.reference_doctype = doc.doctype
+	queued.reference_name = doc.name
+	queued.company = doc.company
+	queued.posting_date = getdate(doc.posting_date)
+	queued.insert(ignore_permissions=True)
+
+
+def schedule_submissions():
+	"""
+	Scheduler job starting the configured number of submit workers
+
+	Workers only start inside the submit window of Merka Account Settings, if one is
+	set, and never more of them than there are batches queued.
+	"""
+	settings = get_settings()
+	if not _in_submit_window(settings.submit_window_start, settings.submit_window_end):
+		return
+
+	backlog = frappe.db.count(QUEUE_DOCTYPE, {"status": "Queued"})
+	batch_size = cint(settings.submit_batch_size) or DEFAULT_BATCH_SIZE
+	workers = min(cint(settings.submit_workers) or DEFAULT_WORKERS, -(-backlog // batch_size))
+
+	for worker in range(workers):
+		frappe.enqueue(
+			"marka_account_integration.submissions.submit_queued_documents",
+			queue=get_job_queue(),
+			timeout=WORKER_TIMEOUT,
+			# a worker still busy from the previous run is not started twice
+			job_id=f"marka_submit_worker::{worker}",
+			deduplicate=True,
+			batch_size=batch_size,
+		)
+
+
+def submit_queued_documents(batch_size=DEFAULT_BATCH_SIZE):
+	"""
+	Background job submitting queued drafts in batches, oldest posting date first
+
+	Each batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so parallel
+	workers never pick the same drafts, and committed as a whole. No batch is
+	claimed outside the submit window. A draft that fails
+	to submit is rolled back to its savepoint and left in the queue as Failed.
+	"""
+	deadline = time.monotonic() + WORKER_TIME_BUDGET
+	settings = get_settings()
+
+	while time.monotonic() < deadline:
+		# a worker started just before the window closes stops at its end, not at its deadline
+		if not _in_submit_window(settings.submit_window_start, settings.submit_window_end):
+			break
+
+		batch = frappe.db.sql(
+			f"""
+			select name, reference_doctype, reference_name
+			from `tab{QUEUE_DOCTYPE}`
+			where status = 'Queued'
+			order by posting_date, creation
+			limit %(batch_size)s
+			for update skip locked
+			""",
+			{"batch_size": cint(batch_size) or DEFAULT_BATCH_SIZE},
+			as_dict=True,
+		)
+		if not batch:
+			break
+
+		for queued in batch:
+			_submit(queued)
+
+		frappe.db.commit()
+
+
+def get_backlog():
+	"""Queued and failed drafts per doctype, with the oldest posting date still waiting"""
+	rows = frappe.get_all(
+		QUEUE_DOCTYPE,
+		fields=[
+			"reference_doctype",
+			"status",
+			"count(name) as count",
+			"min(posting_date) as oldest_posting_date",
+		],
+		group_by="reference_doctype, status",
+	)
+
+	backlog = {"queued": 0, "failed": 0, "doctypes": {}}
+	for row in rows:
+		backlog[row.status.lower()] += row.count
+		backlog["doctypes"].setdefault(row.reference_doctype, {})[row.status.lower()] = {
+			"count": row.count,
+			"oldest_posting_date": row.oldest_posting_date,
+		}
+
+	backlog["recent_failures"] = frappe.get_all(
+		QUEUE_DOCTYPE,
+		filters={"status": "Failed"},
+		fields=["reference_doctype", "reference_name", "error", "modified"],
+		order_by="modified desc",
+		limit=20,
+	)
+	return backlog
+
+
+def requeue_failed(reference_doctype=None):
+	"""Put failed drafts back in the queue, e.g. after fixing the master data they tripped on"""
+	filters = {"status": "Failed"}
+	if reference_doctype:
+		filters["reference_doctype"] = reference_doctype
+
+	names = frappe.get_all(QUEUE_DOCTYPE, filters=filters, pluck="name")
+	for name in names:
+		frappe.db.set_value(QUEUE_DOCTYPE, name, {"status": "Queued", "error": None})
+
+	return len(names)
+
+
+def _submit(queued):
+	frappe.db.savepoint(SAVEPOINT)
+	try:
+		doc = frappe.get_doc(queued.reference_doctype, queued.reference_name)
+		# drafts submitted or cancelled by hand in the meantime have nothing left to do
+		if doc.docstatus == 0:
+			doc.submit()
+	except frappe.DoesNotExistError:
+		frappe.db.rollback(save_point=SAVEPOINT)
+	except Exception:
+		frappe.db.rollback(save_point=SAVEPOINT)
+		frappe.db.set_value(QUEUE_DOCTYPE, queued.name, {"status": "Failed", "error": frappe.get_traceback()})
+		return
+	else:
+		frappe.db.release_savepoint(SAVEPOINT)
+
+	frappe.db.delete(QUEUE_DOCTYPE, {"name": queued.name})
+
+
+def _in_submit_window(start, end):
+	if not start or not end:
+		return True
+
+	now, start, end = get_time(nowtime()), get_time(start), get_time(end)
+	if start <= end:
+		return start <= now < end
+
+	# the window runs past midnight
+	return now >= start or now < end
@@ -0,0 +1,69 @@
+import time
+
+import frappe
+from frappe.utils import cint, flt
+
+from marka_account_integration.marka_account_integration.doctype.merka_account_settings.merka_account_settings import (
+	get_settings,
+)
+from marka_account_integration.reports import PREWARM_CACHE_TTL, get_period_filters, run_report
+
+
+def prewarm_reports():
+	"""Nightly job computing the configured reports of every company into the report cache"""
+	if not get_settings().enable_report_prewarm:
+		return
+
+	for company in frappe.get_all("Company", pluck="name"):
+		prewarm_company_reports(company, "Nightly")
+
+
+def prewarm_reports_after_posting():
+	"""
+	Hourly job re-running the pre-warming for companies with heavy posting
+
+	A company qualifies once the GL Entries posted or cancelled since its last
+	pre-warm reach the threshold configured in Merka Account Settings.
+	"""
+	settings = get_settings()
+	threshold = cint(settings.prewarm_gl_entry_threshold)
+	if not settings.enable_report_prewarm or threshold <= 0:
+		return
+
+	last_runs = frappe.get_all(
+		"Merka Report Prewarm Log",
+		fields=["company", "max(creation) as last_run"],
+		group_by="company",
+	)
+
+	for row in last_runs:
+		# modified is indexed, creation is not and would scan the whole ledger every hour
+		posted = frappe.db.count("GL Entry", {"company": row.company, "modified": [">", row.last_run]})
+		if posted >= threshold:
+			prewarm_company_reports(row.company, "Posting Volume")
+
+
+def prewarm_company_reports(company, trigger):
+	"""Compute every configured report of a company, logging how long each one took"""
+	for report_type in (get_settings().prewarm_report_types or "").split():
+		log = frappe.new_doc("Merka Report Prewarm Log")
+		log.report_type = report_type
+		log.company = company
+		log.trigger = trigger
+
+		start = time.monotonic()
+		try:
+			filters = get_period_filters(report_type, company)
+			log.from_date = filters.get("from_date") or filters.get("period_start_date")
+			log.to_date = filters.get("to_date") or filters.get("period_end_date")
+
+			data = run_report(report_type, filters, use_cache=False, ttl=PREWARM_CACHE_TTL)
+			log.row_count = len(data["result"] or [])
+			log.status = "Success"
+		except Exception:
+			log.status = "Failed"
+			log.error = frappe.get_traceback()
+
+		log.duration = flt(time.monotonic() - start, 3)
+		log.insert(ignore_permissions=True)
+		frappe.db.commit()
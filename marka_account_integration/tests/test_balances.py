@@ -0,0 +1,74 @@
+# Copyright (c) 2026, itsyosefali and Contributors
+# See license.txt
+
+import frappe
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt, nowdate
+
+from marka_account_integration.balances import rebuild_account_balances
+
+TEST_COMPANY = "_Test Company"
+
+
+class TestAccountBalances(FrappeTestCase):
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_submit_and_cancel_update_balance_rows(self):
+		before = get_balances()
+
+		invoice = create_sales_invoice(rate=100)
+		after_submit = get_balances()
+		for account, (debit, credit) in get_voucher_balances(invoice.name).items():
+			before_debit, before_credit = before.get(account, (0, 0))
+			self.assertEqual(
+				(
+					flt(after_submit[account][0] - before_debit, 2),
+					flt(after_submit[account][1] - before_credit, 2),
+				),
+				(debit, credit),
+			)
+
+		# cancelling takes the voucher off the rows again, debit and credit alike, as in the ledger
+		invoice.cancel()
+		self.assertEqual(get_balances(), before)
+
+	def test_incremental_rows_match_rebuild(self):
+		create_sales_invoice(rate=100).cancel()
+		create_sales_invoice(rate=50)
+		incremental = get_balances()
+
+		rebuild_account_balances(TEST_COMPANY, nowdate(), nowdate())
+		self.assertEqual(get_balances(), incremental)
+
+
+def get_balances():
+	"""Debit and credit per account of today's snapshot rows, leaving out empty ones"""
+	rows = frappe.db.sql(
+		"""
+		select account, sum(debit), sum(credit)
+		from `tabMerka Account Balance`
+		where company = %s and posting_date = %s and is_opening = 0
+		group by account
+		""",
+		(TEST_COMPANY, nowdate()),
+	)
+	return {
+		account: (flt(debit, 2), flt(credit, 2))
+		for account, debit, credit in rows
+		if flt(debit, 2) or flt(credit, 2)
+	}
+
+
+def get_voucher_balances(voucher_no):
+	rows = frappe.db.sql(
+		"""
+		select account, sum(debit), sum(credit)
+		from `tabGL Entry`
+		where voucher_no = %s and is_cancelled = 0
+		group by account
+		""",
+		voucher_no,
+	)
+	return {account: (flt(debit, 2), flt(credit, 2)) for account, debit, credit in rows}
@@ -0,0 +1,55 @@
+# Copyright (c) 2026, itsyosefali and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from marka_account_integration.idempotency import idempotent
+
+calls = []
+
+
+@idempotent
+def record_call(amount, party=None):
+	calls.append(amount)
+	return {"status": "success", "amount": amount, "call": len(calls)}
+
+
+class TestIdempotency(FrappeTestCase):
+	def setUp(self):
+		calls.clear()
+		frappe.local.response.pop("http_status_code", None)
+		self.key = frappe.generate_hash()
+
+	def tearDown(self):
+		# also releases the locks of calls whose result was never stored
+		frappe.db.rollback()
+
+	def test_replay_returns_stored_result(self):
+		first = record_call(100, party="A", idempotency_key=self.key)
+		# store the result without committing the test's transaction
+		frappe.db.after_commit.run()
+
+		# passed by keyword instead of position, the payload is still the same
+		self.assertEqual(record_call(party="A", idempotency_key=self.key, amount=100), first)
+		self.assertEqual(calls, [100])
+
+	def test_replay_with_different_payload_is_rejected(self):
+		record_call(100, idempotency_key=self.key)
+		frappe.db.after_commit.run()
+
+		result = record_call(200, idempotency_key=self.key)
+
+		self.assertEqual(result["status"], "error")
+		self.assertEqual(frappe.local.response.get("http_status_code"), 409)
+		self.assertEqual(calls, [100])
+
+	def test_different_payload_is_rejected_while_first_call_runs(self):
+		# the first call holds the key until its transaction commits
+		record_call(100, idempotency_key=self.key)
+
+		result = record_call(200, idempotency_key=self.key)
+
+		self.assertEqual(result["status"], "error")
+		self.assertEqual(frappe.local.response.get("http_status_code"), 409)
+		self.assertEqual(calls, [100])
@@ -0,0 +1,99 @@
+# Copyright (c) 2026, itsyosefali and Contributors
+# See license.txt
+
+import json
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from marka_account_integration import imports
+from marka_account_integration.imports import IMPORT_DOCTYPE, resume_import, run_import
+
+CHECKPOINT = "test_import_commit"
+
+
+class TestResumableImport(FrappeTestCase):
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_resume_after_failed_chunk(self):
+		remark = frappe.generate_hash()
+		lines = [json.dumps(make_journal_entry(remark)) for _i in range(5)]
+		lines[3] = "{not json"
+		data_import = make_import(lines, chunk_size=2)
+
+		import_chunk = imports._import_chunk
+
+		def fail_second_chunk(import_type, chunk):
+			results = import_chunk(import_type, chunk)
+			if chunk[0][0] == 3:
+				raise Exception("Worker lost")
+			return results
+
+		with commits_as_savepoints(), patch.object(imports, "_import_chunk", fail_second_chunk):
+			run_import(data_import.name)
+
+		data_import.reload()
+		self.assertEqual(data_import.status, "Failed")
+		self.assertEqual(data_import.lines_processed, 2)
+		self.assertEqual(data_import.documents_imported, 2)
+		# the entries of the failed chunk were rolled back with it
+		self.assertEqual(frappe.db.count("Journal Entry", {"user_remark": remark}), 2)
+
+		resume_import(data_import.name)
+		with commits_as_savepoints():
+			run_import(data_import.name)
+
+		data_import.reload()
+		self.assertEqual(data_import.status, "Completed")
+		self.assertEqual(data_import.lines_processed, 5)
+		self.assertEqual(data_import.documents_imported, 4)
+		self.assertEqual(data_import.documents_failed, 1)
+		self.assertEqual([row.line for row in data_import.failures], [4])
+		self.assertEqual(frappe.db.count("Journal Entry", {"user_remark": remark, "docstatus": 1}), 4)
+
+
+def commits_as_savepoints():
+	"""Turn the import's commits into savepoints, so the test's rollback still undoes everything"""
+	rollback = frappe.db.rollback
+
+	def rollback_to_checkpoint(save_point=None, **kwargs):
+		rollback(save_point=save_point or CHECKPOINT)
+
+	frappe.db.savepoint(CHECKPOINT)
+	# patched on the Database object, frappe.db is only a proxy to it
+	return patch.multiple(
+		frappe.local.db,
+		commit=lambda: frappe.db.savepoint(CHECKPOINT),
+		rollback=rollback_to_checkpoint,
+	)
+
+
+def make_journal_entry(remark):
+	return {
+		"company": "_Test Company",
+		"user_remark": remark,
+		"accounts": [
+			{"account": "_Test Bank - _TC", "debit_in_account_currency": 10},
+			{"account": "Cash - _TC", "credit_in_account_currency": 10},
+		],
+	}
+
+
+def make_import(lines, chunk_size):
+	file = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": f"{frappe.generate_hash(length=10)}.jsonl",
+			"content": "\n".join(lines),
+			"is_private": 1,
+		}
+	).insert()
+
+	data_import = frappe.new_doc(IMPORT_DOCTYPE)
+	data_import.import_type = "Journal Entry"
+	data_import.import_file = file.file_url
+	data_import.chunk_size = chunk_size
+	data_import.insert()
+	return data_import
@@ -0,0 +1,106 @@
+# Copyright (c) 2026, itsyosefali and Contributors
+# See license.txt
+
+import frappe
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, getdate, nowdate
+
+from marka_account_integration.matching import PaymentMatcher
+
+TEST_CUSTOMER = "_Test Merka Matching Customer"
+
+
+class TestPaymentMatcher(FrappeTestCase):
+	def setUp(self):
+		if not frappe.db.exists("Customer", TEST_CUSTOMER):
+			frappe.get_doc(
+				{
+					"doctype": "Customer",
+					"customer_name": TEST_CUSTOMER,
+					"customer_group": "_Test Customer Group",
+					"territory": "_Test Territory",
+				}
+			).insert()
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_allocation_order(self):
+		oldest = make_invoice(100, days_ago=3)
+		exact = make_invoice(250, days_ago=2)
+		referenced = make_invoice(300, days_ago=1, po_no="PO-MATCH-1")
+		matcher = get_matcher()
+
+		self.assertEqual(matcher.match(TEST_CUSTOMER, 250), ("exact", [reference(exact, 250, 250)]))
+		self.assertEqual(
+			matcher.match(TEST_CUSTOMER, 50, reference_no=" po-match-1 "),
+			("reference", [reference(referenced, 300, 50)]),
+		)
+
+		# the referenced invoice is no longer untouched, so 300 matches no single invoice
+		self.assertEqual(
+			matcher.match(TEST_CUSTOMER, 300),
+			("oldest_first", [reference(oldest, 100, 100), reference(referenced, 250, 200)]),
+		)
+		self.assertEqual(matcher.match(TEST_CUSTOMER, 100), ("oldest_first", [reference(referenced, 50, 50)]))
+		self.assertEqual(matcher.match(TEST_CUSTOMER, 100), (None, []))
+
+	def test_near_exact_within_tolerance(self):
+		lower = make_invoice(100, days_ago=2)
+		closer = make_invoice(100.04, days_ago=1)
+		matcher = get_matcher(tolerance=0.05)
+
+		self.assertEqual(
+			matcher.match(TEST_CUSTOMER, 100.03), ("near_exact", [reference(closer, 100.04, 100.03)])
+		)
+		# the leftover of a near-exact match is a difference, it does not pay other invoices
+		self.assertEqual(matcher.match(TEST_CUSTOMER, 100.03), ("near_exact", [reference(lower, 100, 100)]))
+
+	def test_outside_tolerance_settles_oldest_first(self):
+		oldest = make_invoice(100, days_ago=2)
+		make_invoice(100.1, days_ago=1)
+		matcher = get_matcher(tolerance=0.05)
+
+		self.assertEqual(matcher.match(TEST_CUSTOMER, 99.9), ("oldest_first", [reference(oldest, 100, 99.9)]))
+
+	def test_release_gives_allocation_back(self):
+		invoice = make_invoice(250, days_ago=1)
+		matcher = get_matcher()
+
+		match_type, references = matcher.match(TEST_CUSTOMER, 250)
+		self.assertEqual(match_type, "exact")
+
+		matcher.release(TEST_CUSTOMER, references)
+		self.assertEqual(matcher.match(TEST_CUSTOMER, 250), ("exact", [reference(invoice, 250, 250)]))
+
+
+def get_matcher(tolerance=0):
+	return PaymentMatcher("_Test Company", "Customer", [TEST_CUSTOMER], tolerance)
+
+
+def make_invoice(rate, days_ago, po_no=None):
+	invoice = create_sales_invoice(
+		customer=TEST_CUSTOMER,
+		rate=rate,
+		posting_date=add_days(nowdate(), -days_ago),
+		set_posting_time=1,
+		do_not_submit=True,
+	)
+	# outstanding follows the rounded total otherwise, which hides the near-exact amounts
+	invoice.disable_rounded_total = 1
+	invoice.po_no = po_no
+	invoice.save()
+	invoice.submit()
+	return invoice
+
+
+def reference(invoice, outstanding, allocated):
+	return {
+		"reference_doctype": "Sales Invoice",
+		"reference_name": invoice.name,
+		"due_date": getdate(invoice.due_date),
+		"total_amount": invoice.grand_total,
+		"outstanding_amount": outstanding,
+		"allocated_amount": allocated,
+	}
@@ -0,0 +1,50 @@
+# Copyright (c) 2026, itsyosefali and Contributors
+# See license.txt
+
+import frappe
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import now_datetime
+
+from marka_account_integration.queries import list_documents
+
+
+class TestListDocuments(FrappeTestCase):
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_cursor_pages_through_equal_modified(self):
+		names = [create_sales_invoice(rate=100).name for _i in range(5)]
+		# rows sharing a timestamp are only told apart by name
+		frappe.db.sql(
+			"update `tabSales Invoice` set modified = %s where name in %s",
+			(now_datetime(), tuple(names)),
+		)
+
+		seen, cursor = [], None
+		while True:
+			page = list_documents(
+				"Sales Invoice",
+				filters={"name": ["in", names]},
+				fields=["name"],
+				page_length=2,
+				cursor=cursor,
+			)
+			seen += [row.name for row in page["data"]]
+			cursor = page["next_cursor"]
+			if not cursor:
+				break
+
+		self.assertEqual(seen, sorted(names, reverse=True))
+
+	def test_comma_separated_fields(self):
+		name = create_sales_invoice(rate=100).name
+
+		page = list_documents("Sales Invoice", filters={"name": name}, fields="name, grand_total")
+
+		self.assertEqual(list(page["data"][0]), ["name", "grand_total"])
+		self.assertIsNone(page["next_cursor"])
+
+	def test_child_table_is_not_a_list_field(self):
+		with self.assertRaises(frappe.ValidationError):
+			list_documents("Sales Invoice", fields=["name", "items"])
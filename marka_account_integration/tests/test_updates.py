@@ -0,0 +1,35 @@
+# Copyright (c) 2026, itsyosefali and Contributors
+# See license.txt
+
+import frappe
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from frappe.tests.utils import FrappeTestCase
+
+from marka_account_integration.updates import update_document
+
+
+class TestUpdateDocument(FrappeTestCase):
+	def test_failed_amendment_keeps_original_submitted(self):
+		invoice = create_sales_invoice()
+		gl_entries = frappe.db.count("GL Entry", {"voucher_no": invoice.name, "is_cancelled": 0})
+
+		# the customer is not allowed on submit, so this takes the cancel and amend path
+		with self.assertRaises(frappe.LinkValidationError):
+			update_document("Sales Invoice", invoice.name, {"customer": "_Test Customer Does Not Exist"})
+
+		self.assertEqual(frappe.db.get_value("Sales Invoice", invoice.name, "docstatus"), 1)
+		self.assertFalse(frappe.db.exists("Sales Invoice", {"amended_from": invoice.name}))
+		self.assertEqual(
+			frappe.db.count("GL Entry", {"voucher_no": invoice.name, "is_cancelled": 0}), gl_entries
+		)
+
+	def test_changed_items_are_amended(self):
+		invoice = create_sales_invoice()
+		items = [{**invoice.items[0].as_dict(no_default_fields=True), "qty": 2}]
+
+		doc, update_path = update_document("Sales Invoice", invoice.name, {"items": items})
+
+		self.assertEqual(update_path, "amended")
+		self.assertEqual(doc.amended_from, invoice.name)
+		self.assertEqual([row.qty for row in doc.items], [2])
+		self.assertEqual(frappe.db.get_value("Sales Invoice", invoice.name, "docstatus"), 2)
@@ -0,0 +1,117 @@
+import frappe
+from frappe import _
+
+SAVEPOINT = "marka_update_document"
+
+
+def update_document(doctype, name, values, child_tables=None):
+	"""
+	Apply incoming values to a document through the cheapest correct path
+
+	Only fields whose value actually differs are applied. On a submitted document,
+	changes limited to fields that are allowed on submit are saved in place, which
+	leaves the ledger alone. Anything else cancels the document and submits an
+	amendment carrying just those changes.
+
+	Args:
+		doctype (str): DocType of the document
+		name (str): Document name
+		values (dict): Incoming field values, unknown keys are ignored. Child tables
+			given here replace all their rows, as with child_tables.
+		child_tables (dict, optional): Child table fieldname to its complete new rows
+
+	Returns:
+		tuple: The resulting document and the path taken, one of
+			"unchanged", "draft", "in_place" or "amended"
+	"""
+	doc = frappe.get_doc(doctype, name)
+	changes = get_changes(doc, values)
+
+	child_tables = dict(child_tables or {})
+	for df in doc.meta.get_table_fields():
+		if values.get(df.fieldname) is not None and df.fieldname not in child_tables:
+			child_tables[df.fieldname] = frappe.parse_json(values[df.fieldname]) or []
+
+	changed_tables = {
+		fieldname: rows
+		for fieldname, rows in child_tables.items()
+		if _child_rows_changed(doc, fieldname, rows)
+	}
+
+	if doc.docstatus == 2:
+		frappe.throw(_("Cancelled {0} {1} cannot be updated").format(_(doctype), name))
+
+	if not changes and not changed_tables:
+		return doc, "unchanged"
+
+	if doc.docstatus == 0:
+		_apply(doc, changes, changed_tables)
+		doc.save()
+		doc.submit()
+		return doc, "draft"
+
+	if not changed_tables and all(doc.meta.get_field(fieldname).allow_on_submit for fieldname in changes):
+		_apply(doc, changes)
+		doc.save()
+		return doc, "in_place"
+
+	# the callers report failures instead of raising, so the request still commits,
+	# a failing amendment must not leave the original cancelled without a replacement
+	frappe.db.savepoint(SAVEPOINT)
+	try:
+		doc.cancel()
+
+		amended = frappe.copy_doc(doc)
+		amended.amended_from = doc.name
+		amended.docstatus = 0
+		_apply(amended, changes, changed_tables)
+		amended.insert()
+		amended.submit()
+	except Exception:
+		frappe.db.rollback(save_point=SAVEPOINT)
+		raise
+
+	frappe.db.release_savepoint(SAVEPOINT)
+	return amended, "amended"
+
+
+def get_changes(doc, values):
+	"""Return the fields of `values` whose value differs from the document, child tables aside"""
+	changes = {}
+
+	for fieldname, value in values.items():
+		df = doc.meta.get_field(fieldname)
+		if not df or df.fieldtype in frappe.model.table_fields:
+			continue
+
+		if doc.cast(doc.get(fieldname), df) != doc.cast(value, df):
+			changes[fieldname] = value
+
+	return changes
+
+
+def _child_rows_changed(doc, fieldname, rows):
+	current = doc.get(fieldname) or []
+	if len(current) != len(rows):
+		return True
+
+	for row, new_row in zip(current, rows, strict=True):
+		for key, value in new_row.items():
+			# unset keys keep whatever default the current row got
+			if value is None:
+				continue
+
+			df = row.meta.get_field(key)
+			if df and row.cast(row.get(key), df) != row.cast(value, df):
+				return True
+
+	return False
+
+
+def _apply(doc, changes, child_tables=None):
+	doc.update(changes)
+
+	for fieldname, rows in (child_tables or {}).items():
+		doc.set(fieldname, [])
+		for row in rows:
+			doc.append(fieldname, row)
@@ -0,0 +1,70 @@
+import inspect
+
+import frappe
+from frappe.utils import cint
+
+
+def accept_arguments(wrapper, fn, *names):
+	"""
+	Let Frappe hand extra request arguments to a decorated endpoint
+
+	frappe.call drops every argument that is not in the signature of the whitelisted
+	function. Endpoints taking **kwargs already receive everything, the others get
+	`names` appended to the argument list Frappe checks against.
+	"""
+	parameters = inspect.signature(fn).parameters
+	if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()):
+		return
+
+	wrapper.fnargs = [*getattr(fn, "fnargs", parameters), *names]
+
+
+def bind_arguments(fn, args, kwargs):
+	"""Return the call as keyword arguments only, so it can be serialized or replayed"""
+	if not args:
+		return dict(kwargs)
+
+	bound = inspect.signature(fn).bind_partial(*args)
+	return {**bound.arguments, **kwargs}
+
+
+def get_permission_conditions(doctype, fieldnames=None, alias=None):
+	"""
+	Return the where conditions and values restricting raw queries on doctype to
+	the current user's User Permissions, e.g. on Company, Account or Cost Center
+
+	These are the restrictions frappe.get_list would apply, for queries that bypass it.
+	`fieldnames` limits them to some link fields of doctype, and `alias` qualifies the
+	columns for queries reading those fields from another table with the same column names.
+	"""
+	user_permissions = frappe.permissions.get_user_permissions()
+	if not user_permissions:
+		return [], {}
+
+	strict = cint(frappe.get_system_settings("apply_strict_user_permissions"))
+	conditions, values = [], {}
+
+	for df in frappe.get_meta(doctype).get_link_fields():
+		if df.ignore_user_permissions or df.options not in user_permissions:
+			continue
+		if fieldnames and df.fieldname not in fieldnames:
+			continue
+
+		permitted = [
+			permission.get("doc")
+			for permission in user_permissions[df.options]
+			if not permission.get("applicable_for") or permission.get("applicable_for") == doctype
+		]
+		if not permitted:
+			continue
+
+		key = f"permitted_{df.fieldname}"
+		column = f"{alias}.{df.fieldname}" if alias else df.fieldname
+		condition = f"{column} in %({key})s"
+		if not strict:
+			condition = f"({condition} or ifnull({column}, '') = '')"
+
+		conditions.append(condition)
+		values[key] = tuple(permitted)
+
+	return conditions, values